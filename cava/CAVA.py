@@ -22,6 +22,52 @@ parser.add_option('-s', "--stdout", default=False, dest='stdout', action='store_
                   help="Write output to standard output [default value: %default]")
 parser.add_option('-t', "--threads", default=1, dest='threads', action='store',
                   help="Number of threads [default value: %default]")
+parser.add_option("--stream", default=False, dest='stream', action='store_true',
+                  help="Stream input lines through the annotation processes and write output in order while running "
+                       "(used automatically for standard input '-i -' and for '-s' with several threads) "
+                       "[default value: %default]")
+parser.add_option("--balance", default='cost', dest='balance', action='store', type='choice',
+                  choices=['cost', 'records'],
+                  help="Balance work units by estimated annotation cost (indels cost more than SNVs) or by number of "
+                       "records (cost or records) [default value: %default]")
+parser.add_option('-p', "--preload", default=False, dest='preload', action='store_true',
+                  help="Load the reference genome, Ensembl and dbSNP databases and the transcript indexes of all "
+                       "chromosomes once, and share them with all processes [default value: %default]")
+parser.add_option('-r', "--regions", default=None, dest='regions', action='store', type='int',
+                  help="Split bgzipped, tabix-indexed input into genomic regions of the given size (in bp, 0 for whole "
+                       "chromosomes) fetched by the processes, without scanning the input file; output is in "
+                       "coordinate order [default value: %default]")
+parser.add_option("--checkpoint", default=False, dest='checkpoint', action='store_true',
+                  help="Write checkpoints of the progress of every work unit (always done with more than one thread), "
+                       "so an interrupted run can be continued with --resume [default value: %default]")
+parser.add_option("--resume", default=False, dest='resume', action='store_true',
+                  help="Continue an interrupted run with the same input and output from its checkpoints, reusing "
+                       "finished work units [default value: %default]")
+parser.add_option("--plan", default=None, dest='plan', action='store', type='int',
+                  help="Cluster execution: split the input into the given number of shards (or into genomic regions, "
+                       "with -r) and write the shard manifest to <output>.manifest.json, without annotating "
+                       "[default value: %default]")
+parser.add_option("--manifest", default=None, dest='manifest', action='store',
+                  help="Cluster execution: shard manifest written by --plan, used by --shard and --merge "
+                       "[default value: %default]")
+parser.add_option("--shard", default=None, dest='shard', action='store', type='int',
+                  help="Cluster execution: annotate only the given shard of the manifest (numbered from 1), writing "
+                       "<output>_shard_<N> without header [default value: %default]")
+parser.add_option("--merge", default=False, dest='merge', action='store_true',
+                  help="Cluster execution: check that all shards of the manifest are complete and merge them in order "
+                       "into the output file [default value: %default]")
+parser.add_option("--serve", default=None, dest='serve', action='store',
+                  help="Run as an annotation server on the given address (host:port or port for HTTP over TCP, a file "
+                       "path containing '/' or unix:path for HTTP over a Unix socket), keeping the databases loaded; input lines POSTed to "
+                       "/annotate are answered with the annotated lines, using -t annotation processes "
+                       "[default value: %default]")
+parser.add_option("--proteindb", default=False, dest='proteindb', action='store_true',
+                  help="Precompute the reference protein and exon sequences of all transcripts of the @ensembl database "
+                       "on the @reference genome into <database>.prot.gz (used automatically when present) and exit, "
+                       "without annotating [default value: %default]")
+parser.add_option('-x', "--index", default=False, dest='index', action='store_true',
+                  help="Save the pre-scan of the input file (header, number of records and shard offsets) to a sidecar "
+                       "index next to it, and reuse it on re-runs [default value: %default]")
 (copts, args) = parser.parse_args()
 
 main.run(copts, version)
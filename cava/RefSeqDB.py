@@ -22,6 +22,8 @@ parser.add_option('-n', "--nm-only", default=False, dest='nm_only', action='stor
 parser.add_option('-D', "--outdir", dest='output_dir', action='store', default='data', help="Output directory")
 parser.add_option('-r', "--release", default=None, dest='refseq', action='store', help="RefSeq release version")
 parser.add_option("--no_hg19",  action='store_false', default=True, dest='no_hg19', help="Set this to skip hg19 builds")
+parser.add_option("--compile", default=False, dest='compile', action='store_true',
+                  help="Also write a compiled, memory-mappable companion of the transcript database (.gz.cdb)")
 
 (options, args) = parser.parse_args()
 
@@ -7,8 +7,8 @@ sys.path.insert(0, path.dirname(path.realpath(__file__)) + '/pysamdir')
 import pysam
 
 
-# Use Tabix to index the custom database file
-def indexFile(input_file):
+# Use Tabix to index the custom database file (and compile it, if required)
+def indexFile(input_file, compile=False):
     sys.stdout.write('Compressing file... ')
     sys.stdout.flush()
     pysam.tabix_compress(input_file, input_file + '.gz', force=True)
@@ -17,6 +17,12 @@ def indexFile(input_file):
     sys.stdout.flush()
     pysam.tabix_index(input_file + '.gz', seq_col=4, start_col=6, end_col=7, meta_char='#', force=True)
     sys.stdout.write('OK\n')
+    if compile:
+        from cava.utils import compileddb
+        sys.stdout.write('Compiling output file... ')
+        sys.stdout.flush()
+        compileddb.compileDB(input_file + '.gz')
+        sys.stdout.write('OK\n')
 
 
 if __name__ == '__main__':
@@ -46,10 +52,12 @@ if __name__ == '__main__':
      exons continue
          '''))
     parser.add_argument('-i', dest='input_file', required='true', help='path to the input file')
+    parser.add_argument('--compile', dest='compile', action='store_true',
+                        help='also write a compiled, memory-mappable companion of the database (.gz.cdb)')
     args = parser.parse_args()
 
     if not path.isfile(args.input_file):
         print
         "This does not appear to be a file"
 
-    indexFile(path.abspath(args.input_file))
+    indexFile(path.abspath(args.input_file), args.compile)
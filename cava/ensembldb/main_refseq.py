@@ -14,6 +14,7 @@ requests.packages.urllib3.disable_warnings()
 import pysam
 from cmmodule.utils import read_chain_file
 from cmmodule.mapgff import crossmap_gff_file
+from cava.utils import compileddb
 
 failed_conversions = dict()
 failed_conversions['GENE'] = set()
@@ -659,6 +660,11 @@ def indexFile(f, options):
     pysam.tabix_index(os.path.join(options.output_dir, f + '.gz'), seq_col=4, start_col=6, end_col=7, meta_char='#',
                       force=True)
     sys.stdout.write('OK\n')
+    if options.compile:
+        sys.stdout.write(f'Compiling output file {f}... ')
+        sys.stdout.flush()
+        compileddb.compileDB(os.path.join(options.output_dir, f + '.gz'))
+        sys.stdout.write('OK\n')
 
 
 # CHeck if string is a number (integer)
@@ -704,6 +710,8 @@ def run(options):
     print('---------------------')
     print(options.output + '.gz (transcript database)')
     print(options.output + '.gz.tbi (index file)')
+    if options.compile:
+        print(options.output + '.gz.cdb (compiled transcript database)')
     print(options.output + '.txt (list of transcripts)')
 
     if ens_lifted:
@@ -717,6 +725,8 @@ def run(options):
         print('---------------------')
         print(options.output + '.hg19_converted' + '.gz (transcript database)')
         print(options.output + '.hg19_converted' + '.gz.tbi (index file)')
+        if options.compile:
+            print(options.output + '.hg19_converted' + '.gz.cdb (compiled transcript database)')
         print(options.output + '.hg19_converted' + '.txt (list of transcripts)')
         os.remove(os.path.join(options.output_dir, options.output + '.hg19_converted'))
 
@@ -13,6 +13,7 @@ requests.packages.urllib3.disable_warnings()
 import pysam
 from cmmodule.utils import read_chain_file
 from cmmodule.mapgff import crossmap_gff_file
+from cava.utils import compileddb
 
 failed_conversions = dict()
 failed_conversions['GENE'] = set()
@@ -545,8 +546,8 @@ def process_data(options):
     return enst_records, ref_records, ref_records_hg19, enst_records_hg19
 
 
-# Use Tabix to index output file
-def indexFile(f):
+# Use Tabix to index output file (and compile it, if required)
+def indexFile(f, compile=False):
     sys.stdout.write(f'Compressing output file {f}... ')
     sys.stdout.flush()
     assert os.path.exists(f), f"{f} does not exist"
@@ -558,6 +559,11 @@ def indexFile(f):
     sys.stdout.flush()
     pysam.tabix_index(f + '.gz', seq_col=4, start_col=6, end_col=7, meta_char='#', force=True)
     sys.stdout.write('OK\n')
+    if compile:
+        sys.stdout.write(f'Compiling output file {f}.gz... ')
+        sys.stdout.flush()
+        compileddb.compileDB(f + '.gz')
+        sys.stdout.write('OK\n')
 
 
 # CHeck if string is a number (integer)
@@ -710,7 +716,7 @@ def report_summary(enst_parsed, options, hg19=False, enst=True):
         print('A total of ' + str(enst_parsed) + ' transcripts have been retrieved\n')
         # Indexing output file with Tabix
         outfile = full_name + '.db'
-        indexFile(outfile)
+        indexFile(outfile, options.compile)
         """
         # Printing out summary information
         print('')
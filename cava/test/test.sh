@@ -15,6 +15,45 @@ python3 -m unittest test/test_end2end.py
 echo "Running unit tests for Variant"
 python3 -m unittest test/test_csn.py
 
+echo "Running unit tests for input sharding"
+python3 -m unittest test/test_main.py
+
+echo "Running unit tests for checkpoints"
+python3 -m unittest test/test_checkpoint.py
+
+echo "Running unit tests for shard manifests"
+python3 -m unittest test/test_manifest.py
+
+echo "Running unit tests for the annotation server"
+python3 -m unittest test/test_server.py
+
+echo "Running unit tests for the annotation API"
+python3 -m unittest test/test_annotator.py
+
+echo "Running unit tests for the transcript index"
+python3 -m unittest test/test_ncls.py
+
+echo "Running unit tests for the compiled transcript database"
+python3 -m unittest test/test_compileddb.py
+
+echo "Running unit tests for the LRU caches"
+python3 -m unittest test/test_lrucache.py
+
+echo "Running unit tests for the precomputed reference sequences"
+python3 -m unittest test/test_proteindb.py
+
+echo "Running unit tests for the translation of the mutant proteins"
+python3 -m unittest test/test_translation.py
+
+echo "Running unit tests for the reference sequence cache"
+python3 -m unittest test/test_reference.py
+
+echo "Running unit tests for the contig name tables"
+python3 -m unittest test/test_contigs.py
+
+echo "Running unit tests for the normalization of indels"
+python3 -m unittest test/test_normalization.py
+
 # Set up
 #
 # Download common variants to test 1% of all common variants as a robustness test.
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import unittest
+
+from cava.utils import annotator
+from cava.utils import core
+
+
+class TestAnnotatorInput(unittest.TestCase):
+
+    def test_variantToLine(self):
+        # Input lines are used as they are
+        self.assertEqual('1\t10\trs1\tA\tC\t50\tPASS\t.', annotator.variantToLine('1\t10\trs1\tA\tC\t50\tPASS\t.\n', 'VCF'))
+        self.assertEqual('1\t10\t.\tA\tC\t.\tPASS\t.', annotator.variantToLine(('1', 10, 'A', 'C'), 'VCF'))
+        self.assertEqual('1\t10\trs1\tA\tC\t.\tPASS\t.', annotator.variantToLine(('1', 10, 'A', 'C', 'rs1'), 'VCF'))
+        self.assertEqual('rs1\t1\t10\tA\tC',
+                         annotator.variantToLine({'chrom': '1', 'pos': 10, 'ref': 'A', 'alt': 'C', 'id': 'rs1'}, 'TXT'))
+        self.assertEqual('.\tX\t5\tAT\tA', annotator.variantToLine({'chrom': 'X', 'pos': 5, 'ref': 'AT', 'alt': 'A'}, 'TXT'))
+
+    def test_readImpactDef(self):
+        class Options(object):
+            def __init__(self, impactdef):
+                self.args = {'impactdef': impactdef}
+
+        impactdir = annotator.readImpactDef(Options('SG,ESS, FS | SS5,IM | SY'))
+        self.assertEqual({'SG': '1', 'ESS': '1', 'FS': '1', 'SS5': '2', 'IM': '2', 'SY': '3'}, impactdir)
+        self.assertIsNone(annotator.readImpactDef(Options('.')))
+        self.assertIsNone(annotator.readImpactDef(Options('')))
+
+    def test_checkRecordLine(self):
+        self.assertIsNone(annotator.checkRecordLine('1\t10\t.\tA\tC\t.\tPASS\t.', 'VCF'))
+        self.assertIsNone(annotator.checkRecordLine('id1\t1\t10\tA\tC', 'TXT'))
+        self.assertIn('position', annotator.checkRecordLine('1\tx10\t.\tA\tC\t.\tPASS', 'VCF'))
+        self.assertIn('columns', annotator.checkRecordLine('1\t10\t.\tA', 'VCF'))
+        self.assertIn('columns', annotator.checkRecordLine('1\t10\t.\tA\tC', 'VCF'))
+        self.assertIn('columns', annotator.checkRecordLine('id1\t1\t10\tA', 'TXT'))
+
+    def test_malformed_variant(self):
+        # Malformed variants raise ValueError instead of stopping the process
+        class Options(object):
+            args = {'inputformat': 'VCF'}
+
+        annot = annotator.Annotator.__new__(annotator.Annotator)
+        annot.options = Options()
+        with self.assertRaises(ValueError):
+            next(annot.annotate(['garbage line']))
+        with self.assertRaises(ValueError):
+            next(annot.annotate([('1', 'x10', 'A', 'C')]))
+        with self.assertRaises(ValueError):
+            annot.annotateLine('1\t10\t.\tA\tC')
+
+    def test_transcriptHGVS_warning(self):
+        # Warnings go to standard error, not to the standard output of the caller
+        class Options(object):
+            args = {'logfile': False}
+            transcript2protein = {'NM_1.1': 'NP_1.1'}
+
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            self.assertEqual(('1(NM_1.1):c.1A>G', 'NP_1.1:p.(Met1Val)'),
+                             core.transcriptHGVS('1', 'NM_1.1', 'c.1A>G_p.Met1Val', Options()))
+            self.assertEqual(('1(NM_2.1):c.1A>G', '.'), core.transcriptHGVS('1', 'NM_2.1', 'c.1A>G_p.Met1Val', Options()))
+        self.assertEqual('', out.getvalue())
+        self.assertIn('NM_2.1', err.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
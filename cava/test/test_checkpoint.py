@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cava.utils import checkpoint
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input = os.path.join(self.tmpdir, 'input.vcf')
+        with open(self.input, 'w') as f:
+            f.write('#CHROM\tPOS\tID\tREF\tALT\n1\t10\t.\tA\tC\n')
+        self.output = os.path.join(self.tmpdir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan(self):
+        units = [[0, 100], [100, '']]
+        checkpoint.writePlan(self.output, self.input, 'TEXT', 'VCF', ['#CHROM'], 1, units)
+        plan = checkpoint.readPlan(self.output, self.input, 'VCF')
+        self.assertEqual(units, plan['units'])
+        self.assertEqual('TEXT', plan['mode'])
+        # Plans of runs with other output format or input file are not used
+        self.assertIsNone(checkpoint.readPlan(self.output, self.input, 'TSV'))
+        with open(self.input, 'a') as f:
+            f.write('1\t20\t.\tA\tC\n')
+        self.assertIsNone(checkpoint.readPlan(self.output, self.input, 'VCF'))
+
+    def test_resumeUnit(self):
+        fn = checkpoint.tmpFileName(self.output, 'VCF', 3)
+        with open(fn, 'w') as f:
+            f.write('record1\nrecord2\n')
+        self.assertIsNone(checkpoint.resumeUnit(self.output, 'VCF', 3))
+        checkpoint.writeCheckpoint(self.output, 3, [8, ''], 8, 1, False)
+        # Records written after the checkpoint are dropped
+        with open(fn, 'a') as f:
+            f.write('record3 (partial')
+        ckpt = checkpoint.resumeUnit(self.output, 'VCF', 3)
+        self.assertEqual([8, ''], ckpt['rest'])
+        self.assertEqual(1, ckpt['records'])
+        with open(fn) as f:
+            self.assertEqual('record1\n', f.read())
+
+    def test_removeCheckpoints(self):
+        checkpoint.writePlan(self.output, self.input, 'TEXT', 'VCF', [], 1, [[0, '']])
+        checkpoint.writeCheckpoint(self.output, 1, [0, ''], 0, 0, True)
+        checkpoint.removeCheckpoints(self.output)
+        self.assertEqual(['input.vcf'], os.listdir(self.tmpdir))
+
+
+if __name__ == '__main__':
+    unittest.main()
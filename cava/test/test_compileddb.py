@@ -0,0 +1,84 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from cava.utils import compileddb
+from cava.utils import core
+
+LINES = ['NM_1.1\tGENEA\tGENEA\t+/6168bp/3/2618bp/326\t1\t1\t65418\t71585\t61\t65565\t70008\t65418\t65433\t65519\t65573\t69036\t71585',
+         'NM_2.1\tGENEB\tGENEB\t-/940bp/1/939bp/312\t1\t-1\t450739\t451678\t1\t451678\t450740\t450739\t451678',
+         'NM_3.2\tGENEC\tGENEC\t-/940bp/1/939bp/312\tX\t-1\t685715\t686654\t1\t686654\t685716\t685715\t686654']
+
+
+class TestCompiledDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, 'db.gz')
+        with gzip.open(self.dbfile, 'wt') as f:
+            f.write('#header\n' + '\n'.join(LINES) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_transcripts(self):
+        self.assertEqual(3, compileddb.compileDB(self.dbfile))
+        compiled = compileddb.openCompiled(self.dbfile)
+        self.assertEqual(3, len(compiled))
+        self.assertEqual([(65418, 71585, 0), (450739, 451678, 1)], compiled.intervals('1'))
+        self.assertEqual([], compiled.intervals('2'))
+        self.assertEqual('NM_3.2', compiled.transcriptID(2))
+        # Transcripts built from the compiled database are the same as those parsed from the database lines
+        for i in range(3):
+            transcript = core.Transcript()
+            transcript.setFields(*compiled.fields(i))
+            expected = core.Transcript(LINES[i])
+            self.assertEqual([(e.index, e.start, e.end) for e in expected.exons],
+                             [(e.index, e.start, e.end) for e in transcript.exons])
+            del expected.exons, transcript.exons
+            self.assertEqual(vars(expected), vars(transcript))
+
+    def test_outdated(self):
+        self.assertIsNone(compileddb.openCompiled(self.dbfile))
+        compileddb.compileDB(self.dbfile)
+        with gzip.open(self.dbfile, 'at') as f:
+            f.write(LINES[0] + '\n')
+        # The compiled database does not match the changed database file any more
+        self.assertIsNone(compileddb.openCompiled(self.dbfile))
+
+    def test_lists(self):
+        # A slim compiled file is written for gene and transcript lists, keyed by the lists
+        self.assertIsNone(compileddb.listKey(set(), set()))
+        key = compileddb.listKey({'GENEB', 'GENEC'}, set())
+        self.assertEqual(key, compileddb.listKey({'GENEC', 'GENEB'}, set()))
+        self.assertNotEqual(key, compileddb.listKey(set(), {'GENEB', 'GENEC'}))
+        compiled = compileddb.openCompiled(self.dbfile, {'GENEB', 'GENEC'}, set())
+        self.assertTrue(os.path.isfile(compileddb.compiledFileName(self.dbfile, key)))
+        self.assertEqual(2, len(compiled))
+        self.assertEqual([(450739, 451678, 0)], compiled.intervals('1'))
+        self.assertEqual('NM_3.2', compiled.transcriptID(1))
+        compiled = compileddb.openCompiled(self.dbfile, {'GENEB', 'GENEC'}, {'NM_3.2'})
+        self.assertEqual(1, len(compiled))
+        # The full compiled file is not written
+        self.assertIsNone(compileddb.openCompiled(self.dbfile))
+        # The slim file is written again when the database changes
+        with gzip.open(self.dbfile, 'at') as f:
+            f.write(LINES[1].replace('NM_2.1', 'NM_4.1') + '\n')
+        self.assertEqual(3, len(compileddb.openCompiled(self.dbfile, {'GENEB', 'GENEC'}, set())))
+
+    def test_prepare(self):
+        # Annotation processes only open the slim compiled file, it is written once by prepareCompiled
+        key = compileddb.listKey({'GENEB'}, set())
+        self.assertIsNone(compileddb.openCompiled(self.dbfile, {'GENEB'}, set(), build=False))
+        self.assertFalse(os.path.isfile(compileddb.compiledFileName(self.dbfile, key)))
+        compileddb.prepareCompiled(self.dbfile, {'GENEB'}, set())
+        self.assertEqual(1, len(compileddb.openCompiled(self.dbfile, {'GENEB'}, set(), build=False)))
+        # Nothing is written without lists
+        compileddb.prepareCompiled(self.dbfile, set(), set())
+        self.assertFalse(os.path.isfile(compileddb.compiledFileName(self.dbfile)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from cava.utils import core
+from cava.utils import data
+
+
+class TestContigRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = core.ContigRegistry()
+
+    def test_intern(self):
+        ids = [self.registry.intern(chrom) for chrom in ['1', 'chr1', 'X', '1']]
+        self.assertEqual(ids[0], ids[3])
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(self.registry.names[ids[1]], 'chr1')
+
+    def test_table(self):
+        calls = []
+
+        def getcontigs():
+            calls.append(1)
+            return ['chr1', 'chrX', 'chrM']
+
+        table = self.registry.table(('reference', 'genome.fa'), getcontigs)
+        self.assertIs(table, self.registry.table(('reference', 'genome.fa'), getcontigs))
+        self.assertEqual(len(calls), 0)
+        self.assertEqual(table.resolve('1'), 'chr1')
+        self.assertEqual(table.resolve('MT'), 'chrM')
+        self.assertEqual(len(calls), 1)
+
+    def test_resolve(self):
+        # Names resolved by the table must be those of convert_chrom for every alias
+        for contigs in [['chr1', 'chrX', 'chrM'], ['1', 'X', 'MT'], ['1', 'X', 'M']]:
+            table = self.registry.table(tuple(contigs), lambda: contigs)
+            for chrom in ['1', 'chr1', 'X', 'chrX', 'M', 'MT', 'chrM', 'chrMT', '2', 'GL000220.1']:
+                expected = core.convert_chrom(chrom, contigs)
+                self.assertEqual(table.resolve(chrom), expected)
+                self.assertEqual(table.name(self.registry.intern(chrom)), expected)
+
+    def test_variant(self):
+        variant = core.Variant('chr7', 117199644, 'ATCT', 'A')
+        self.assertEqual(core.CONTIGS.names[variant.contigid], 'chr7')
+        self.assertEqual(variant.contigid, core.Variant('chr7', 1, 'A', 'C').contigid)
+
+    def test_target(self):
+        # The contig table of the target BED file is set up once, when the file is opened
+        class Options(object):
+            args = dict()
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            bed = os.path.join(tmpdir, 'target.bed')
+            with open(bed, 'w') as f:
+                f.write('chr1\t100\t200\n')
+            Options.args['target'] = pysam.tabix_index(bed, preset='bed')
+            target = data.TargetBED(Options())
+            self.assertEqual('chr1', target.contigtable.name(core.CONTIGS.intern('1')))
+            self.assertIsNone(target.contigtable.name(core.CONTIGS.intern('2')))
+            self.assertEqual(1, len(list(target.fetch(region='chr1:150-150'))))
+        finally:
+            shutil.rmtree(tmpdir)
+
@@ -1,7 +1,11 @@
 import unittest
 
-from cava.utils.core import Variant
-from cava.utils.csn import makeProteinString
+from cava.utils.core import Transcript, Variant
+from cava.utils.csn import makeProteinString, transformToCSNCoordinate, transformToCSNCoordinateByExonWalk
+
+# Three exon transcripts (exons 101-120, 141-160 and 201-230), coding from 111 to 215
+PLUS = 'NM_1.1\tGENEA\tGENEA\t+/70bp/3/45bp/14\t1\t1\t100\t230\t11\t111\t215\t100\t120\t140\t160\t200\t230'
+MINUS = 'NM_2.1\tGENEB\tGENEB\t-/70bp/3/45bp/14\t1\t-1\t100\t230\t16\t215\t111\t200\t230\t140\t160\t100\t120'
 
 
 class TestmakeProteinString(unittest.TestCase):
@@ -247,5 +251,44 @@ class TestmakeProteinString(unittest.TestCase):
         self.assertEqual(actual, expected)
 
 
-
-
+class TestTransformToCSNCoordinate(unittest.TestCase):
+
+    def test_plus_strand(self):
+        transcript = Transcript(PLUS)
+        self.assertEqual(('1', 0, 0), transformToCSNCoordinate(111, transcript))
+        self.assertEqual(('10', 0, 0), transformToCSNCoordinate(120, transcript))
+        self.assertEqual(('10', 2, 0), transformToCSNCoordinate(122, transcript))
+        self.assertEqual(('11', -1, 0), transformToCSNCoordinate(140, transcript))
+        self.assertEqual(('-3', 0, 0), transformToCSNCoordinate(108, transcript))
+        self.assertEqual(('-16', 0, 0), transformToCSNCoordinate(96, transcript))
+        self.assertEqual(('*1', 0, 0), transformToCSNCoordinate(216, transcript))
+        self.assertEqual(('*21', 0, 0), transformToCSNCoordinate(235, transcript))
+        self.assertEqual('Ex2', transcript.whereIsThisPosition(150))
+        self.assertEqual('In2/3', transcript.whereIsThisPosition(161))
+        self.assertEqual('5UTR', transcript.whereIsThisPosition(101))
+        self.assertEqual('3UTR', transcript.whereIsThisPosition(230))
+        self.assertEqual('.', transcript.whereIsThisPosition(231))
+        self.assertEqual(40, transcript.intronLength(3))
+        self.assertEqual(0, transcript.intronLength(4))
+
+    def test_minus_strand(self):
+        transcript = Transcript(MINUS)
+        self.assertEqual(('1', 0, 0), transformToCSNCoordinate(215, transcript))
+        self.assertEqual(('15', 0, 0), transformToCSNCoordinate(201, transcript))
+        self.assertEqual(('15', 1, 0), transformToCSNCoordinate(200, transcript))
+        self.assertEqual(('-1', 0, 0), transformToCSNCoordinate(216, transcript))
+        self.assertEqual(('*1', 0, 0), transformToCSNCoordinate(110, transcript))
+        self.assertEqual('In1/2', transcript.whereIsThisPosition(170))
+        self.assertEqual(20, transcript.intronLength(3))
+
+    def test_same_as_exon_walk(self):
+        # Binary search in the sorted exons and walking the exons give the same results at every position, also for
+        # a transcript with unsorted exons (which is always walked)
+        unsorted = PLUS.replace('\t100\t120\t140\t160', '\t140\t160\t100\t120')
+        for line in [PLUS, MINUS, unsorted]:
+            transcript = Transcript(line)
+            for pos in range(90, 240):
+                self.assertEqual(transformToCSNCoordinateByExonWalk(pos, transcript),
+                                 transformToCSNCoordinate(pos, transcript))
+                self.assertEqual(transcript.whereIsThisPositionByExonWalk(pos), transcript.whereIsThisPosition(pos))
+        self.assertIsNone(Transcript(unsorted).exonIndex())
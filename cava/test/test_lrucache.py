@@ -0,0 +1,32 @@
+import unittest
+
+from cava.utils import lrucache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = lrucache.LRUCache('Test', 2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        # Using 'a' makes 'b' the least recently used item
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual({'name': 'Test', 'capacity': 2, 'size': 2, 'hits': 2, 'misses': 1, 'evictions': 1},
+                         cache.stats())
+
+    def test_replace(self):
+        cache = lrucache.LRUCache('Test', '1')
+        cache.put('a', 1)
+        cache.put('a', 2)
+        self.assertEqual(2, cache.get('a'))
+        self.assertEqual(0, cache.evictions)
+        self.assertEqual('Test cache: 1/1 items, 1 hits, 0 misses (hit rate 100.0%), 0 evictions', cache.statsString())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from cava.utils import annotator
+from cava.utils import main
+from cava.utils import pipeline
+
+
+class TestFileBreaks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.records = []
+        cls.vcf = os.path.join(cls.tmpdir, 'input.vcf')
+        with open(cls.vcf, 'w') as f:
+            f.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+            for i in range(50000):
+                record = '1\t' + str(i + 1) + '\t.\tA\tC\t.\tPASS\t.'
+                cls.records.append(record)
+                f.write(record + '\n')
+        cls.bgz = cls.vcf + '.gz'
+        pysam.tabix_compress(cls.vcf, cls.bgz, force=True)
+        cls.plaingz = os.path.join(cls.tmpdir, 'plain.vcf.gz')
+        with open(cls.vcf, 'rb') as infile, gzip.open(cls.plaingz, 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def readAllShards(self, inputf, threads, index=None):
+        mode = main.getSplitMode(inputf)
+        ret = []
+        for (start, end) in main.findFileBreaks(inputf, threads, index):
+            for line in main.readShard(inputf, mode, start, end):
+                line = line.strip()
+                if line == '' or line.startswith('#'): continue
+                ret.append(line)
+        return ret
+
+    def test_splitMode(self):
+        self.assertEqual('TEXT', main.getSplitMode(self.vcf))
+        self.assertEqual('BGZF', main.getSplitMode(self.bgz))
+        self.assertEqual('LINE', main.getSplitMode(self.plaingz))
+
+    def test_textShards_coverAllRecordsOnce(self):
+        for threads in [1, 2, 3, 8, 100]:
+            self.assertEqual(self.records, self.readAllShards(self.vcf, threads))
+
+    def test_bgzfShards_coverAllRecordsOnce(self):
+        for threads in [1, 2, 3, 8, 100]:
+            self.assertEqual(self.records, self.readAllShards(self.bgz, threads))
+
+    def test_plainGzipShards_coverAllRecordsOnce(self):
+        for threads in [1, 3, 8]:
+            self.assertEqual(self.records, self.readAllShards(self.plaingz, threads))
+
+    def test_bgzfShards_startOnRecordBoundary(self):
+        breaks = main.findFileBreaks(self.bgz, 4)
+        for (start, end) in breaks[1:]:
+            line = next(main.readShard(self.bgz, 'BGZF', start, end))
+            self.assertTrue(line.startswith('1\t'))
+
+    def test_scanInput(self):
+        for inputf in [self.vcf, self.bgz, self.plaingz]:
+            index = main.scanInput(inputf)
+            self.assertEqual(['##fileformat=VCFv4.2', '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'], index['header'])
+            self.assertEqual(len(self.records), index['records'])
+            for threads in [1, 4, 7]:
+                self.assertEqual(self.records, self.readAllShards(inputf, threads, index))
+
+    def test_indexShards_haveEqualRecordCounts(self):
+        index = main.scanInput(self.bgz)
+        sizes = []
+        for (start, end) in main.findFileBreaks(self.bgz, 4, index):
+            sizes.append(len([l for l in main.readShard(self.bgz, 'BGZF', start, end) if not l.startswith('#')]))
+        self.assertEqual(len(self.records), sum(sizes))
+        self.assertTrue(max(sizes) - min(sizes) <= 2 * main.INDEX_INTERVAL)
+
+    def test_weightedShards_haveEqualCost(self):
+        # Indels (first 10000 records) are more expensive to annotate than SNVs
+        inputf = os.path.join(self.tmpdir, 'indels.vcf')
+        with open(inputf, 'w') as f:
+            f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+            for i in range(50000):
+                alt = 'CT' if i < 10000 else 'C'
+                f.write('1\t' + str(i + 1) + '\t.\tA\t' + alt + '\t.\tPASS\t.\n')
+        index = main.scanInput(inputf)
+        self.assertEqual(10000 * annotator.INDEL_COST + 40000, index['cost'])
+        costs = []
+        for (start, end) in main.findFileBreaks(inputf, 4, index, True):
+            costs.append(sum(annotator.estimateCost(l) for l in main.readShard(inputf, 'TEXT', start, end)
+                             if not l.startswith('#')))
+        self.assertEqual(index['cost'], sum(costs))
+        self.assertTrue(max(costs) - min(costs) <= 2 * main.INDEX_INTERVAL * annotator.INDEL_COST)
+        os.remove(inputf)
+
+    def test_numOfWorkUnits(self):
+        index = main.scanInput(self.bgz)
+        self.assertEqual(1, main.numOfWorkUnits(index, 1))
+        self.assertEqual(4 * main.UNITS_PER_THREAD, main.numOfWorkUnits(index, 4))
+        self.assertEqual(len(index['offsets']), main.numOfWorkUnits(index, 100))
+        self.assertEqual(3, main.numOfWorkUnits(main.scanInput(self.plaingz), 3))
+
+    def test_regionsCoverAllRecordsOnce(self):
+        inputf = os.path.join(self.tmpdir, 'regions.vcf')
+        with open(inputf, 'w') as f:
+            f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+            for record in self.records:
+                f.write(record + '\n')
+            # Deletion overlapping the boundary of two regions
+            f.write('2\t9998\t.\tACGTACG\tA\t.\tPASS\t.\n')
+            f.write('2\t10005\t.\tA\tC\t.\tPASS\t.\n')
+        inputf = pysam.tabix_index(inputf, preset='vcf', force=True)
+        self.assertTrue(main.hasRegionIndex(inputf))
+        self.assertFalse(main.hasRegionIndex(self.bgz))
+        self.assertEqual(['#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'], main.readRegionHeader(inputf))
+        regions = main.findRegions(inputf, 10000, {'1': 50000, '2': 20000})
+        self.assertEqual(('1', 0, 10000), regions[0])
+        self.assertEqual([('1', 40000, None), ('2', 0, 10000), ('2', 10000, None)], regions[4:])
+        self.assertEqual([('1', 0, None), ('2', 0, None)], main.findRegions(inputf, 0, {}))
+        lines = []
+        for region in regions:
+            lines.extend(main.readUnit(inputf, 'REGION', region))
+        self.assertEqual(self.records + ['2\t9998\t.\tACGTACG\tA\t.\tPASS\t.', '2\t10005\t.\tA\tC\t.\tPASS\t.'],
+                         lines)
+        os.remove(inputf)
+        os.remove(inputf + '.tbi')
+
+    def test_iterUnit_restContinuesAfterLine(self):
+        regionfile = pysam.tabix_index(shutil.copy(self.vcf, os.path.join(self.tmpdir, 'rest.vcf')), preset='vcf',
+                                       force=True)
+        cases = [(self.vcf, 'TEXT', [0, '']), (self.bgz, 'BGZF', [0, '']), (self.plaingz, 'LINE', [1, '']),
+                 (regionfile, 'REGION', ['1', 10000, 30000])]
+        for (inputf, mode, unit) in cases:
+            lines = [line for (line, rest) in main.iterUnit(inputf, mode, unit)]
+            for k in [0, 1, 777, len(lines) - 1]:
+                rest = None
+                for (i, (line, r)) in enumerate(main.iterUnit(inputf, mode, unit)):
+                    if i == k:
+                        rest = r
+                        break
+                self.assertEqual(lines[k + 1:], [line for (line, r) in main.iterUnit(inputf, mode, rest)])
+        os.remove(regionfile)
+        os.remove(regionfile + '.tbi')
+
+    def test_sidecarIndex(self):
+        index = main.getInputIndex(self.bgz, True)
+        self.assertTrue(os.path.isfile(main.indexFileName(self.bgz)))
+        self.assertEqual(index, main.readIndex(self.bgz))
+        # A stale index (input changed since it was written) is ignored
+        os.utime(self.bgz, ns=(index['mtime'] + 10 ** 9, index['mtime'] + 10 ** 9))
+        self.assertIsNone(main.readIndex(self.bgz))
+        os.remove(main.indexFileName(self.bgz))
+
+
+class TestStreamBatches(unittest.TestCase):
+
+    def test_readStreamHeader(self):
+        infile = io.StringIO('##fileformat=VCFv4.2\n#CHROM\tPOS\n\n1\t10\n1\t20\n')
+        header, first = pipeline.readStreamHeader(infile)
+        self.assertEqual(['##fileformat=VCFv4.2', '#CHROM\tPOS'], header)
+        self.assertEqual('1\t10', first)
+        self.assertEqual([['1\t10', '1\t20']], list(pipeline.readBatches(infile, first, 10)))
+
+    def test_readBatches(self):
+        lines = ['1\t' + str(i) for i in range(1, 26)]
+        infile = io.StringIO('#CHROM\tPOS\n' + '\n'.join(lines) + '\n')
+        header, first = pipeline.readStreamHeader(infile)
+        batches = list(pipeline.readBatches(infile, first, 10))
+        self.assertEqual([10, 10, 5], [len(batch) for batch in batches])
+        self.assertEqual(lines, [line for batch in batches for line in batch])
+
+    def test_readBatches_costWeighted(self):
+        lines = ['1\t' + str(i) + '\t.\tA\tAT' for i in range(1, 4)]
+        lines += ['1\t' + str(i) + '\t.\tA\tC' for i in range(4, 24)]
+        batches = list(pipeline.readBatches(io.StringIO('\n'.join(lines) + '\n'), None, 2 * annotator.INDEL_COST))
+        self.assertEqual([2, 1 + annotator.INDEL_COST, 10], [len(batch) for batch in batches])
+
+    def test_estimateCost(self):
+        self.assertEqual(1, annotator.estimateCost('1\t10\t.\tA\tC\t.\tPASS\t.'))
+        self.assertEqual(1, annotator.estimateCost('1\t10\t.\tA\tC,G\t.\tPASS\t.'))
+        self.assertEqual(annotator.INDEL_COST, annotator.estimateCost('1\t10\t.\tA\tC,GT\t.\tPASS\t.'))
+        self.assertEqual(annotator.INDEL_COST, annotator.estimateCost('1\t10\t.\tAT\tA\t.\tPASS\t.'))
+
+    def test_readStreamHeader_noRecords(self):
+        header, first = pipeline.readStreamHeader(io.StringIO('#CHROM\tPOS\n'))
+        self.assertIsNone(first)
+        self.assertEqual([], list(pipeline.readBatches(io.StringIO(''), first, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
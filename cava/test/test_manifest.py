@@ -0,0 +1,62 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cava.utils import manifest
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input = os.path.join(self.tmpdir, 'input.vcf')
+        with open(self.input, 'w') as f:
+            f.write('#CHROM\tPOS\tID\tREF\tALT\n1\t10\t.\tA\tC\n1\t20\t.\tA\tC\n1\t30\t.\tA\tC\n')
+        self.output = os.path.join(self.tmpdir, 'output')
+        self.manifest = manifest.makeManifest(self.input, 'TEXT', 'VCF', ['#CHROM\tPOS\tID\tREF\tALT'], 3,
+                                              [(0, 40), (40, 60), (60, '')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def annotateShard(self, shardidx, lines):
+        with open(manifest.outputFileName(manifest.shardPrefix(self.output, shardidx), 'VCF'), 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+        manifest.writeShardMarker(self.output, shardidx, self.manifest, len(lines))
+
+    def test_manifest(self):
+        fn = manifest.manifestFileName(self.output)
+        manifest.writeManifest(fn, self.manifest)
+        self.assertEqual(self.manifest, manifest.readManifest(fn))
+        self.assertEqual([[0, 40], [40, 60], [60, '']], self.manifest['shards'])
+        # The id depends on the shards
+        other = manifest.makeManifest(self.input, 'TEXT', 'VCF', ['#CHROM\tPOS\tID\tREF\tALT'], 3, [(0, '')])
+        self.assertNotEqual(self.manifest['id'], other['id'])
+
+    def test_mergeShards(self):
+        self.annotateShard(1, ['record1'])
+        self.annotateShard(3, ['record3'])
+        self.assertEqual(1, len(manifest.checkShards(self.output, self.manifest)))
+        self.annotateShard(2, ['record2a', 'record2b'])
+        self.assertEqual([], manifest.checkShards(self.output, self.manifest))
+        outfile = io.StringIO()
+        self.assertEqual(4, manifest.mergeShards(self.output, self.manifest, outfile))
+        self.assertEqual('record1\nrecord2a\nrecord2b\nrecord3\n', outfile.getvalue())
+
+    def test_checkShard_incomplete(self):
+        self.annotateShard(1, ['record1'])
+        with open(manifest.outputFileName(manifest.shardPrefix(self.output, 1), 'VCF'), 'a') as f:
+            f.write('partial')
+        self.assertIn('incomplete', manifest.checkShard(self.output, 1, self.manifest))
+
+    def test_checkShard_otherManifest(self):
+        self.annotateShard(1, ['record1'])
+        other = manifest.makeManifest(self.input, 'TEXT', 'VCF', [], 3, [(0, '')])
+        self.assertIn('another manifest', manifest.checkShard(self.output, 1, other))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import collections
+import random
+import sys
+import tracemalloc
+import unittest
+
+from cava.utils import data
+from cava.utils import ncls
+
+
+class TestNCList(unittest.TestCase):
+
+    def setUp(self):
+        # Nested, overlapping, duplicate and adjacent intervals
+        self.intervals = [(0, 100, 'a'), (10, 20, 'b'), (10, 20, 'c'), (15, 200, 'd'), (20, 30, 'e'), (0, 5, 'f'),
+                          (50, 60, 'g'), (200, 210, 'h')]
+        self.index = ncls.NCList(self.intervals)
+
+    def test_overlapping(self):
+        self.assertEqual(8, len(self.index))
+        self.assertEqual(['a', 'b', 'c', 'd'], self.index.overlapping(19, 20))
+        self.assertEqual(['a', 'd', 'e'], self.index.overlapping(20, 21))
+        self.assertEqual(['h'], self.index.overlapping(200, 201))
+        self.assertEqual([], self.index.overlapping(210, 300))
+
+    def test_containing(self):
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], self.index.containing(20, 20))
+        self.assertEqual(['a', 'd'], self.index.containing(15, 60))
+        self.assertEqual(['d'], self.index.containing(100, 200))
+        self.assertEqual([], self.index.containing(0, 300))
+
+    def test_random(self):
+        # Items are returned in the order of the input intervals, as by a linear scan
+        random.seed(0)
+        intervals = []
+        for i in range(500):
+            start = random.randrange(10000)
+            intervals.append((start, start + random.choice([1, 10, 100, 5000]), i))
+        index = ncls.NCList(intervals)
+        for _ in range(500):
+            start = random.randrange(11000)
+            end = start + random.choice([0, 1, 50])
+            self.assertEqual([i for (s, e, i) in intervals if s < end and e > start], index.overlapping(start, end))
+            self.assertEqual([i for (s, e, i) in intervals if s <= start and e >= end], index.containing(start, end))
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.intervals = []
+        for i in range(1000):
+            start = random.randrange(20000)
+            self.intervals.append((start, start + random.choice([1, 10, 100, 5000]), i))
+        self.index = ncls.NCList(self.intervals)
+
+    def check(self, sweep, queries):
+        for (start, end) in queries:
+            self.assertEqual([i for (s, e, i) in self.intervals if s <= start and e >= end],
+                             sweep.containing(start, end))
+
+    def test_sorted(self):
+        # Sorted queries (with steps of all sizes) are answered by sweeping, except the first one and long jumps
+        sweep = ncls.Sweep(self.index)
+        starts = sorted(random.randrange(21000) for _ in range(2000))
+        self.check(sweep, [(start, start + random.choice([0, 0, 1, 50])) for start in starts])
+        self.assertEqual(0, sweep.fallbacks)
+        self.assertGreater(sweep.sweeps, 1900)
+
+    def test_unsorted(self):
+        # Queries going back are answered by the NCList
+        sweep = ncls.Sweep(self.index)
+        self.check(sweep, [(random.randrange(21000), random.randrange(21000)) for _ in range(500)])
+        self.assertGreater(sweep.fallbacks, 0)
+        self.check(sweep, [(10, 10), (5, 5), (5, 6), (12000, 12000), (11999, 12000), (12000, 12000), (20000, 20000)])
+
+
+class TestIndexBudget(unittest.TestCase):
+
+    def intervals(self, n):
+        random.seed(1)
+        ret = []
+        for i in range(n):
+            start = random.randrange(100000000, 200000000)
+            ret.append((start, start + random.randrange(100, 100000), 1000000 + i))
+        return ret
+
+    def test_memoryEstimate(self):
+        # The estimate covers the lists of the NCList and the sorted intervals of the Sweep, not only the items
+        intervals = self.intervals(20000)
+        tracemalloc.start()
+        index = ncls.NCList(intervals)
+        ncls.Sweep(index)
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        items = sum(sys.getsizeof(item) for item in index.items)
+        self.assertGreaterEqual(index.memoryEstimate(), allocated + items)
+        self.assertLess(index.memoryEstimate(), 1.5 * (allocated + items))
+
+    def test_eviction(self):
+        # Least recently used chromosome indexes are dropped once the estimated size is over @transcriptindexmb
+        intervals = self.intervals(5000)
+        size = ncls.NCList(intervals).memoryEstimate()
+        ensembl = data.Ensembl.__new__(data.Ensembl)
+        ensembl.chrom_index = collections.OrderedDict()
+        ensembl.chrom_index_size = dict()
+        ensembl.index_budget = int(2.5 * size)
+        ensembl.load_transcript_index = lambda chrom: ncls.NCList(intervals)
+        ensembl.get_transcript_index('1')
+        ensembl.get_transcript_index('2')
+        self.assertEqual(['1', '2'], list(ensembl.chrom_index))
+        ensembl.get_transcript_index('1')
+        ensembl.get_transcript_index('3')
+        self.assertEqual(['1', '3'], list(ensembl.chrom_index))
+        self.assertLessEqual(sum(ensembl.chrom_index_size.values()), ensembl.index_budget)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import random
+import unittest
+
+from cava.utils import core
+
+
+# Reference genome of a single chromosome '1' (interface of data.Reference used by the alignment)
+class Reference(object):
+    def __init__(self, seq):
+        self.seq = seq
+        self.reflens = {'1': len(seq)}
+
+    def getReference(self, chrom, start, end):
+        return core.Sequence(self.seq[start - 1:end])
+
+
+class TestNormalization(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        flank = ''.join(random.choice('ACGT') for _ in range(300))
+        # CA repeat of 300 bp (longer than the initial window) at 301-600 and a homopolymer at 901-950
+        self.seq = flank + 'CA' * 150 + flank + 'T' * 50 + flank
+        self.reference = Reference(self.seq)
+
+    def align(self, pos, ref, alt):
+        variant = core.Variant('1', pos, ref, alt)
+        plus = variant.alignOnPlusStrand(self.reference)
+        minus = variant.alignOnMinusStrand(self.reference)
+        return (plus.pos, plus.ref, plus.alt), (minus.pos, minus.ref, minus.alt)
+
+    def aligned_by_trimming(self, pos, ref, alt):
+        variant = core.Variant('1', pos, ref, alt)
+        plus = variant.alignOnPlusStrandByTrimming(self.reference)
+        minus = variant.alignOnMinusStrandByTrimming(self.reference)
+        return (plus.pos, plus.ref, plus.alt), (minus.pos, minus.ref, minus.alt)
+
+    def shifted(self, pos, ref, alt):
+        # Shifting the indel (after its padding base) one base at a time, on both strands
+        seq = self.seq
+        pos, ref, alt = pos + 1, ref[1:], alt[1:]
+        bases = ref + alt
+        (plus, unit) = (pos, bases)
+        while plus + len(ref) <= len(seq) and seq[plus + len(ref) - 1] == unit[0]:
+            (plus, unit) = (plus + 1, unit[1:] + unit[0])
+        plusvariant = (plus, unit, '') if len(ref) > 0 else (plus, '', unit)
+        (minus, unit) = (pos, bases)
+        while minus > 1 and seq[minus - 2] == unit[-1]:
+            (minus, unit) = (minus - 1, unit[-1] + unit[:-1])
+        minusvariant = (minus, unit, '') if len(ref) > 0 else (minus, '', unit)
+        return plusvariant, minusvariant
+
+    def test_repeat(self):
+        # Deletion of a CA unit in the middle of the repeat shifts to both ends of it (the flanks end with A and
+        # start with TT), past the initial window; same for an insertion
+        self.assertEqual(((599, 'CA', ''), (300, 'AC', '')), self.align(400, 'ACA', 'A'))
+        self.assertEqual(self.aligned_by_trimming(400, 'ACA', 'A'), self.align(400, 'ACA', 'A'))
+        self.assertEqual(((601, '', 'CA'), (300, '', 'AC')), self.align(450, 'A', 'ACA'))
+
+    def test_long_repeat_insertion(self):
+        # Insertion in a GAT repeat of 100 units (longer than the initial window) shifts past its end
+        flank = self.seq[:300]
+        self.seq = flank + 'GAT' * 100 + 'C' + flank
+        self.reference = Reference(self.seq)
+        plus, minus = self.align(452, 'A', 'ATGA')
+        self.assertEqual((601, '', 'GAT'), plus)
+        self.assertEqual(self.shifted(452, 'A', 'ATGA'), (plus, minus))
+
+    def test_homopolymer(self):
+        # Insertion and deletion of Ts in the homopolymer (the flank after it starts with TT)
+        for (ref, alt) in [('TT', 'T'), ('T', 'TTT'), ('TTTTT', 'T')]:
+            self.assertEqual(self.aligned_by_trimming(920, ref, alt), self.align(920, ref, alt))
+        self.assertEqual(((952, 'T', ''), (901, 'T', '')), self.align(920, 'TT', 'T'))
+
+    def test_random(self):
+        # Same positions and alleles as shifting one base at a time for random indels
+        for _ in range(500):
+            pos = random.randint(200, len(self.seq) - 20)
+            length = random.randint(1, 6)
+            if random.random() < 0.5:
+                ref, alt = self.seq[pos - 1:pos + length], self.seq[pos - 1]
+            else:
+                ref = self.seq[pos - 1]
+                alt = ref + ''.join(random.choice('ACGT') for _ in range(length))
+            self.assertEqual(self.shifted(pos, ref, alt), self.align(pos, ref, alt))
+
+    def test_substitution(self):
+        # Substitutions are not shifted
+        variant = core.Variant('1', 10, self.seq[9], 'N')
+        self.assertIs(variant, variant.alignOnPlusStrand(self.reference))
+        self.assertIs(variant, variant.alignOnMinusStrand(self.reference))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from cava.utils import core
+from cava.utils import proteindb
+
+LINE = 'NM_1.1\tGENEA\tGENEA\t+/14bp/2/9bp/2\t1\t1\t100\t120\t3\t103\t115\t100\t106\t110\t118'
+
+
+class TestProteinDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tmpdir, 'db.gz.prot.gz')
+        with open(self.fn + '.txt', 'w') as f:
+            f.write(proteindb.HEADER + '{"version": 1}\n')
+            f.write('1\t100\t120\tNM_1.1\tMGX\tAAATGG,GCTAATTT\n')
+        pysam.tabix_compress(self.fn + '.txt', self.fn, force=True)
+        pysam.tabix_index(self.fn, seq_col=0, start_col=1, end_col=2, zerobased=True, meta_char='#', force=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        db = proteindb.ProteinDB(self.fn)
+        self.assertEqual({'version': 1}, db.settings)
+        transcript = core.Transcript(LINE)
+        (protein, exonseqs, cds_ref) = db.lookup(transcript)
+        self.assertEqual('MGX', protein)
+        self.assertEqual(['AAATGG', 'GCTAATTT'], exonseqs)
+        # The CDS starts at the 3rd base of the spliced transcript and covers the translated codons
+        self.assertEqual('ATGGGCTAA', cds_ref)
+        # Transcripts not in the file
+        self.assertIsNone(db.lookup(core.Transcript(LINE.replace('NM_1.1', 'NM_2.1'))))
+        self.assertIsNone(db.lookup(core.Transcript(LINE.replace('\t1\t1\t', '\t2\t1\t'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from cava.utils import data
+from cava.utils import packedref
+
+
+class TestReference(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fasta = os.path.join(self.tmpdir, 'genome.fa')
+        random.seed(0)
+        self.seqs = {'1': ''.join(random.choice('ACGTacgtN') for _ in range(1000)),
+                     '2': ''.join(random.choice('ACGT') for _ in range(95))}
+        with open(self.fasta, 'w') as f:
+            for chrom, seq in self.seqs.items():
+                f.write('>' + chrom + '\n')
+                for i in range(0, len(seq), 60):
+                    f.write(seq[i:i + 60] + '\n')
+        pysam.faidx(self.fasta)
+        # Small blocks, so that regions span several of them
+        self.block = data.REFERENCE_BLOCK
+        data.REFERENCE_BLOCK = 10
+
+    def tearDown(self):
+        data.REFERENCE_BLOCK = self.block
+        shutil.rmtree(self.tmpdir)
+
+    def reference(self, mb):
+        class Options(object):
+            def __init__(self, args):
+                self.args = args
+        return data.Reference(Options({'reference': self.fasta, 'referencecachemb': str(mb)}))
+
+    def test_regions(self):
+        # Regions within a block, across blocks and at the chromosome ends, in upper case
+        reference = self.reference(1)
+        for (chrom, start, end) in [('1', 1, 1), ('1', 5, 10), ('1', 10, 11), ('1', 3, 57), ('1', 991, 1000),
+                                    ('2', 1, 95), ('2', 90, 95), ('1', 1, 1000)]:
+            self.assertEqual(self.seqs[chrom][start - 1:end].upper(), reference.getReference(chrom, start, end))
+        self.assertEqual('', reference.getReference('1', 10, 9))
+        self.assertIsNone(reference.getReference('3', 1, 1))
+
+    def test_eviction(self):
+        # 20 bytes of budget hold two 10 bp blocks
+        reference = self.reference(1)
+        reference.cache.capacity = 2
+        reference.getReference('1', 1, 5)
+        reference.getReference('2', 1, 5)
+        reference.getReference('1', 6, 10)
+        self.assertEqual({'name': 'Reference', 'capacity': 2, 'size': 2, 'hits': 1, 'misses': 2, 'evictions': 0},
+                         reference.cache.stats())
+        reference.getReference('1', 15, 25)
+        self.assertEqual(2, reference.cache.stats()['evictions'])
+        self.assertEqual(self.seqs['2'][0:10], reference.getReference('2', 1, 10))
+
+    def test_packed(self):
+        self.assertIsNone(packedref.openPacked(self.fasta))
+        self.assertEqual(2, packedref.pack(self.fasta))
+        reference = self.reference(1)
+        self.assertIsNotNone(reference.packed)
+        for (chrom, start, end) in [('1', 1, 1), ('1', 3, 57), ('1', 991, 1000), ('2', 1, 95), ('1', 1, 1000)]:
+            self.assertEqual(self.seqs[chrom][start - 1:end].upper(), reference.getReference(chrom, start, end))
+        # The block cache is not used
+        self.assertEqual(0, reference.cache.stats()['misses'])
+        # The packed file does not match the changed FASTA file any more
+        with open(self.fasta, 'a') as f:
+            f.write('>3\nACGT\n')
+        self.assertIsNone(packedref.openPacked(self.fasta))
+
+
+class TestContigLengths(unittest.TestCase):
+
+    def test_aliases(self):
+        # Same lengths as a table of all the aliases of every chromosome, the last chromosome winning ties
+        references = ['1', 'chr2', 'Chr3', 'X', 'MT', 'chrUn_KI270302v1', 'chr1', 'GL000220.1', 'mt', 'chrY']
+        lengths = list(range(100, 100 + len(references)))
+        expected = dict()
+        for i in range(len(references)):
+            for alias in data.contigAliases(references[i]):
+                expected[alias] = lengths[i]
+        reflens = data.ContigLengths(references, lengths)
+        for chrom in list(expected) + ['3', 'chr', '', 'Y2', 'chrGL000220.2', 'M', 'CHRMT', 'chrUN_KI270302V1']:
+            self.assertEqual(chrom in expected, chrom in reflens)
+            self.assertEqual(expected.get(chrom), reflens.get(chrom))
+        self.assertEqual(lengths[6], reflens['1'])
+        self.assertRaises(KeyError, lambda: reflens['3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import http.client
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cava.utils import server
+
+
+class TestServer(unittest.TestCase):
+
+    def test_worker_error(self):
+        class FailingAnnotator(object):
+            def processLine(self, line, out, log):
+                raise IndexError('list index out of range')
+
+        results = queue.Queue()
+        worker = server.ServerWorker(1, None, None, None, None, None, None, None, results, FailingAnnotator())
+        worker.processBatch(3, ['1\t10\t.\tA\tC\t.\tPASS'])
+        (batchid, n, text) = results.get_nowait()
+        self.assertEqual((3, -1), (batchid, n))
+        self.assertIn('IndexError', text)
+        self.assertEqual(-1, worker.current.value)
+
+    def test_unix_socket_path(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'out.vcf')
+            with open(path, 'w') as f:
+                f.write('data\n')
+            with self.assertRaises(ValueError):
+                server.makeServer(path)
+            self.assertTrue(os.path.exists(path))
+            # Paths are Unix sockets even if they contain ':'
+            for address in [os.path.join(tmpdir, 'cava:1.sock'), 'unix:' + os.path.join(tmpdir, 'cava.sock')]:
+                httpd = server.makeServer(address)
+                self.assertIsInstance(httpd, server.UnixServer)
+                self.assertTrue(os.path.exists(address.replace('unix:', '')))
+                httpd.server_close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_content_length(self):
+        httpd = server.makeServer('127.0.0.1:0')
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for length, status in [(None, 411), ('abc', 400), ('-1', 400)]:
+                conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+                conn.putrequest('POST', '/annotate', skip_accept_encoding=True)
+                if length is not None:
+                    conn.putheader('Content-Length', length)
+                conn.endheaders()
+                response = conn.getresponse()
+                self.assertEqual(status, response.status)
+                response.read()
+                conn.close()
+            # Body not valid UTF-8
+            conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+            conn.request('POST', '/annotate', body=b'\xff\xfe\n')
+            response = conn.getresponse()
+            self.assertEqual(400, response.status)
+            self.assertIn(b'UTF-8', response.read())
+            conn.close()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def test_health(self):
+        httpd = server.makeServer('127.0.0.1:0')
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+            conn.request('GET', '/health')
+            response = conn.getresponse()
+            self.assertEqual(200, response.status)
+            self.assertEqual(b'OK\n', response.read())
+            conn.request('GET', '/unknown')
+            response = conn.getresponse()
+            self.assertEqual(404, response.status)
+            response.read()
+            conn.close()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from cava.utils import core
+
+# Single exon transcript (positions 101-130), coding from its first base
+LINE = 'NM_1.1\tGENEA\tGENEA\t+/30bp/1/30bp/10\t1\t1\t100\t130\t1\t101\t130\t100\t130'
+EXON = 'ATGAAACCCGGGTTTAAATAGCCCAAATGA'
+
+
+class TestTranslation(unittest.TestCase):
+
+    def setUp(self):
+        self.transcript = core.Transcript(LINE)
+        self.exonseqs = [core.Sequence(EXON)]
+
+    # Protein of the transcript with a variant, and the same by translating the whole coding sequence
+    def proteins(self, variant, letter):
+        self.transcript.reftranslation = None
+        self.transcript.getProteinSequence(None, None, self.exonseqs, letter)
+        protein = self.transcript.getProteinSequence(None, variant, self.exonseqs, letter)[0]
+        codingsequencealt = self.transcript.getCodingSequence(None, variant, self.exonseqs)[0]
+        return protein, core.trim_prot_after_stop(core.Sequence(codingsequencealt).translate(letter))
+
+    def test_common_prefix_suffix(self):
+        self.assertEqual(0, core.commonPrefixLength('ACGT', 'TCGT'))
+        self.assertEqual(3, core.commonPrefixLength('ACGT', 'ACGA'))
+        self.assertEqual(2, core.commonPrefixLength('AC', 'ACGT'))
+        self.assertEqual(3, core.commonSuffixLength('ACGT', 'TCGT', 4))
+        self.assertEqual(2, core.commonSuffixLength('ACGT', 'TCGT', 2))
+        self.assertEqual(0, core.commonSuffixLength('ACGT', 'ACGA', 4))
+        self.assertEqual(0, core.commonSuffixLength('ACGT', 'ACGT', 0))
+
+    def test_translate(self):
+        self.assertEqual('MKPGFKXPKX', core.Sequence(EXON).translate('1'))
+        self.assertEqual('MetLysProGlyPheLysXProLysX', core.Sequence(EXON).translate('3'))
+        self.assertEqual('MKPGFKXPKU', core.Sequence(EXON).translate('7'))
+        self.assertEqual('MKPGFKXPKW', core.Sequence(EXON).translate('4'))
+        # Unknown codons, incomplete last codon and unknown codon tables
+        self.assertEqual('M?K', core.Sequence('ATGNAAAAAGC').translate('1'))
+        self.assertEqual('M?', core.Sequence('ATGANAA').translate('1'))
+        self.assertEqual('??', core.Sequence('ATGAAA').translate('2'))
+        self.assertEqual(['Met', 'Lys', 'Pro'], core.Sequence(EXON[0:9]).translateCodons('3'))
+        self.assertEqual(['P', 'G', 'F', 'K', 'X'], core.Sequence(EXON).translateCodons('1', 2, True))
+        self.assertEqual([], core.Sequence(EXON).translateCodons('1', 10, True))
+
+    def test_translation_stats(self):
+        before = core.translationStats()
+        core.Sequence(EXON).translate('1')
+        core.Sequence(EXON).translateCodons('1', 2, True)
+        after = core.translationStats()
+        self.assertEqual(before['calls'] + 2, after['calls'])
+        self.assertEqual(before['codons'] + 15, after['codons'])
+        self.assertGreaterEqual(after['seconds'], before['seconds'])
+        self.assertTrue(core.translationStatsString().startswith('Translation: '))
+
+    def test_reference(self):
+        protein = self.transcript.getProteinSequence(None, None, self.exonseqs, '1')[0]
+        self.assertEqual('MKPGFKX', protein)
+
+    def test_variants(self):
+        # Stop gained, frameshift, in-frame insertion and deletion, change after the stop codon
+        cases = [(104, 'A', 'T', 'MX'), (107, 'C', 'CA', 'MKHRVX'), (104, 'A', 'ACCC', 'MTQPGFKX'),
+                 (104, 'AAAA', 'A', 'MTGFKX'), (125, 'A', 'G', 'MKPGFKX')]
+        for (pos, ref, alt, expected) in cases:
+            variant = core.Variant('1', pos, ref, alt)
+            (protein, full) = self.proteins(variant, '1')
+            self.assertEqual(full, protein)
+            self.assertEqual(expected, protein)
+
+    def test_all_positions(self):
+        # Every substitution, 1 and 3 bp deletion and 1 and 3 bp insertion, with one and three letter codes
+        for letter in ['1', '3']:
+            for pos in range(102, 128):
+                ref = EXON[pos - 101:pos - 101 + 4]
+                alleles = [(ref[0], b) for b in 'ACGT' if b != ref[0]]
+                alleles += [(ref[0:2], ref[0]), (ref, ref[0]), (ref[0], ref[0] + 'T'), (ref[0], ref[0] + 'TGC')]
+                for (vcf_ref, vcf_alt) in alleles:
+                    (protein, full) = self.proteins(core.Variant('1', pos, vcf_ref, vcf_alt), letter)
+                    self.assertEqual(full, protein, str(pos) + ' ' + vcf_ref + '>' + vcf_alt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+
+# Connection to the annotation databases and annotation of input lines, shared by all execution engines
+#######################################################################################################################
+
+import logging
+
+from . import compileddb
+from . import core
+from . import csn
+from . import data
+
+
+# Default list of chromosomes to annotate
+DEFAULT_CHROMS = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18',
+                  '19', '20', '21', '22', 'X', 'Y', 'MT']
+
+# Transcript-specific annotations (separated by ':' for multiple transcripts)
+TRANSCRIPT_FIELDS = ['TRANSCRIPT', 'GENE', 'GENEID', 'TRINFO', 'LOC', 'CSN', 'CLASS', 'SO', 'IMPACT', 'ALTANN',
+                     'ALTCLASS', 'ALTSO', 'ALTFLAG', 'PROTPOS', 'PROTREF', 'PROTALT']
+
+# Relative cost of annotating an indel or complex variant (alignment, repeat scan and protein rebuild) compared to a SNV
+INDEL_COST = 10
+
+
+# Cheap estimate of the cost of annotating an input line, used to balance work units between processes
+# (REF and ALT are the 4th and 5th columns in both VCF and TXT input)
+def estimateCost(line):
+    cols = line.split('\t', 5)
+    if len(cols) < 5: return 1
+    if len(cols[3]) == 1:
+        for alt in cols[4].split(','):
+            if not len(alt) == 1: return INDEL_COST
+        return 1
+    return INDEL_COST
+
+
+# Checking if an input line can be parsed as a record (VCF records need at least 7 columns up to FILTER, TXT records
+# at least 5 up to ALT; the position is the 2nd column in VCF and the 3rd column in TXT input), returns the error
+# message (None if it is valid)
+def checkRecordLine(line, inputformat):
+    cols = line.split('\t')
+    if inputformat.upper() == 'VCF':
+        if len(cols) < 7:
+            return 'less than 7 columns: ' + line
+        pos = cols[1]
+    else:
+        if len(cols) < 5:
+            return 'less than 5 columns: ' + line
+        pos = cols[2]
+    if not pos.isdigit():
+        return 'invalid position: ' + line
+    return None
+
+
+# Get Allowed chromosomes from config or use default
+def readChroms(conf):
+    chroms = ['.']
+    with open(conf, encoding='utf-8') as c:
+        for line in c:
+            if line.startswith('@chrom'):
+                chroms = line[line.find('=') + 1:].strip().split(',')
+    if chroms[0] == '.':
+        chroms = list(DEFAULT_CHROMS)
+    return chroms
+
+
+# Get codon usage from config or use default
+def readCodonUsage(conf):
+    codon_usage = ['1']
+    with open(conf, encoding='utf-8') as c:
+        for line in c:
+            if line.startswith('@codon_usage'):
+                codon_usage = line[line.find('=') + 1:].strip().split(',')
+    return codon_usage
+
+
+#######################################################################################################################
+
+# Parsing the @impactdef string of the configuration file into the impact definition directory (None if not given)
+def readImpactDef(options):
+    if options.args['impactdef'] == '.' or options.args['impactdef'] == '':
+        return None
+    impactdir = dict()
+    valuev = options.args['impactdef'].split('|')
+    for i in range(len(valuev)):
+        classv = valuev[i].split(',')
+        for c in classv:
+            impactdir[c.strip()] = str(i + 1)
+    return impactdir
+
+
+# Creating an Annotator from a configuration file (in-process API)
+#    annot = annotator.fromConfig('config.txt')
+#    for result in annot.annotate(['chr1\t12345\t.\tA\tG', ('chr2', 23456, 'AT', 'A')]): ...
+def fromConfig(conf):
+    options = core.Options(conf)
+    core.checkOptions(options)
+    options.transcript2protein = core.read_dict(options, 'transcript2protein')
+    genelist = core.readSet(options, 'genelist')
+    transcriptlist = core.readSet(options, 'transcriptlist')
+    if not options.args['ensembl'] in ('.', '') and options.args['loadalltranscripts'] is True:
+        compileddb.prepareCompiled(options.args['ensembl'], genelist, transcriptlist)
+    return Annotator(options, conf, genelist, transcriptlist, core.readSet(options, 'snplist'), readImpactDef(options))
+
+
+# Converting a variant given as a tuple (chrom, pos, ref, alt[, id]) or a dictionary (keys chrom, pos, ref, alt and
+# optionally id) into an input line of the given format (input lines are returned as they are)
+def variantToLine(variant, inputformat):
+    if isinstance(variant, str):
+        return variant.strip()
+    if isinstance(variant, dict):
+        values = [variant['chrom'], variant['pos'], variant['ref'], variant['alt'], variant.get('id', '.')]
+    else:
+        values = list(variant)
+        if len(values) == 4:
+            values.append('.')
+    (chrom, pos, ref, alt, vid) = [str(x) for x in values]
+    if inputformat.upper() == 'VCF':
+        return '\t'.join([chrom, pos, vid, ref, alt, '.', 'PASS', '.'])
+    return '\t'.join([vid, chrom, pos, ref, alt])
+
+
+# Class holding the reference genome, the Ensembl and dbSNP databases and the target BED file,
+# annotating input lines one by one
+class Annotator(object):
+    # Constructor (conf is the configuration file, log is True if connection messages are to be written to the log file)
+    def __init__(self, options, conf, genelist, transcriptlist, snplist, impactdir, log=False):
+        self.options = options
+
+        # Gene, transcript and SNP lists
+        self.genelist = genelist
+        self.transcriptlist = transcriptlist
+        self.snplist = snplist
+
+        # Impact defintion directory
+        self.impactdir = impactdir
+
+        # Allowed chromosomes and codon usage
+        self.chroms = readChroms(conf)
+        self.codon_usage = readCodonUsage(conf)
+
+        # Reference genome
+        self.reference = data.Reference(options)
+        if log: logging.info('Connected to reference genome.')
+
+        if (not options.args['ensembl'] == '.') and (not options.args['ensembl'] == ''):
+            # Pass reference to ensembl, so it can know the chromosome sizes
+            self.ensembl = data.Ensembl(options, genelist, transcriptlist, self.codon_usage[0], self.reference)
+            if log: logging.info('Connected to Ensembl database.')
+        else:
+            self.ensembl = None
+
+        if (not options.args['dbsnp'] == '.') and (not options.args['dbsnp'] == ''):
+            self.dbsnp = data.dbSNP(options)
+            if log: logging.info('Connected to dbSNP database.')
+        else:
+            self.dbsnp = None
+
+        # Target BED file
+        if (not options.args['target'] == '.') and (not options.args['target'] == ''):
+            self.targetBED = data.TargetBED(options)
+        else:
+            self.targetBED = None
+
+    # Loading the in-memory indexes of the databases up front, e.g. before forking processes sharing this object
+    def preload(self):
+        if self.ensembl is not None:
+            self.ensembl.preload()
+
+    # Reopening all file handles, to be called in a forked process using an object created by its parent
+    def reopen(self):
+        self.reference.reopen()
+        if self.ensembl is not None:
+            self.ensembl.reopen()
+        if self.dbsnp is not None:
+            self.dbsnp.reopen()
+        if self.targetBED is not None:
+            self.targetBED.reopen()
+
+    # Caches of the reference genome and the databases
+    def caches(self):
+        if self.ensembl is None:
+            return [self.reference.cache]
+        return [self.reference.cache] + self.ensembl.caches()
+
+    # Counters (hits, misses, evictions) of the caches of the reference genome and the databases, for tuning their sizes
+    def cacheStats(self):
+        return [cache.stats() for cache in self.caches()]
+
+    # Writing the counters of the caches and of the translations to the log file
+    def logStats(self, name):
+        for cache in self.caches():
+            logging.info(name + ' - ' + cache.statsString() + '.')
+        logging.info(name + ' - ' + core.translationStatsString() + '.')
+
+    # Annotating a single (stripped, non-header) input line, returns the annotated record (None if filtered out)
+    # Raises ValueError if the line cannot be parsed as a record (core.Record would stop the process)
+    def annotateLine(self, line):
+        error = checkRecordLine(line, self.options.args['inputformat'])
+        if error is not None:
+            raise ValueError(error)
+
+        # Parsing record from input file
+        record = core.Record(line, self.options, self.targetBED, self.reference)
+
+        # Filtering out REFCALL records .. from original VCF annotation
+        if record.filter == 'REFCALL': return None
+
+        # Filtering record, if required
+        if self.options.args['filter'] and not record.filter == 'PASS': return None
+
+        # Only annotate records of allowed chromosome names
+        if record.chrom not in self.chroms:
+            logging.warning(
+                "\t!!!!!!Chromosome " + record.chrom + " not found, skipping annotation, " +
+                "but still outputting in VCF as long as within target region (if specified)!!!!!!\n")
+        else:
+            # Annotating the record based on the Ensembl, dbSNP and reference data
+            record.annotate(self.ensembl, self.dbsnp, self.reference, self.impactdir)
+        return record
+
+    # Annotating a single (stripped, non-header) input line and writing the annotated record to the output file
+    def processLine(self, line, outfile, stdout):
+        record = self.annotateLine(line)
+        if record is None: return
+
+        # Writing annotated record to output file
+        record.output(self.options.args['outputformat'], outfile, self.options, self.genelist,
+                      self.transcriptlist, self.snplist, stdout)
+
+    # Structured annotation of a record: one entry per alt allele that would be written to the output, with the
+    # allele-level annotations and one dictionary of annotations (including HGVSc and HGVSp) per transcript
+    def result(self, record):
+        ret = {'chrom': record.chrom, 'pos': record.pos, 'id': record.id, 'ref': record.ref, 'alts': list(record.alts),
+               'qual': record.qual, 'filter': record.filter, 'alleles': []}
+        if record.chrom_chr_prefix:
+            ret['chrom'] = 'chr' + record.chrom
+        outvariants, outalts = record.outputVariants(self.options, self.genelist, self.transcriptlist, self.snplist)
+        contig = csn.get_contig_from_build(record.chrom, record.build)
+        for i in range(len(record.variants)):
+            variant = record.variants[i]
+            if not any(variant is v for v in outvariants): continue
+            allele = {'alt': record.alts[i], 'annotations': dict(), 'transcripts': []}
+            values = dict(zip(variant.flags, variant.flagvalues))
+            for key in variant.flags:
+                if key not in TRANSCRIPT_FIELDS:
+                    allele['annotations'][key] = values[key]
+            if 'TRANSCRIPT' in values and not values['TRANSCRIPT'] == '':
+                for j in range(len(values['TRANSCRIPT'].split(':'))):
+                    transcript = dict()
+                    for key in variant.flags:
+                        if key in TRANSCRIPT_FIELDS:
+                            transcript[key] = values[key].split(':')[j]
+                    transcript['HGVSc'], transcript['HGVSp'] = core.transcriptHGVS(contig, transcript['TRANSCRIPT'],
+                                                                                   transcript.get('CSN', '.'),
+                                                                                   self.options)
+                    allele['transcripts'].append(transcript)
+            ret['alleles'].append(allele)
+        return ret
+
+    # Annotating variants given as input lines (in the input format of the configuration file), tuples
+    # (chrom, pos, ref, alt[, id]) or dictionaries, yielding the structured annotation of each (None if filtered out)
+    # Raises ValueError for a variant that cannot be parsed as a record
+    def annotate(self, variants):
+        for variant in variants:
+            record = self.annotateLine(variantToLine(variant, self.options.args['inputformat']))
+            if record is None:
+                yield None
+            else:
+                yield self.result(record)
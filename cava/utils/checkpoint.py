@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+
+# Checkpoints of annotation runs: the plan of a run (header and work units) and the progress of every work unit,
+# so that an interrupted run can be resumed
+#######################################################################################################################
+
+import glob
+import json
+import os
+
+PLAN_VERSION = 1
+
+
+# Name of the tmp output file of a work unit
+def tmpFileName(output, fileformat, unitidx):
+    if fileformat == 'VCF':
+        return output + '_tmp_' + str(unitidx) + '.vcf'
+    return output + '_tmp_' + str(unitidx) + '.txt'
+
+
+# Name of the plan file of a run
+def planFileName(output):
+    return output + '_tmp_plan.json'
+
+
+# Name of the checkpoint file of a work unit
+def checkpointFileName(output, unitidx):
+    return output + '_tmp_' + str(unitidx) + '.ckpt'
+
+
+# Writing a JSON file atomically (a checkpoint is either the old or the new one, even if the process is killed)
+def writeJSON(fn, obj):
+    with open(fn + '.part', 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+    os.replace(fn + '.part', fn)
+
+
+# Reading a JSON file, returns None if it is missing or cannot be read
+def readJSON(fn):
+    if not os.path.isfile(fn):
+        return None
+    try:
+        with open(fn, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Writing the plan of a run: split mode, header, number of records (None if not known) and work units
+def writePlan(output, inputf, mode, fileformat, header, records, units):
+    stat = os.stat(inputf)
+    writeJSON(planFileName(output), {'version': PLAN_VERSION, 'input': os.path.abspath(inputf), 'size': stat.st_size,
+                                     'mtime': stat.st_mtime_ns, 'mode': mode, 'outputformat': fileformat,
+                                     'header': header, 'records': records, 'units': units})
+
+
+# Reading the plan of a run, returns None if there is none or it was made for another input file or output format
+def readPlan(output, inputf, fileformat):
+    plan = readJSON(planFileName(output))
+    if plan is None:
+        return None
+    stat = os.stat(inputf)
+    if plan.get('version') != PLAN_VERSION or plan.get('input') != os.path.abspath(inputf) or \
+            plan.get('size') != stat.st_size or plan.get('mtime') != stat.st_mtime_ns or \
+            plan.get('outputformat') != fileformat:
+        return None
+    return plan
+
+
+# Writing the checkpoint of a work unit: the rest of the unit still to be annotated, the size of the tmp output file
+# and the number of records annotated so far
+def writeCheckpoint(output, unitidx, rest, size, records, done):
+    writeJSON(checkpointFileName(output, unitidx), {'rest': rest, 'size': size, 'records': records, 'done': done})
+
+
+# Reading the checkpoint of a work unit, returns None if there is none
+def readCheckpoint(output, unitidx):
+    return readJSON(checkpointFileName(output, unitidx))
+
+
+# Preparing a work unit for resuming, returns the checkpoint (None if the unit has to start from scratch)
+# The tmp output file is truncated to its size at the checkpoint, dropping records written after it
+def resumeUnit(output, fileformat, unitidx):
+    ckpt = readCheckpoint(output, unitidx)
+    if ckpt is None:
+        return None
+    fn = tmpFileName(output, fileformat, unitidx)
+    if not os.path.isfile(fn) or os.path.getsize(fn) < ckpt['size']:
+        return None
+    with open(fn, 'r+b') as f:
+        f.truncate(ckpt['size'])
+    return ckpt
+
+
+# Removing the plan and all checkpoint files of a run
+def removeCheckpoints(output):
+    for fn in glob.glob(glob.escape(output) + '_tmp_*.ckpt'):
+        os.remove(fn)
+    if os.path.isfile(planFileName(output)):
+        os.remove(planFileName(output))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+
+# Compiled transcript database: a binary companion file of a (bgzipped, tabix-indexed) transcript database holding
+# fixed-width integer arrays of the transcript and exon coordinates and a string table of the identifiers, memory
+# mapped by CAVA so that transcripts are built without parsing text and all processes share the same page cache
+#######################################################################################################################
+
+import array
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'CAVACDB\x00'
+COMPILED_VERSION = 1
+
+# Integer arrays with one value per transcript (columns 6-11 of the database file)
+FIELDS = ['strand', 'transcriptStart', 'transcriptEnd', 'codingStart', 'codingStartGenomic', 'codingEndGenomic']
+
+# String columns of the database file (columns 1-5), stored in the string table
+STRINGS = 5
+
+
+# Name of the compiled companion file of a transcript database (key identifies the gene and transcript lists of a
+# slim file holding only the transcripts in the lists, see listKey)
+def compiledFileName(dbfile, key=None):
+    if key is None:
+        return dbfile + '.cdb'
+    return dbfile + '.' + key + '.cdb'
+
+
+# Key of a gene list and a transcript list (hash of their sorted items), None if both are empty
+def listKey(genelist, transcriptlist):
+    if len(genelist) == 0 and len(transcriptlist) == 0:
+        return None
+    h = hashlib.sha1()
+    h.update('\n'.join(sorted(genelist)).encode('utf-8'))
+    h.update(b'\t')
+    h.update('\n'.join(sorted(transcriptlist)).encode('utf-8'))
+    return h.hexdigest()[0:16]
+
+
+# Checking if a transcript (identifier and gene symbol) passes the gene and transcript lists (empty lists pass all)
+def inLists(transcriptid, genesymbol, genelist, transcriptlist):
+    if len(genelist) > 0 and genesymbol not in genelist:
+        return False
+    if len(transcriptlist) > 0 and transcriptid not in transcriptlist:
+        return False
+    return True
+
+
+# Fingerprint of a transcript database file (size and hash of its first and last 64 KB), to detect a compiled
+# companion file not matching the database any more
+def fingerprint(dbfile):
+    size = os.path.getsize(dbfile)
+    h = hashlib.sha1()
+    with open(dbfile, 'rb') as f:
+        h.update(f.read(65536))
+        f.seek(max(0, size - 65536))
+        h.update(f.read(65536))
+    return [size, h.hexdigest()]
+
+
+# Compiling a transcript database file into its binary companion file (only the transcripts passing the gene and
+# transcript lists, if any), returns the number of transcripts
+def compileDB(dbfile, outfn=None, genelist=(), transcriptlist=()):
+    key = listKey(genelist, transcriptlist)
+    if outfn is None:
+        outfn = compiledFileName(dbfile, key)
+
+    # Reading the transcripts, grouped by chromosome in the order of the database file
+    contigs = dict()
+    with gzip.open(dbfile, 'rt') as infile:
+        for line in infile:
+            if line.startswith('#'): continue
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 11: continue
+            if not inLists(cols[0], cols[1], genelist, transcriptlist): continue
+            contigs.setdefault(cols[4], []).append(cols)
+
+    arrays = dict()
+    for name in FIELDS + ['exons', 'exonOffsets', 'stringOffsets']:
+        arrays[name] = array.array('q')
+    strings = bytearray()
+    contigranges = dict()
+    arrays['exonOffsets'].append(0)
+    arrays['stringOffsets'].append(0)
+    for chrom, records in contigs.items():
+        contigranges[chrom] = [len(arrays['strand']), len(arrays['strand']) + len(records)]
+        for cols in records:
+            for i in range(len(FIELDS)):
+                arrays[FIELDS[i]].append(int(cols[5 + i]))
+            # Exon start and end pairs (as read by core.Transcript)
+            for i in range(11, len(cols) - 1, 2):
+                arrays['exons'].append(int(cols[i]))
+                arrays['exons'].append(int(cols[i + 1]))
+            arrays['exonOffsets'].append(len(arrays['exons']))
+            for i in range(STRINGS):
+                strings += cols[i].encode('utf-8')
+                arrays['stringOffsets'].append(len(strings))
+
+    # Header: magic, length of the metadata, metadata (JSON), then the arrays aligned to 8 bytes
+    metadata = {'version': COMPILED_VERSION, 'source': fingerprint(dbfile), 'byteorder': sys.byteorder, 'lists': key,
+                'transcripts': len(arrays['strand']), 'contigs': contigranges, 'arrays': dict()}
+    offset = 0
+    for name, values in arrays.items():
+        metadata['arrays'][name] = [offset, len(values)]
+        offset += 8 * len(values)
+    metadata['arrays']['strings'] = [offset, len(strings)]
+    metabytes = json.dumps(metadata).encode('utf-8')
+    start = len(MAGIC) + 8 + len(metabytes)
+    padding = (8 - start % 8) % 8
+
+    partfn = outfn + '.' + str(os.getpid()) + '.part'
+    with open(partfn, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(struct.pack('<Q', len(metabytes) + padding))
+        outfile.write(metabytes + b' ' * padding)
+        for values in arrays.values():
+            outfile.write(values.tobytes())
+        outfile.write(strings)
+    os.replace(partfn, outfn)
+    return len(arrays['strand'])
+
+
+# Class representing a memory mapped compiled transcript database
+class CompiledDB(object):
+    # Constructor
+    def __init__(self, fn):
+        self.filename = fn
+        with open(fn, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self.mm[:len(MAGIC)] == MAGIC:
+            raise ValueError('not a compiled transcript database: ' + fn)
+        (metalen,) = struct.unpack('<Q', self.mm[len(MAGIC):len(MAGIC) + 8])
+        start = len(MAGIC) + 8
+        self.metadata = json.loads(self.mm[start:start + metalen].decode('utf-8'))
+        start += metalen
+        view = memoryview(self.mm)
+        self.arrays = dict()
+        for name, (offset, length) in self.metadata['arrays'].items():
+            if name == 'strings':
+                self.strings = view[start + offset:start + offset + length]
+            else:
+                self.arrays[name] = view[start + offset:start + offset + 8 * length].cast('q')
+        self.contigs = self.metadata['contigs']
+
+    # Checking if the compiled database can be used for the given transcript database file (and list key)
+    def matches(self, dbfile, key=None):
+        return self.metadata.get('version') == COMPILED_VERSION and self.metadata['byteorder'] == sys.byteorder and \
+            self.metadata['source'] == fingerprint(dbfile) and self.metadata.get('lists') == key
+
+    # Number of transcripts
+    def __len__(self):
+        return self.metadata['transcripts']
+
+    # (start, end, transcript index) of the transcripts of a chromosome, in the order of the database file
+    def intervals(self, chrom):
+        if chrom not in self.contigs:
+            return []
+        (first, last) = self.contigs[chrom]
+        starts = self.arrays['transcriptStart']
+        ends = self.arrays['transcriptEnd']
+        return [(starts[i], ends[i], i) for i in range(first, last)]
+
+    # String column (0-4) of a transcript
+    def string(self, idx, col):
+        offsets = self.arrays['stringOffsets']
+        return bytes(self.strings[offsets[STRINGS * idx + col]:offsets[STRINGS * idx + col + 1]]).decode('utf-8')
+
+    # Transcript identifier
+    def transcriptID(self, idx):
+        return self.string(idx, 0)
+
+    # Values of the columns of a transcript: the 5 string columns, the 6 integer columns and the list of exon
+    # boundaries (start and end of every exon)
+    def fields(self, idx):
+        ret = [self.string(idx, col) for col in range(STRINGS)]
+        for name in FIELDS:
+            ret.append(self.arrays[name][idx])
+        offsets = self.arrays['exonOffsets']
+        ret.append(self.arrays['exons'][offsets[idx]:offsets[idx + 1]].tolist())
+        return ret
+
+
+# Opening the compiled companion file of a transcript database, returns None if there is none or it is out of date.
+# With a gene or transcript list, the slim compiled file of the lists is opened instead; if build is True, it is
+# written first if it does not exist or is out of date (so that runs on a gene panel never read the other transcripts
+# again). Annotation processes open it with build False, the file being written once by the parent (see
+# prepareCompiled).
+def openCompiled(dbfile, genelist=(), transcriptlist=(), build=True):
+    key = listKey(genelist, transcriptlist)
+    fn = compiledFileName(dbfile, key)
+    compiled = None
+    if os.path.isfile(fn):
+        try:
+            compiled = CompiledDB(fn)
+        except (OSError, ValueError) as e:
+            if key is None or not build:
+                sys.stderr.write("CAVA: WARNING: cannot read compiled transcript database " + fn + ": " + str(e) + "\n")
+                return None
+        if compiled is not None and not compiled.matches(dbfile, key):
+            if key is None:
+                sys.stderr.write("CAVA: WARNING: compiled transcript database " + fn + " does not match " + dbfile +
+                                 ", not used (compile it again)\n")
+                return None
+            compiled = None
+    elif key is None:
+        return None
+    if compiled is None:
+        if not build:
+            return None
+        try:
+            compileDB(dbfile, fn, genelist, transcriptlist)
+            compiled = CompiledDB(fn)
+        except (OSError, ValueError) as e:
+            sys.stderr.write("CAVA: WARNING: cannot write compiled transcript database " + fn + ": " + str(e) + "\n")
+            return None
+    return compiled
+
+
+# Writing the slim compiled file of the gene and transcript lists (if any) unless it is up to date, before the
+# annotation processes are started
+def prepareCompiled(dbfile, genelist, transcriptlist):
+    if listKey(genelist, transcriptlist) is not None:
+        openCompiled(dbfile, genelist, transcriptlist)
+
+if __name__ == '__main__':
+    # Compiling the transcript database files given as arguments
+    for dbfile in sys.argv[1:]:
+        n = compileDB(dbfile)
+        print('Compiled ' + str(n) + ' transcripts of ' + dbfile + ' into ' + compiledFileName(dbfile))
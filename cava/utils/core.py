@@ -5,6 +5,7 @@
 #######################################################################################################################
 
 
+import bisect
 import gzip
 import logging
 import os
@@ -23,6 +24,7 @@ class Variant(object):
         vcf_ref = vcf_ref.upper()
         vcf_alt = vcf_alt.upper()
         self.chrom = chrom
+        self.contigid = CONTIGS.intern(chrom)  # see ContigRegistry
         self.id = chrom + ":" + str(pos) + ":" + vcf_ref + "/" + vcf_alt
         self.pos = pos
         self.vcf_padded_base = ''
@@ -156,7 +158,174 @@ class Variant(object):
             return self.alignonplus
         if self.chrom not in reference.reflens or not (self.is_insertion or self.is_deletion):
             [self.pos, self.ref, self.alt] = self.remove_same_bases_ref_alt()  # Trime redundant bases from SNP/MNP
-            self.alignononplus = self
+            self.alignonplus = self
+            return self
+        self.alignOnBothStrands(reference)
+        return self.alignonplus
+
+    # Aligning variant on the minus strand (left shift), so appropriate for variants on mimis strand.
+    def alignOnMinusStrand(self, reference):
+        if self.alignonminus is not None:
+            return self.alignonminus
+        if self.pos == 1 or (self.chrom not in reference.reflens or not (self.is_insertion or self.is_deletion)):
+            [self.pos, self.ref, self.alt] = self.remove_same_bases_ref_alt()
+            self.alignonminus = self
+            return self
+        self.alignOnBothStrands(reference)
+        return self.alignonminus
+
+    # Aligning an indel on both strands at once (same results as alignOnPlusStrandByTrimming and
+    # alignOnMinusStrandByTrimming), from one window of reference sequence around it. The shift is the length of the
+    # run of bases repeating the indel with its period, found by comparing the window with itself (and the inserted
+    # bases) in place; when the window is too short, only the missing flank is fetched and the comparison goes on.
+    def alignOnBothStrands(self, reference):
+        reflen = reference.reflens[self.chrom]
+        pos = self.pos
+        lenref = len(self.ref)
+        if pos + lenref - 1 > reflen:  # Deletion past the end of the chromosome
+            if self.alignonplus is None:
+                self.alignOnPlusStrandByTrimming(reference)
+            if self.alignonminus is None:
+                self.alignOnMinusStrandByTrimming(reference)
+            return
+        maxreplen = abs(lenref - len(self.alt))
+        # Window shifting to the right (alignOnPlusStrand), with the base before the variant if there is one
+        plus = self.alignonplus is None
+        PADLEN = max(100, 1 + 5 * maxreplen)
+        maxpos = min(pos + lenref - 1 + PADLEN, reflen)
+        EXTRA_PREBASE = 0 if pos == 1 else 1
+        start = pos - EXTRA_PREBASE
+        # Window shifting to the left (alignOnMinusStrand), unless the base before the variant cannot repeat it
+        minus = self.alignonminus is None
+        if minus and pos == 1:
+            self.alignonminus = self
+            minus = False
+        if minus and len(self.vcf_padded_base) > 0:
+            if self.vcf_padded_base[0] != (self.alt[-1] if self.is_insertion else self.ref[-1]):
+                self.alignonminus = self
+                minus = False
+        if not plus and not minus:
+            return
+        if minus:
+            PADLEN_MINUS = min(max(100, 1 + 5 * maxreplen), pos - 1)
+            start = min(start, pos - PADLEN_MINUS)
+        end = maxpos if plus else pos + lenref - 1
+        window = reference.getReference(self.chrom, start, end)
+        if plus:
+            self.alignonplus = self.shiftRight(reference, window, start, reflen)
+        if minus:
+            self.alignonminus = self.shiftLeft(reference, window[pos - PADLEN_MINUS - start:pos + lenref - start],
+                                               PADLEN_MINUS)
+
+    # Right shift of an indel (see alignOnBothStrands), from a window of reference sequence starting at start and
+    # reaching at least PADLEN bases after the variant
+    def shiftRight(self, reference, seq, seqstart, reflen):
+        pos = self.pos
+        lenref = len(self.ref)
+        maxreplen = abs(lenref - len(self.alt))
+        PADLEN = max(100, 1 + 5 * maxreplen)
+        maxpos = min(pos + lenref - 1 + PADLEN, reflen)
+        EXTRA_PREBASE = 0 if pos == 1 else 1
+        # Number of bases the indel shifts (left), at most the number of bases of the window after it (bound)
+        if self.is_deletion:
+            bound = maxpos - pos - lenref + 1
+            region = seq[pos - seqstart:maxpos - seqstart + 1]
+            left = commonPrefixLength(region[lenref:], region)
+        else:
+            bound = maxpos - pos + 1
+            region = seq[pos - seqstart:maxpos - seqstart + 1]
+            left = commonPrefixLength(region, self.alt)
+            if left == maxreplen:
+                left += commonPrefixLength(region[maxreplen:], region)
+        while left >= PADLEN - (maxreplen - 1) and maxpos != reflen:
+            # Shifted almost all the way to the end of the window
+            PADLEN += PADLEN
+            newmaxpos = min(pos + lenref - 1 + PADLEN, reflen)
+            if left == bound:
+                # Only the bases from the base before the shifted indel on are kept
+                cut = pos - EXTRA_PREBASE + left - seqstart
+                seq = seq[cut:] + reference.getReference(self.chrom, maxpos + 1, newmaxpos)
+                seqstart += cut
+                region = seq[pos + left - seqstart:]
+                if self.is_deletion:
+                    left += commonPrefixLength(region[lenref:], region)
+                else:
+                    # The inserted bases, as shifted so far, repeat on
+                    r = left % maxreplen
+                    more = commonPrefixLength(region, self.alt[r:] + self.alt[:r])
+                    if more == maxreplen:
+                        more += commonPrefixLength(region[maxreplen:], region)
+                    left += more
+            maxpos = newmaxpos
+            if self.is_deletion:
+                bound = maxpos - pos - lenref + 1
+            else:
+                bound = maxpos - pos + 1
+
+        base = seq[pos - 1 + left - seqstart] if EXTRA_PREBASE == 1 else ''
+        if self.is_deletion:
+            seq1, seq2 = base + seq[pos + left - seqstart:pos + left + lenref - seqstart], base
+        else:
+            r = left % maxreplen
+            seq1, seq2 = base, base + self.alt[r:] + self.alt[:r]
+        ret = Variant(self.chrom, pos + left - len(base), seq1, seq2)  # have to use VCF padded coordinates
+        ret.flags = self.flags
+        ret.flagvalues = self.flagvalues
+        return ret
+
+    # Left shift of an indel (see alignOnBothStrands), from the PADLEN bases of reference sequence before the variant
+    # followed by the deleted bases (seq)
+    def shiftLeft(self, reference, seq, PADLEN):
+        pos = self.pos
+        lenref = len(self.ref)
+        maxreplen = abs(lenref - len(self.alt))
+        seqstart = pos - PADLEN
+        # Number of bases the indel shifts (right), at most PADLEN
+        if self.is_deletion:
+            right = commonSuffixLength(seq, seq[:PADLEN], PADLEN)
+        else:
+            right = commonSuffixLength(seq, self.alt, min(maxreplen, PADLEN))
+            if right == maxreplen:
+                right += commonSuffixLength(seq[:PADLEN - maxreplen], seq, PADLEN - maxreplen)
+        left = PADLEN - right
+        while left <= maxreplen and pos - PADLEN > 0:
+            # Shifted all the way to the beginning of the window
+            NEWPADLEN = PADLEN + PADLEN
+            if pos - NEWPADLEN < 1:  # This will only occur for Mitochondria
+                NEWPADLEN = pos - 1
+            if NEWPADLEN == PADLEN:  # Shifted to the first base of the chromosome
+                break
+            if right == PADLEN:
+                # Only the bases up to one repeat unit after the shifted indel are kept
+                seq = reference.getReference(self.chrom, pos - NEWPADLEN, seqstart - 1) + \
+                    seq[:pos - 1 - right + maxreplen - seqstart + 1]
+                seqstart = pos - NEWPADLEN
+                right += commonSuffixLength(seq[:len(seq) - maxreplen], seq, NEWPADLEN - right)
+            PADLEN = NEWPADLEN
+            left = PADLEN - right
+
+        if left > 0:
+            base = seq[pos - right - 1 - seqstart]
+        else:
+            base = ''
+        if self.is_deletion:
+            seq1, seq2 = base + seq[pos - right - seqstart:pos - right + lenref - seqstart], base
+        else:
+            r = (-right) % maxreplen
+            seq1, seq2 = base, base + self.alt[r:] + self.alt[:r]
+        ret = Variant(self.chrom, pos - right - len(base), seq1, seq2)
+        ret.flags = self.flags
+        ret.flagvalues = self.flagvalues
+        return ret
+
+    # Aligning variant on the GENOMIC plus strand by trimming the padded sequences (original method, see
+    # alignOnBothStrands)
+    def alignOnPlusStrandByTrimming(self, reference):  # right shift, so appropriate for transcripts on plus strand.
+        if self.alignonplus is not None:
+            return self.alignonplus
+        if self.chrom not in reference.reflens or not (self.is_insertion or self.is_deletion):
+            [self.pos, self.ref, self.alt] = self.remove_same_bases_ref_alt()  # Trime redundant bases from SNP/MNP
+            self.alignonplus = self
             return self
         reflen = reference.reflens[self.chrom]
         maxreplen = abs(len(self.ref)-len(self.alt))
@@ -204,8 +373,8 @@ class Variant(object):
         self.alignonplus = ret
         return ret
 
-    # Aligning variant on the minus strand (left shift), so appropriate for variants on mimis strand.
-    def alignOnMinusStrand(self, reference):
+    # Aligning variant on the minus strand by trimming the padded sequences (original method, see alignOnBothStrands)
+    def alignOnMinusStrandByTrimming(self, reference):
         if self.alignonminus is not None:
             return self.alignonminus
         if self.pos == 1 or (self.chrom not in reference.reflens or not (self.is_insertion or self.is_deletion)):
@@ -445,7 +614,7 @@ class Record(object):
 
             # Filtering by BED file, if required
             if targetBED is not None and var is not None:
-                goodchrom = convert_chrom(var.chrom+"", targetBED.contigs)
+                goodchrom = targetBED.contigtable.name(var.contigid)
                 if goodchrom is None:
                     continue
                 if not var.is_insertion:
@@ -512,19 +681,11 @@ class Record(object):
                 else:
                     variant.addFlag('HGVSg', csn.get_genomic_Annotation(variant, self.build, reference))
 
-    # Writing record (a ref, multiple alts) to output file
-    def output(self, outformat, outfile, options, genelist, transcriptlist, snplist, stdout):
+    # Selecting the alt-allelic variants to be written to the output (and their original alts),
+    # removing non-annotated variants and filtering by gene, transcript or snp list, if required
+    def outputVariants(self, options, genelist, transcriptlist, snplist):
         outvariants = []
         outalts = []
-        build = "GRCh38"
-        if "build" in options.args:
-            build = options.args["build"]
-
-        # Values of Entries for Separate Alleles are separated by ','
-        # Entries for Multiple transcripts (for 1 allele) are separated by ':'
-        #  This allows each allele to have different transcripts
-        #  (for multiple allele, shifting may lead to different alleles in shifted vs non-shifted alt-alleles)
-
         for i in range(len(self.variants)):
             variant = self.variants[i]
             if variant is None:
@@ -557,6 +718,19 @@ class Record(object):
 
                 outvariants.append(variant)
                 outalts.append(self.alts[i])  # Original Alts.
+        return outvariants, outalts
+
+    # Writing record (a ref, multiple alts) to output file
+    def output(self, outformat, outfile, options, genelist, transcriptlist, snplist, stdout):
+        build = "GRCh38"
+        if "build" in options.args:
+            build = options.args["build"]
+
+        # Values of Entries for Separate Alleles are separated by ','
+        # Entries for Multiple transcripts (for 1 allele) are separated by ':'
+        #  This allows each allele to have different transcripts
+        #  (for multiple allele, shifting may lead to different alleles in shifted vs non-shifted alt-alleles)
+        outvariants, outalts = self.outputVariants(options, genelist, transcriptlist, snplist)
 
         # Skipping record if all alt-allelic variants have been removed
         if len(outvariants) == 0 or len(outalts)==1 and outalts[0].startswith("<"):
@@ -652,8 +826,7 @@ class Record(object):
                         #hgrepeats = repeats_list[ihg].split(":")
 
                         if not (len(hgtranscripts) == len(hggenes) and len(hgtranscripts) == len(hgcsns)):
-                            print("ERROR transcripts GENE and CSN not same length\n")
-                            print("--------------------------------------------------------------------\n")
+                            sys.stderr.write("CAVA: ERROR: transcripts GENE and CSN not same length\n")
                             if options.args['logfile']:
                                 logging.error("Bug: TRANSCRIPT GENE and CSN not same length\n")
                             sys.exit(1)
@@ -699,12 +872,11 @@ class Record(object):
                                         tHGVSP = '.'
                                         # Only report warning if transcript2protein mapping file was provided.
                                         if len(options.transcript2protein) > 0:
-                                            print(
-                                                "WARNING: transcript " + hgtranscript + " not in transcript2protein "
-                                                                                        "file, HGVSp will be invalid\n")
-                                            print(
-                                                "--------------------------------------------------------------------"
-                                                "\n")
+                                            # Written to standard error, standard output may be the annotated
+                                            # output of the streaming engine
+                                            sys.stderr.write(
+                                                "CAVA: WARNING: transcript " + hgtranscript + " not in "
+                                                "transcript2protein file, HGVSp will be invalid\n")
                                             if options.args['logfile']:
                                                 logging.info(
                                                     "WARNING: transcript " + hgtranscript + " not in transcript2protein"
@@ -796,8 +968,8 @@ class Record(object):
                         csn_list = variant.flagvalues[flags.index('CSN')].split(":")
                     else:
                         if len(transcripts_list) > 0:
-                            print("ERROR: transcript " + transcripts_list[0] + " has no matching GENE and/or CSN\n")
-                            print("--------------------------------------------------------------------\n")
+                            sys.stderr.write("CAVA: ERROR: transcript " + transcripts_list[0] +
+                                             " has no matching GENE and/or CSN\n")
                             if options.args['logfile']:
                                 logging.info(
                                     "ERROR: transcript " + transcripts_list[0] + " has no matching GENE and/or CSN\n")
@@ -836,38 +1008,7 @@ class Record(object):
                         HGVSC = 'None'
                         HGVSP = 'None'
                     else:
-                        hgtranscript = transcripts_list[i]
-                        if len(hgtranscript) == 0 or hgtranscript == '.':
-                            HGVSC = '.(.):'
-                        else:
-                            HGVSC = contig + '(' + hgtranscript + '):'
-                        try:
-                            cdna, prot = csn_list[i].split('_p.')
-                            prot = prot.replace('X', "Ter")
-                        except ValueError:  # Example c.802-51_802-14del38, splice
-                            cdna = csn_list[i]
-                            prot = '.'
-                        HGVSC += cdna
-                        if len(cdna)==0 or cdna == '.' or HGVSC == '.(.):.' or HGVSC == '():' or HGVSC == '.(.):':
-                            HGVSC = '.'
-                        if prot == '.' or prot == '':
-                            HGVSP = '.'
-                        else:
-                            # Get Protein matching Transcript from options
-                            if hgtranscript in options.transcript2protein:
-                                protid = options.transcript2protein[hgtranscript]
-                                HGVSP = protid + ':p.(' + prot + ')'
-                            else:
-                                #                                HGVSP=hgtranscript+':p.('+prot+')'
-                                HGVSP = '.'  # If user wants HGVSP, they can always look in the CSN... but don't want to provide incorrect HGVSP
-                                if len(
-                                        options.transcript2protein) > 0:  # Only report warning if transcript2protein mapping file was provided.
-                                    print(
-                                        "WARNING: transcript " + hgtranscript + " not in transcript2protein file, HGVSp will be invalid\n")
-                                    print("--------------------------------------------------------------------\n")
-                                    if options.args['logfile']:
-                                        logging.info(
-                                            "WARNING: transcript " + hgtranscript + " not in transcript2protein file\n")
+                        HGVSC, HGVSP = transcriptHGVS(contig, transcripts_list[i], csn_list[i], options)
                     # Writing record to the output file
                     if stdout:
                         print(record + rest + "\t" + HGVSC + "\t" + HGVSP )
@@ -877,6 +1018,44 @@ class Record(object):
                 c += 1
 
 
+# HGVSc and HGVSp annotation of a transcript, from its CSN annotation (as in the TSV output)
+def transcriptHGVS(contig, hgtranscript, csnval, options):
+    if len(hgtranscript) == 0 or hgtranscript == '.':
+        HGVSC = '.(.):'
+    else:
+        HGVSC = contig + '(' + hgtranscript + '):'
+    try:
+        cdna, prot = csnval.split('_p.')
+        prot = prot.replace('X', "Ter")
+    except ValueError:  # Example c.802-51_802-14del38, splice
+        cdna = csnval
+        prot = '.'
+    HGVSC += cdna
+    if len(cdna)==0 or cdna == '.' or HGVSC == '.(.):.' or HGVSC == '():' or HGVSC == '.(.):':
+        HGVSC = '.'
+    if prot == '.' or prot == '':
+        HGVSP = '.'
+    else:
+        # Get Protein matching Transcript from options
+        if hgtranscript in options.transcript2protein:
+            protid = options.transcript2protein[hgtranscript]
+            HGVSP = protid + ':p.(' + prot + ')'
+        else:
+            #                                HGVSP=hgtranscript+':p.('+prot+')'
+            HGVSP = '.'  # If user wants HGVSP, they can always look in the CSN... but don't want to provide incorrect HGVSP
+            if len(
+                    options.transcript2protein) > 0:  # Only report warning if transcript2protein mapping file was provided.
+                # Written to standard error, as standard output may be the annotated output (or the caller's, when
+                # used through the in-process API)
+                sys.stderr.write(
+                    "CAVA: WARNING: transcript " + hgtranscript + " not in transcript2protein file, HGVSp will be "
+                                                                  "invalid\n")
+                if options.args['logfile']:
+                    logging.info(
+                        "WARNING: transcript " + hgtranscript + " not in transcript2protein file\n")
+    return HGVSC, HGVSP
+
+
 #######################################################################################################################
 class Tr_store:
     lasttr = dict
@@ -884,27 +1063,41 @@ class Tr_store:
 # Class representing a single Ensembl transcript
 # noinspection PyUnresolvedReferences
 class Transcript(object):
-    # Constructor
-    def __init__(self, line):
-        self.exons = []
+    # Constructor (from a line of the transcript database, or from the values of its columns, see setFields())
+    def __init__(self, line=None):
+        if line is None:
+            return
         cols = line.split('\t')
-        self.TRANSCRIPT = cols[0]
-        self.geneSymbol = cols[1]
-        self.geneID = cols[2]
-        self.TRINFO = cols[3]
-        self.chrom = cols[4]
-        self.strand = int(cols[5])
-        self.transcriptStart = int(cols[6])  # 0-based, lowest coordinate if first exon
-        self.transcriptEnd = int(cols[7])   # 1-bases upper coordinate
-        self.codingStart = int(cols[8])  # in cDNA coordinated (1st base is 1)
-        self.codingStartGenomic = int(cols[9])# coding start genomic 1-based
-        self.codingEndGenomic = int(cols[10])# coding end genomic 1-based (includes stop codon)
+        exonbounds = []
+        for i in range(1, len(cols) - 11, 2):
+            exonbounds.append(int(cols[10 + i]))
+            exonbounds.append(int(cols[11 + i]))
+        self.setFields(cols[0], cols[1], cols[2], cols[3], cols[4], int(cols[5]), int(cols[6]), int(cols[7]),
+                       int(cols[8]), int(cols[9]), int(cols[10]), exonbounds)
+
+    # Setting the values of the columns of the transcript database (exonbounds is the list of exon starts and ends)
+    def setFields(self, TRANSCRIPT, geneSymbol, geneID, TRINFO, chrom, strand, transcriptStart, transcriptEnd,
+                  codingStart, codingStartGenomic, codingEndGenomic, exonbounds):
+        self.exons = []
+        self.TRANSCRIPT = TRANSCRIPT
+        self.geneSymbol = geneSymbol
+        self.geneID = geneID
+        self.TRINFO = TRINFO
+        self.chrom = chrom
+        self.strand = strand
+        self.transcriptStart = transcriptStart  # 0-based, lowest coordinate if first exon
+        self.transcriptEnd = transcriptEnd   # 1-bases upper coordinate
+        self.codingStart = codingStart  # in cDNA coordinated (1st base is 1)
+        self.codingStartGenomic = codingStartGenomic # coding start genomic 1-based
+        self.codingEndGenomic = codingEndGenomic # coding end genomic 1-based (includes stop codon)
         self.is_selenocysteine = False
         # Initializing and adding exons
-        for i in range(1, len(cols) - 11, 2):
-            self.exons.append(Exon(int((i + 1) / 2), int(cols[10 + i]), int(cols[11 + i])))   # Start is 0-based, ENd is 1-based -- like a bed file
+        for i in range(0, len(exonbounds) - 1, 2):
+            self.exons.append(Exon(i // 2 + 1, exonbounds[i], exonbounds[i + 1]))   # Start is 0-based, ENd is 1-based -- like a bed file
         self.three_prime_len = 0
         self.exonseqs = None  # list of the exons for the reference sequence
+        self.reftranslation = None  # translation of the reference coding sequence, see translateAlternate
+        self.exonindex = None  # sorted exon boundaries, see exonIndex
         self.cds_len = 0
         foundStart = False
         for ex in self.exons:
@@ -1228,17 +1421,62 @@ class Transcript(object):
             # most have name SELENO* so cannot remove the "X" .. must trust the annotation
             #
             # DIO1,DIO2,DIO3,GPX1,GPX2,GPX3,GPX4,GPX6,SELENO[F,H,I,K,M,N,O,P,S,T,U,V,W],MSRB1,SEPHS2,TXNRD1,TXNRD2,TXNRD3
-            ret = Sequence(codingsequencealt).translate('7')
+            ret = self.translateAlternate(codingsequencealt, transcript_seq, variant, '7')
             if variant is None and ret[-1] == 'X':
                 ret = ret[0:(len(ret)-1)] + 'X'
         elif self.chrom in ['chrM','chrMT' , 'M','MT']: # No selenocysteine genes in mitochondrion genome
-            ret = Sequence(codingsequencealt).translate('4')
+            ret = self.translateAlternate(codingsequencealt, transcript_seq, variant, '4')
         else:
-            ret = Sequence(codingsequencealt).translate(codon_usage)
+            ret = self.translateAlternate(codingsequencealt, transcript_seq, variant, codon_usage)
         ret = trim_prot_after_stop(ret)  # trim end, keeping from start to and including the first X (if any)
 
         return ret, exonseqalt, codingsequencealt[0:3*len(ret)]
 
+    # Translating the coding sequence with the variant included (codingsequencealt, from the start codon to the end of
+    # the transcript), up to and including the first stop codon. Only the codons differing from the reference
+    # sequence (transcript_seq) are translated: the codons upstream of the first changed base and, for in-frame changes,
+    # the codons downstream of the last changed base are taken from the translation of the reference sequence, kept in
+    # self.reftranslation. For frameshifts only the codons from the first changed base to the first stop are translated.
+    def translateAlternate(self, codingsequencealt, transcript_seq, variant, letter):
+        if variant is None:
+            return Sequence(codingsequencealt).translate(letter)
+        refcoding = transcript_seq[self.codingStart - 1:]
+        if self.reftranslation is None or self.reftranslation[0] != letter or self.reftranslation[1] != refcoding:
+            codons = Sequence(refcoding).translateCodons(letter)
+            offsets = [0]  # offsets of the codons in the protein (amino acids can have more than one letter)
+            for aa in codons:
+                offsets.append(offsets[-1] + len(aa))
+            stops = [j for j in range(len(codons)) if codons[j] == 'X']
+            self.reftranslation = (letter, refcoding, ''.join(codons), offsets, stops)
+        (_, _, protein, offsets, stops) = self.reftranslation
+
+        # First codon changed by the variant, the reference protein is kept if it stops before
+        first = commonPrefixLength(codingsequencealt, refcoding) // 3
+        if len(stops) > 0 and stops[0] < first:
+            return protein[0:offsets[stops[0] + 1]]
+        ret = protein[0:offsets[first]]
+
+        delta = len(codingsequencealt) - len(refcoding)
+        if delta % 3 != 0:
+            return ret + ''.join(Sequence(codingsequencealt).translateCodons(letter, first, True))
+
+        # In-frame change: codons from the first codon entirely in the unchanged 3' end are the reference codons
+        # shifted by delta / 3
+        suffix = commonSuffixLength(codingsequencealt, refcoding, min(len(codingsequencealt), len(refcoding)) -
+                                    3 * first)
+        last = (len(codingsequencealt) - suffix + 2) // 3
+        middle = Sequence(codingsequencealt[3 * first:3 * last]).translateCodons(letter, 0, True)
+        ret += ''.join(middle)
+        if len(middle) > 0 and middle[-1] == 'X':
+            return ret
+        refidx = last - delta // 3
+        if refidx >= len(offsets) - 1:
+            return ret
+        k = bisect.bisect_left(stops, refidx)
+        if k < len(stops):
+            return ret + protein[offsets[refidx]:offsets[stops[k] + 1]]
+        return ret + protein[offsets[refidx]:]
+
     # Checking if a given position is outside the region between the start and stop codon
     # don't take account of insertion .. should be dealth with by calling function
     def isPositionOutsideCDS(self, pos):
@@ -1371,6 +1609,30 @@ class Transcript(object):
     # Checking where a given genomic position is located in the transcript
     # already adjusted for introns .. because whereIsThisVariant adjusts position
     def whereIsThisPosition(self, pos): # pos is 1-based
+        exonindex = self.exonIndex()
+        if exonindex is None:
+            return self.whereIsThisPositionByExonWalk(pos)
+
+        # Locating the genomic position in the sorted exon boundaries
+        (i, inexon) = exonindex.locate(pos)
+        if i is None:
+            return '.'
+        exon = self.exons[i]
+        if not inexon:
+            if self.intronLength(exon.index) > 5 or self.intronLength(exon.index) == 3:
+                return 'In' + str(exon.index - 1) + '/' + str(exon.index)
+            else:
+                return 'fsIn' + str(exon.index - 1) + '/' + str(exon.index)
+        if (self.strand == 1 and pos < self.codingStartGenomic) or (
+                self.strand == -1 and pos > self.codingStartGenomic):
+            return '5UTR'
+        if (self.strand == 1 and pos > self.codingEndGenomic) or (
+                self.strand == -1 and pos < self.codingEndGenomic):
+            return '3UTR'
+        return 'Ex' + str(exon.index)
+
+    # Same as whereIsThisPosition, walking the exons (used if the exons are not sorted)
+    def whereIsThisPositionByExonWalk(self, pos): # pos is 1-based
         # Iterating through exons and introns and checking if genomic position is located within
 
         for exon in self.exons:
@@ -1424,19 +1686,71 @@ class Transcript(object):
 
     # Getting the length of an intron, where idx is the index of the succeeding exon
     def intronLength(self, idx):
-        if idx <= 0:
+        if idx <= 1 or idx > len(self.exons):
             return 0
-        for exon in self.exons:
-            if exon.index == idx:
-                if self.strand == 1:
-                    return exon.start - prev
-                else:
-                    return prev - exon.end
-            if self.strand == 1:
-                prev = exon.end
-            else:
-                prev = exon.start
-        return 0
+        if self.strand == 1:
+            return self.exons[idx - 1].start - self.exons[idx - 2].end
+        else:
+            return self.exons[idx - 2].start - self.exons[idx - 1].end
+
+    # Sorted exon boundaries and cumulative exon lengths of the transcript (computed at first use), None if the exons
+    # are not sorted and disjoint
+    def exonIndex(self):
+        if self.exonindex is None:
+            self.exonindex = ExonIndex(self.exons, self.strand)
+        if not self.exonindex.sorted:
+            return None
+        return self.exonindex
+
+
+#######################################################################################################################
+
+# Class representing the exons of a transcript as sorted arrays of their genomic boundaries and of the cumulative exon
+# lengths, so that a position is located in the exons and introns with a binary search
+class ExonIndex(object):
+    # Constructor (exons in transcript order, as in Transcript.exons)
+    def __init__(self, exons, strand):
+        self.strand = strand
+        genomic = exons if strand == 1 else exons[::-1]
+        self.bounds = []  # start and end of every exon in genomic order
+        for exon in genomic:
+            self.bounds.append(exon.start)
+            self.bounds.append(exon.end)
+        self.sorted = all(self.bounds[k] <= self.bounds[k + 1] for k in range(len(self.bounds) - 1))
+        self.starts = self.bounds[0::2]
+        self.ends = self.bounds[1::2]
+        # Sum of the lengths of the exons before every exon, in transcript and in genomic order
+        self.offsets = [0]
+        for exon in exons:
+            self.offsets.append(self.offsets[-1] + exon.length)
+        self.genomicOffsets = [0]
+        for exon in genomic:
+            self.genomicOffsets.append(self.genomicOffsets[-1] + exon.length)
+
+    # Locating a genomic position (1-based), returns the index (in transcript order) of the exon containing it and True,
+    # or the index of the exon succeeding the intron containing it and False, or (None, False) if outside the exons
+    def locate(self, pos):
+        k = bisect.bisect_left(self.bounds, pos) - 1
+        if k < 0 or k >= len(self.bounds) - 1:
+            return None, False
+        if k % 2 == 0:
+            i = k // 2
+            inexon = True
+        else:
+            i = k // 2 + 1
+            inexon = False
+        if self.strand == -1:
+            i = len(self.starts) - 1 - i
+            if not inexon:
+                i += 1
+        return i, inexon
+
+    # Number of exonic bases at or before a genomic position (1-based)
+    def exonicBases(self, pos):
+        j = bisect.bisect_left(self.starts, pos)
+        if j == 0:
+            return 0
+        return self.genomicOffsets[j - 1] + min(pos, self.ends[j - 1]) - self.starts[j - 1]
 
 
 #######################################################################################################################
@@ -1456,133 +1770,220 @@ class Exon(object):
 
 #######################################################################################################################
 
+# Genetic codes (amino acid of every codon), by value of @codon_usage
+GENETIC_CODES = dict()
+GENETIC_CODES['1'] = {
+    'ATA': 'I', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
+    'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
+    'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
+    'AGC': 'S', 'AGT': 'S', 'AGA': 'R', 'AGG': 'R',
+    'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
+    'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
+    'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
+    'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
+    'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
+    'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
+    'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
+    'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
+    'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
+    'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
+    'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
+    'TGC': 'C', 'TGT': 'C', 'TGA': 'X', 'TGG': 'W'}
+# 3-letter code version of 1 (Human)
+GENETIC_CODES['3'] = {
+    'ATA': 'Ile', 'ATC': 'Ile', 'ATT': 'Ile', 'ATG': 'Met',
+    'ACA': 'Thr', 'ACC': 'Thr', 'ACG': 'Thr', 'ACT': 'Thr',
+    'AAC': 'Asn', 'AAT': 'Asn', 'AAA': 'Lys', 'AAG': 'Lys',
+    'AGC': 'Ser', 'AGT': 'Ser', 'AGA': 'Arg', 'AGG': 'Arg',
+    'CTA': 'Leu', 'CTC': 'Leu', 'CTG': 'Leu', 'CTT': 'Leu',
+    'CCA': 'Pro', 'CCC': 'Pro', 'CCG': 'Pro', 'CCT': 'Pro',
+    'CAC': 'His', 'CAT': 'His', 'CAA': 'Gln', 'CAG': 'Gln',
+    'CGA': 'Arg', 'CGC': 'Arg', 'CGG': 'Arg', 'CGT': 'Arg',
+    'GTA': 'Val', 'GTC': 'Val', 'GTG': 'Val', 'GTT': 'Val',
+    'GCA': 'Ala', 'GCC': 'Ala', 'GCG': 'Ala', 'GCT': 'Ala',
+    'GAC': 'Asp', 'GAT': 'Asp', 'GAA': 'Glu', 'GAG': 'Glu',
+    'GGA': 'Gly', 'GGC': 'Gly', 'GGG': 'Gly', 'GGT': 'Gly',
+    'TCA': 'Ser', 'TCC': 'Ser', 'TCG': 'Ser', 'TCT': 'Ser',
+    'TTC': 'Phe', 'TTT': 'Phe', 'TTA': 'Leu', 'TTG': 'Leu',
+    'TAC': 'Tyr', 'TAT': 'Tyr', 'TAA': 'X', 'TAG': 'X',
+    'TGC': 'Cys', 'TGT': 'Cys', 'TGA': 'X', 'TGG': 'Trp'}
+# Mitochondrgenetic code for vertebrates
+GENETIC_CODES['4'] = {
+    'ATA': 'M', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
+    'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
+    'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
+    'AGC': 'S', 'AGT': 'S', 'AGA': 'X', 'AGG': 'X',
+    'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
+    'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
+    'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
+    'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
+    'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
+    'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
+    'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
+    'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
+    'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
+    'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
+    'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
+    'TGC': 'C', 'TGT': 'C', 'TGA': 'W', 'TGG': 'W'}
+# 3-letter version of Mitochondria
+GENETIC_CODES['5'] = {
+    'AAA': 'K', 'AAC': 'N', 'AAG': 'K', 'AAT': 'N',
+    'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
+    'AGA': 'R', 'AGC': 'S', 'AGG': 'R', 'AGT': 'S',
+    'ATA': 'I', 'ATC': 'I', 'ATG': 'M', 'ATT': 'I',
+    'CAA': 'Q', 'CAC': 'H', 'CAG': 'Q', 'CAT': 'H',
+    'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
+    'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
+    'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
+    'GAA': 'E', 'GAC': 'D', 'GAG': 'E', 'GAT': 'D',
+    'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
+    'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
+    'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
+    'TAA': 'X', 'TAC': 'Y', 'TAG': 'X', 'TAT': 'Y',
+    'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
+    'TGA': 'X', 'TGC': 'C', 'TGG': 'W', 'TGT': 'C',
+    'TTA': 'L', 'TTC': 'F', 'TTG': 'L', 'TTT': 'F'}
+# Human genome for one of the 25 selenoproteins (TAG is Se-Cys (U/Sec)
+GENETIC_CODES['7'] = {
+    'ATA': 'I', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
+    'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
+    'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
+    'AGC': 'S', 'AGT': 'S', 'AGA': 'R', 'AGG': 'R',
+    'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
+    'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
+    'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
+    'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
+    'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
+    'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
+    'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
+    'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
+    'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
+    'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
+    'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
+    'TGC': 'C', 'TGT': 'C', 'TGA': 'U', 'TGG': 'W'}
+# 3-letter code version of 1 (Human) with SelenoCysteinr for ATG
+GENETIC_CODES['8'] = {
+    'ATA': 'Ile', 'ATC': 'Ile', 'ATT': 'Ile', 'ATG': 'Met',
+    'ACA': 'Thr', 'ACC': 'Thr', 'ACG': 'Thr', 'ACT': 'Thr',
+    'AAC': 'Asn', 'AAT': 'Asn', 'AAA': 'Lys', 'AAG': 'Lys',
+    'AGC': 'Ser', 'AGT': 'Ser', 'AGA': 'Arg', 'AGG': 'Arg',
+    'CTA': 'Leu', 'CTC': 'Leu', 'CTG': 'Leu', 'CTT': 'Leu',
+    'CCA': 'Pro', 'CCC': 'Pro', 'CCG': 'Pro', 'CCT': 'Pro',
+    'CAC': 'His', 'CAT': 'His', 'CAA': 'Gln', 'CAG': 'Gln',
+    'CGA': 'Arg', 'CGC': 'Arg', 'CGG': 'Arg', 'CGT': 'Arg',
+    'GTA': 'Val', 'GTC': 'Val', 'GTG': 'Val', 'GTT': 'Val',
+    'GCA': 'Ala', 'GCC': 'Ala', 'GCG': 'Ala', 'GCT': 'Ala',
+    'GAC': 'Asp', 'GAT': 'Asp', 'GAA': 'Glu', 'GAG': 'Glu',
+    'GGA': 'Gly', 'GGC': 'Gly', 'GGG': 'Gly', 'GGT': 'Gly',
+    'TCA': 'Ser', 'TCC': 'Ser', 'TCG': 'Ser', 'TCT': 'Ser',
+    'TTC': 'Phe', 'TTT': 'Phe', 'TTA': 'Leu', 'TTG': 'Leu',
+    'TAC': 'Tyr', 'TAT': 'Tyr', 'TAA': 'X', 'TAG': 'X',
+    'TGC': 'Cys', 'TGT': 'Cys', 'TGA': 'Sec', 'TGG': 'Trp'}
+
+# Length (in bases) of the blocks translated when looking for the first stop codon
+TRANSLATION_BLOCK = 192
+
+# Counters of the translations done by the process (calls, codons translated and time spent)
+TRANSLATION_STATS = {'calls': 0, 'codons': 0, 'seconds': 0.0}
+
+# Compiled translation tables, by value of @codon_usage
+TRANSLATION_TABLES = dict()
+
+
+# Dictionary of the amino acids of codons (or pairs of codons) returning '?' for unknown codons (e.g. with N)
+class CodonLookup(dict):
+    # Constructor (codons is the lookup of single codons, for dictionaries of pairs of codons)
+    def __init__(self, values, codons=None):
+        dict.__init__(self, values)
+        self.codons = codons
+
+    def __missing__(self, key):
+        if self.codons is None:
+            return '?'
+        return self.codons[key[0:3]] + self.codons[key[3:6]]
+
+
+# Class representing a compiled genetic code: the amino acid of every codon and of every pair of codons, so that whole
+# sequences are translated six bases at a time without a Python loop
+class TranslationTable(object):
+    # Constructor
+    def __init__(self, gencode):
+        self.codons = CodonLookup(gencode)
+        pairs = dict()
+        for (codon1, aa1) in gencode.items():
+            for (codon2, aa2) in gencode.items():
+                pairs[codon1 + codon2] = aa1 + aa2
+        self.pairs = CodonLookup(pairs, self.codons)
+
+    # List of the amino acids of the (complete) codons of a sequence
+    def codonList(self, seq):
+        it = iter(seq)
+        return list(map(self.codons.__getitem__, map(''.join, zip(it, it, it))))
+
+    # Protein sequence of the (complete) codons of a sequence
+    def translate(self, seq):
+        it = iter(seq)
+        ret = ''.join(map(self.pairs.__getitem__, map(''.join, zip(it, it, it, it, it, it))))
+        rest = len(seq) % 6
+        if rest >= 3:
+            ret += self.codons[seq[len(seq) - rest:len(seq) - rest + 3]]
+        return ret
+
+
+# Compiled translation table of a genetic code (unknown codes translate every codon as '?')
+def translationTable(letter):
+    if letter not in TRANSLATION_TABLES:
+        TRANSLATION_TABLES[letter] = TranslationTable(GENETIC_CODES.get(letter, dict()))
+    return TRANSLATION_TABLES[letter]
+
+
+# Counting a translation of the given number of codons started at starttime (time.perf_counter)
+def countTranslation(codons, starttime):
+    TRANSLATION_STATS['calls'] += 1
+    TRANSLATION_STATS['codons'] += codons
+    TRANSLATION_STATS['seconds'] += time.perf_counter() - starttime
+
+
+# Counters of the translations done by the process
+def translationStats():
+    return dict(TRANSLATION_STATS)
+
+
+# Counters of the translations done by the process as a string (for the log file)
+def translationStatsString():
+    return 'Translation: ' + str(TRANSLATION_STATS['calls']) + ' calls, ' + str(TRANSLATION_STATS['codons']) + \
+        ' codons, ' + '{:.3f}'.format(TRANSLATION_STATS['seconds']) + ' s'
+
+
 # Class representing a DNA sequence, inherits from str class
 class Sequence(str):
     # Translating to amino acid sequence
     def translate(self, letter):
-        gencode = {}
-        if letter == '1':
-            gencode = {
-                'ATA': 'I', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
-                'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
-                'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
-                'AGC': 'S', 'AGT': 'S', 'AGA': 'R', 'AGG': 'R',
-                'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
-                'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
-                'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
-                'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
-                'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
-                'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
-                'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
-                'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
-                'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
-                'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
-                'TGC': 'C', 'TGT': 'C', 'TGA': 'X', 'TGG': 'W'}
-        elif letter == '3': # 3-letter code version of 1 (Human)
-            gencode = {
-                'ATA': 'Ile', 'ATC': 'Ile', 'ATT': 'Ile', 'ATG': 'Met',
-                'ACA': 'Thr', 'ACC': 'Thr', 'ACG': 'Thr', 'ACT': 'Thr',
-                'AAC': 'Asn', 'AAT': 'Asn', 'AAA': 'Lys', 'AAG': 'Lys',
-                'AGC': 'Ser', 'AGT': 'Ser', 'AGA': 'Arg', 'AGG': 'Arg',
-                'CTA': 'Leu', 'CTC': 'Leu', 'CTG': 'Leu', 'CTT': 'Leu',
-                'CCA': 'Pro', 'CCC': 'Pro', 'CCG': 'Pro', 'CCT': 'Pro',
-                'CAC': 'His', 'CAT': 'His', 'CAA': 'Gln', 'CAG': 'Gln',
-                'CGA': 'Arg', 'CGC': 'Arg', 'CGG': 'Arg', 'CGT': 'Arg',
-                'GTA': 'Val', 'GTC': 'Val', 'GTG': 'Val', 'GTT': 'Val',
-                'GCA': 'Ala', 'GCC': 'Ala', 'GCG': 'Ala', 'GCT': 'Ala',
-                'GAC': 'Asp', 'GAT': 'Asp', 'GAA': 'Glu', 'GAG': 'Glu',
-                'GGA': 'Gly', 'GGC': 'Gly', 'GGG': 'Gly', 'GGT': 'Gly',
-                'TCA': 'Ser', 'TCC': 'Ser', 'TCG': 'Ser', 'TCT': 'Ser',
-                'TTC': 'Phe', 'TTT': 'Phe', 'TTA': 'Leu', 'TTG': 'Leu',
-                'TAC': 'Tyr', 'TAT': 'Tyr', 'TAA': 'X', 'TAG': 'X',
-                'TGC': 'Cys', 'TGT': 'Cys', 'TGA': 'X', 'TGG': 'Trp'}
-        elif letter == '4': # Mitochondrgenetic code for vertebrates
-            gencode = {
-                'ATA': 'M', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
-                'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
-                'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
-                'AGC': 'S', 'AGT': 'S', 'AGA': 'X', 'AGG': 'X',
-                'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
-                'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
-                'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
-                'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
-                'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
-                'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
-                'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
-                'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
-                'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
-                'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
-                'TGC': 'C', 'TGT': 'C', 'TGA': 'W', 'TGG': 'W'}
-        elif letter == '5': # 3-letter version of Mitochondria
-            gencode = {
-                'AAA': 'K', 'AAC': 'N', 'AAG': 'K', 'AAT': 'N',
-                'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
-                'AGA': 'R', 'AGC': 'S', 'AGG': 'R', 'AGT': 'S',
-                'ATA': 'I', 'ATC': 'I', 'ATG': 'M', 'ATT': 'I',
-                'CAA': 'Q', 'CAC': 'H', 'CAG': 'Q', 'CAT': 'H',
-                'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
-                'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
-                'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
-                'GAA': 'E', 'GAC': 'D', 'GAG': 'E', 'GAT': 'D',
-                'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
-                'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
-                'TAA': 'X', 'TAC': 'Y', 'TAG': 'X', 'TAT': 'Y',
-                'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
-                'TGA': 'X', 'TGC': 'C', 'TGG': 'W', 'TGT': 'C',
-                'TTA': 'L', 'TTC': 'F', 'TTG': 'L', 'TTT': 'F'}
-        elif letter == '7': # Human genome for one of the 25 selenoproteins (TAG is Se-Cys (U/Sec)
-            gencode = {
-                'ATA': 'I', 'ATC': 'I', 'ATT': 'I', 'ATG': 'M',
-                'ACA': 'T', 'ACC': 'T', 'ACG': 'T', 'ACT': 'T',
-                'AAC': 'N', 'AAT': 'N', 'AAA': 'K', 'AAG': 'K',
-                'AGC': 'S', 'AGT': 'S', 'AGA': 'R', 'AGG': 'R',
-                'CTA': 'L', 'CTC': 'L', 'CTG': 'L', 'CTT': 'L',
-                'CCA': 'P', 'CCC': 'P', 'CCG': 'P', 'CCT': 'P',
-                'CAC': 'H', 'CAT': 'H', 'CAA': 'Q', 'CAG': 'Q',
-                'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R',
-                'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V',
-                'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A',
-                'GAC': 'D', 'GAT': 'D', 'GAA': 'E', 'GAG': 'E',
-                'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S',
-                'TTC': 'F', 'TTT': 'F', 'TTA': 'L', 'TTG': 'L',
-                'TAC': 'Y', 'TAT': 'Y', 'TAA': 'X', 'TAG': 'X',
-                'TGC': 'C', 'TGT': 'C', 'TGA': 'U', 'TGG': 'W'}
-        elif letter == '8': # 3-letter code version of 1 (Human) with SelenoCysteinr for ATG
-            gencode = {
-                'ATA': 'Ile', 'ATC': 'Ile', 'ATT': 'Ile', 'ATG': 'Met',
-                'ACA': 'Thr', 'ACC': 'Thr', 'ACG': 'Thr', 'ACT': 'Thr',
-                'AAC': 'Asn', 'AAT': 'Asn', 'AAA': 'Lys', 'AAG': 'Lys',
-                'AGC': 'Ser', 'AGT': 'Ser', 'AGA': 'Arg', 'AGG': 'Arg',
-                'CTA': 'Leu', 'CTC': 'Leu', 'CTG': 'Leu', 'CTT': 'Leu',
-                'CCA': 'Pro', 'CCC': 'Pro', 'CCG': 'Pro', 'CCT': 'Pro',
-                'CAC': 'His', 'CAT': 'His', 'CAA': 'Gln', 'CAG': 'Gln',
-                'CGA': 'Arg', 'CGC': 'Arg', 'CGG': 'Arg', 'CGT': 'Arg',
-                'GTA': 'Val', 'GTC': 'Val', 'GTG': 'Val', 'GTT': 'Val',
-                'GCA': 'Ala', 'GCC': 'Ala', 'GCG': 'Ala', 'GCT': 'Ala',
-                'GAC': 'Asp', 'GAT': 'Asp', 'GAA': 'Glu', 'GAG': 'Glu',
-                'GGA': 'Gly', 'GGC': 'Gly', 'GGG': 'Gly', 'GGT': 'Gly',
-                'TCA': 'Ser', 'TCC': 'Ser', 'TCG': 'Ser', 'TCT': 'Ser',
-                'TTC': 'Phe', 'TTT': 'Phe', 'TTA': 'Leu', 'TTG': 'Leu',
-                'TAC': 'Tyr', 'TAT': 'Tyr', 'TAA': 'X', 'TAG': 'X',
-                'TGC': 'Cys', 'TGT': 'Cys', 'TGA': 'Sec', 'TGG': 'Trp'}
-        ret_list = []
-        index = 0
-        while index + 3 <= len(self):
-            #codon = self[index:index + 3].upper()   # Upper is not necessary .. it is done in Referenge.getReference
-            codon = self[index:index + 3]
-# SLOWEST line of code.           if codon.replace('A', '').replace('C', '').replace('G', '').replace('T', ''):
-            if codon not in gencode:
-                # if 'N' in codon:
-                ret_list.append('?')
-                index += 3
-                continue
-            ret_list.append(gencode[codon])
-            index += 3
-        return ''.join(ret_list)
+        starttime = time.perf_counter()
+        ret = translationTable(letter).translate(self)
+        countTranslation(len(self) // 3, starttime)
+        return ret
+
+    # Translating to the list of amino acids of the codons, starting from codon first (0-based) and stopping after the
+    # first stop codon if tostop is True
+    def translateCodons(self, letter, first=0, tostop=False):
+        starttime = time.perf_counter()
+        table = translationTable(letter)
+        if not tostop:
+            ret_list = table.codonList(self[3 * first:])
+        else:
+            # Translating blocks of codons until a stop codon is found
+            ret_list = []
+            index = 3 * first
+            while index + 3 <= len(self):
+                block = table.codonList(self[index:index + TRANSLATION_BLOCK])
+                if 'X' in block:
+                    ret_list += block[0:block.index('X') + 1]
+                    break
+                ret_list += block
+                index += TRANSLATION_BLOCK
+        countTranslation(len(ret_list), starttime)
+        return ret_list
 
     # Getting reverse complement sequence
     def reverseComplement(self):
@@ -1632,6 +2033,10 @@ class Options(object):
 
         self.defs['transcript2protein'] = ('string', '.')
         self.defs['loadalltranscripts'] = ('boolean', True)
+        self.defs['transcriptindexmb'] = ('string', '0')
+        self.defs['transcriptcachesize'] = ('string', '10')
+        self.defs['proteincachesize'] = ('string', '10')
+        self.defs['referencecachemb'] = ('string', '8')
 
         # Reading options from file
         self.read()
@@ -1708,6 +2113,63 @@ def convert_chrom(chrom, contigs):
         return None
 
 
+# Registry of chromosome names: every name seen (in the input or the databases) gets an integer ID once, and the name
+# of the contig of that ID in each source (reference genome, transcript database, dbSNP, target BED file) is resolved
+# once per ID by the ContigTable of the source, instead of calling convert_chrom for every record
+class ContigRegistry(object):
+    # Constructor
+    def __init__(self):
+        self.ids = dict()
+        self.names = []
+        self.tables = dict()
+
+    # Integer ID of a chromosome name
+    def intern(self, chrom):
+        contigid = self.ids.get(chrom)
+        if contigid is None:
+            contigid = len(self.names)
+            self.ids[chrom] = contigid
+            self.names.append(chrom)
+        return contigid
+
+    # Name table of a source (identified by key), created at first use (getcontigs returns the contig names of the source)
+    def table(self, key, getcontigs):
+        table = self.tables.get(key)
+        if table is None:
+            table = ContigTable(self, getcontigs)
+            self.tables[key] = table
+        return table
+
+
+# Class representing the contig names of a source, resolved (as by convert_chrom) by contig ID. The set of contig
+# names is only built when a first name is resolved, so that sources with many contigs cost nothing at startup
+class ContigTable(object):
+    # Constructor
+    def __init__(self, registry, getcontigs):
+        self.registry = registry
+        self.getcontigs = getcontigs
+        self.contigs = None
+        self.resolved = dict()
+
+    # Name in this source of the contig of an ID (None if the source does not have it)
+    def name(self, contigid):
+        if contigid in self.resolved:
+            return self.resolved[contigid]
+        if self.contigs is None:
+            self.contigs = set(self.getcontigs())
+        goodchrom = convert_chrom(self.registry.names[contigid], self.contigs)
+        self.resolved[contigid] = goodchrom
+        return goodchrom
+
+    # Name in this source of the contig of a chromosome name
+    def resolve(self, chrom):
+        return self.name(self.registry.intern(chrom))
+
+
+# Contig registry of the process
+CONTIGS = ContigRegistry()
+
+
 # Reading gene, transcript or snp list from file
 def readSet(options, tag):
     ret = set()
@@ -1733,7 +2195,7 @@ def readSet(options, tag):
 def read_dict(options, tag):
     ret = dict()
     tx_to_prot_source_file = options.args['ensembl'].replace('db.gz', 'txt').replace('.gz', '.txt')
-    print("Reading option file dictionary : " + tx_to_prot_source_file + "\n")
+    sys.stderr.write("Reading option file dictionary : " + tx_to_prot_source_file + "\n")
     with open(tx_to_prot_source_file, 'r') as f:
         for line in f:
             if line == '' or line == '.' or line.startswith("#"): continue
@@ -1899,6 +2361,29 @@ def checkOptions(options):
             logging.info('No output file written. CAVA quit.')
         quit()
 
+    # Checking if @transcriptindexmb was given correct value
+    if not options.args['transcriptindexmb'].isdigit():
+        print('ERROR: incorrect value of the tag @transcriptindexmb.')
+        print('(Allowed values: integer >= 0, 0 for no limit)')
+        print('\nNo output file written. CAVA quit.')
+        print("--------------------------------------------------------------------\n")
+        if options.args['logfile']:
+            logging.error('Incorrect value of the tag @transcriptindexmb.')
+            logging.info('No output file written. CAVA quit.')
+        quit()
+
+    # Checking if @transcriptcachesize, @proteincachesize and @referencecachemb were given correct values
+    for key in ['transcriptcachesize', 'proteincachesize', 'referencecachemb']:
+        if not (options.args[key].isdigit() and int(options.args[key]) >= 1):
+            print('ERROR: incorrect value of the tag @' + key + '.')
+            print('(Allowed values: integer >= 1)')
+            print('\nNo output file written. CAVA quit.')
+            print("--------------------------------------------------------------------\n")
+            if options.args['logfile']:
+                logging.error('Incorrect value of the tag @' + key + '.')
+                logging.info('No output file written. CAVA quit.')
+            quit()
+
     # Checking if @ontology was given correct value
     optstr = options.args['ontology'].upper()
     if not (optstr == 'CLASS' or optstr == 'SO' or optstr == 'BOTH'):
@@ -2050,6 +2535,37 @@ def checkOptions(options):
             logging.info('No output file written. CAVA quit.')
         quit()
 
+# Length of the longest common prefix of two strings (comparing slices of halving length)
+def commonPrefixLength(a, b):
+    n = min(len(a), len(b))
+    if a[0:n] == b[0:n]:
+        return n
+    lo, hi = 0, n  # a[0:lo] == b[0:lo] and a[0:hi] != b[0:hi]
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+# Length of the longest common suffix of two strings, at most maxlen
+def commonSuffixLength(a, b, maxlen):
+    if maxlen <= 0:
+        return 0
+    if a[len(a) - maxlen:] == b[len(b) - maxlen:]:
+        return maxlen
+    lo, hi = 0, maxlen  # the last lo letters are the same, the last hi letters are not
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
 # trim protein, up to including the stop codon .. to fix annotation errors.
 
 def trim_prot_after_stop(seq):
@@ -383,7 +383,7 @@ def scan_for_repeat(variant, reference):
         next_left = pos_left_of_variant - len(rep) + 1
         match_rep = True
 
-        goodchrom = core.convert_chrom(variant.chrom, reference.fastafile.references)
+        goodchrom = reference.contigtable.name(variant.contigid)
         if goodchrom is None:
             return [None,None,None]
         while match_rep is True:  # Scan for repeats and load bigger chunks of data as scan toward the end.
@@ -679,7 +679,7 @@ def makeDNAannotation(variant, transcript, reference, coord1, intr1, coord2, int
             # coord1 points to the repeated base i 1-base coordinates (does not point after insertion site like variant.pos)
             #if variant.pos - len(insert) >= transcript.transcriptStart and variant.pos - 1 <= transcript.transcriptEnd:
 
-            goodchrom = core.convert_chrom(variant.chrom, reference.fastafile.references)
+            goodchrom = reference.contigtable.name(variant.contigid)
             if goodchrom is None:
                 # Probably should have an error message
                 return 'ins'+variant.alt,''
@@ -753,7 +753,7 @@ def makeDNAannotation(variant, transcript, reference, coord1, intr1, coord2, int
             # coord1 points to the repeated base i 1-base coordinates (does not point after insertion site like variant.pos)
             #if variant.pos - len(insert) >= transcript.transcriptStart and variant.pos - 1 <= transcript.transcriptEnd:
 
-            goodchrom = core.convert_chrom(variant.chrom, reference.fastafile.references)
+            goodchrom = reference.contigtable.name(variant.contigid)
             if goodchrom is None:
                 # Probably should have an error message
                 return 'del',''
@@ -1315,6 +1315,64 @@ def makeProteinString(variant, prot, mutprot, coord1_str):
 
 # Transforming a genomic position to csn coordinate
 def transformToCSNCoordinate(pos, transcript):
+    # Walking the exons if they are not sorted or the coding region does not start and end in exons
+    exonindex = transcript.exonIndex()
+    if exonindex is None or not exonindex.locate(transcript.codingStartGenomic)[1] or \
+            not exonindex.locate(transcript.codingEndGenomic)[1] or \
+            (transcript.codingEndGenomic - transcript.codingStartGenomic) * transcript.strand < 0:
+        return transformToCSNCoordinateByExonWalk(pos, transcript)
+
+    (i, inexon) = exonindex.locate(pos)
+
+    # Genomic position within intron, counting from the closer exon
+    if i is not None and not inexon:
+        exon = transcript.exons[i]
+        if transcript.strand == 1:
+            prevExonEnd = transcript.exons[i - 1].end
+            if pos <= int((exon.start + 1 - prevExonEnd) / 2) + prevExonEnd:  # count from previous exon
+                x, y, nout = transformToCSNCoordinate(prevExonEnd, transcript)
+                return x, pos - prevExonEnd, nout
+            else:   # count from exon coming up
+                x, y, nout = transformToCSNCoordinate(exon.start + 1, transcript)
+                return x, pos - exon.start - 1, nout
+        else:
+            prevExonEnd = transcript.exons[i - 1].start + 1
+            if pos >= int((prevExonEnd - exon.end + 1) / 2) + exon.end:
+                x, y, nout = transformToCSNCoordinate(prevExonEnd, transcript)
+                return x, prevExonEnd - pos, nout
+            else:
+                x, y, nout = transformToCSNCoordinate(exon.end, transcript)
+                return x, exon.end - pos, nout
+
+    # Genomic position within exon of the CDS
+    if not transcript.isPositionOutsideCDS(pos):
+        exon = transcript.exons[i]
+        sumOfExonLengths = -transcript.codingStart + 1 + exonindex.offsets[i]
+        if transcript.strand == 1:
+            return str(sumOfExonLengths + pos - exon.start), 0, 0
+        else:
+            return str(sumOfExonLengths + exon.end - pos + 1), 0, 0
+
+    # If genomic position is outside CDS: number of exonic bases to the coding start or end, plus the number of bases
+    # outside the transcript
+    firstStart = exonindex.starts[0]
+    lastEnd = exonindex.ends[-1]
+    if transcript.strand == 1:
+        if pos > transcript.codingEndGenomic:
+            sumpos = exonindex.exonicBases(pos - 1) - exonindex.exonicBases(transcript.codingEndGenomic - 1)
+            return '*' + str(sumpos + max(0, pos - lastEnd)), 0, 0
+        sumpos = exonindex.exonicBases(transcript.codingStartGenomic) - exonindex.exonicBases(pos)
+        return '-' + str(sumpos + max(0, firstStart + 1 - pos)), 0, 0
+    else:
+        if pos < transcript.codingEndGenomic:
+            sumpos = exonindex.exonicBases(transcript.codingEndGenomic) - exonindex.exonicBases(pos)
+            return '*' + str(sumpos + max(0, firstStart + 1 - pos)), 0, 0
+        sumpos = exonindex.exonicBases(pos - 1) - exonindex.exonicBases(transcript.codingStartGenomic - 1)
+        return '-' + str(sumpos + max(0, pos - lastEnd)), 0, 0
+
+
+# Same as transformToCSNCoordinate, walking the exons
+def transformToCSNCoordinateByExonWalk(pos, transcript):
     prevExonEnd = 99999999
 
     # Checking if genomic position is not outside CDS
@@ -4,12 +4,19 @@
 # Classes providing interfaces with annotation databases and the reference genome
 #######################################################################################################################
 
+import array
+import collections
 import os
 import sys
 
+from . import compileddb
 from . import conseq
 from . import core
 from . import csn
+from . import lrucache
+from . import ncls
+from . import packedref
+from . import proteindb
 
 #import time
 
@@ -17,6 +24,10 @@ sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/pysamdir')
 import pysam
 
 
+# Size (in bases) of the blocks of reference sequence cached by Reference
+REFERENCE_BLOCK = 1024 * 1024
+
+
 #######################################################################################################################
 
 # Class representing the Ensembl (transcript) dataset ( can be any database)
@@ -24,8 +35,11 @@ class Ensembl(object):
     # Constructor
     def __init__(self, options, genelist, transcriptlist, codon_usage, reference):
         self.options = options
-        # Openning tabix file representing the Ensembl database
+        # Lengths in the reference genome of the chromosomes of the database (None if the reference genome does not
+        # have them), resolved at first use (see contigLength)
         self.contigs = dict()
+        self.reflens = reference.reflens
+        # Openning tabix file representing the Ensembl database
         try:
             self.tabixfile = pysam.Tabixfile(options.args['ensembl'])
         except:
@@ -33,42 +47,47 @@ class Ensembl(object):
                 self.tabixfile = pysam.TabixFile(options.args['ensembl'])
             except:
                 sys.stderr.write("CAVA: ERROR: error trying to open Tabix file for "+options.args['ensembl']+"\n")
-        for chrom in self.tabixfile.contigs:
-            if chrom in reference.reflens:
-                self.contigs[chrom] = reference.reflens[chrom]
-        self.proteinSeqs = dict()
-        self.exonSeqs = dict()
-        self.exoncache_hit = dict()
-        self.cds_ref = dict()
-        self.cache_num = 0
+        # Names of the contigs of the database, by contig ID
+        self.contigtable = core.CONTIGS.table(('ensembl', options.args['ensembl']), lambda: self.tabixfile.contigs)
+        # Only the transcripts of the gene and transcript lists (if any) are indexed
         self.genelist = genelist
         self.transcriptlist = transcriptlist
+        # Cache of the reference protein, exon sequences and CDS of transcripts (see annotate())
+        self.protein_cache = lrucache.LRUCache('Protein', options.args.get('proteincachesize', '10'))
         self.codon_usage = codon_usage
         # Transcript to Protein Map for HGVSp protein
         # copy it over to "self" in order to maintain the calling function signature of Record.annotate() called by run() (main.py)
         self.transcript2protein = options.transcript2protein
-        self.nvar = 0  # counter for most recent transcript lookup
 
-        # 2E4 genes, 200K isoforms in 3E9, so 11E5 (50K) bins should get 0-1 genes and
-        #
         #  Cache fully parsed transcripts
         self.lasttranscript = None
-        self.transcript_cache = dict()
-        self.CACHESIZE = 10  # This will support multi-transcript queries. If use a lot of alternative splicing transcripts.. need to up that.
-        self.transcript_nvar = dict()
-        # Cache transcript positions
-        self.transcript_bins = None
+        # This will support multi-transcript queries. If use a lot of alternative splicing transcripts.. need to up that.
+        self.transcript_cache = lrucache.LRUCache('Transcript', options.args.get('transcriptcachesize', '10'))
+        # Cache transcript positions (NCList of the transcripts of the current chromosome, and the cursor sweeping it
+        # for coordinate sorted input)
+        self.transcript_index = None
+        self.transcript_sweep = None
         self.chrom = None
+        # Transcript positions of all chromosomes loaded so far (or preloaded, see preload()), kept resident in least
+        # recently used order; if @transcriptindexmb is given, least recently used chromosomes are dropped to keep
+        # the estimated size of the indexes within that many MB
+        self.chrom_index = collections.OrderedDict()
+        self.chrom_index_size = dict()
+        self.index_budget = int(self.options.args.get('transcriptindexmb', '0')) * 1024 * 1024
 
-
-        self.nbins = 0
-        self.binsize = 50000
-        self.chrom = None
         if 'loadalltranscripts' in self.options.args and self.options.args['loadalltranscripts'] is True:
             self.loadalltranscripts = True
         else:
             self.loadalltranscripts = False
 
+        # Memory mapped compiled companion of the database (see compileddb.py), if there is an up-to-date one; with
+        # gene or transcript lists, the slim compiled file of these lists (written by the parent before the annotation
+        # processes are started, see compileddb.prepareCompiled). Only used by the transcript indexes
+        if self.loadalltranscripts:
+            self.compiled = compileddb.openCompiled(options.args['ensembl'], genelist, transcriptlist, build=False)
+        else:
+            self.compiled = None
+
         self.selenogenes = ['DIO1', 'DIO2', 'DIO3', 'GPX1', 'GPX2', 'GPX3', 'GPX4', 'GPX6',
                                    'SELENOF',
                                    'SELENOH', 'SELENOI', 'SELENOK', 'SELENOM', 'SELENON', 'SELENOO',
@@ -79,53 +98,106 @@ class Ensembl(object):
             if len(str(options.args['selenogenes'])) >1:
                 self.selenogenes = str(options.args['selenogenes']).split(",")
 
+        # Precomputed reference protein and exon sequences (see proteindb.py), if there are any for these settings
+        self.proteindb = proteindb.openProteinDB(options.args['ensembl'], reference, codon_usage, self.selenogenes)
 
-# Get the list of transcript lines overlapping
+
+# Length in the reference genome of a chromosome of the database (None if it is not in the database or the reference
+# genome)
+    def contigLength(self, chrom):
+        if chrom not in self.contigs:
+            if chrom in self.tabixfile.contigs:
+                self.contigs[chrom] = self.reflens.get(chrom)
+            else:
+                self.contigs[chrom] = None
+        return self.contigs[chrom]
+
+# Get the list of transcript lines overlapping (or indexes of transcripts in the compiled database, if there is one)
 # returns either an iterator over a tabix file .. or a list (that can be iterated over)
     def fetch_overlapping_transcripts(self,chrom,startpos0,endpos1): # Give 0-base coordinate for start and 1-base for stop
         # If current chromosome is not loaded, then
         #      get tabix iterator figure out length, figu.. and load all chromosomes lines
         # Check self.tabixfile.l
-        if chrom not in self.contigs:
+        if self.contigLength(chrom) is None:
             return list()
         if self.loadalltranscripts is False:
             # This fetch consumes most of the runtime for CAVA (78%) as long
             # caching should be faster.
-            return self.tabixfile.fetch(reference=chrom, start = startpos0, end = endpos1)
+            hits = self.tabixfile.fetch(reference=chrom, start = startpos0, end = endpos1)
+            if len(self.genelist) == 0 and len(self.transcriptlist) == 0:
+                return hits
+            return [line for line in hits if self.in_lists(line)]
         if self.chrom is None or chrom != self.chrom:
-            # Flush cache and load all transcripts.
             self.chrom = chrom
-            self.transcript_bins = [None]*(1+int((1+self.contigs[chrom])/self.binsize))
-            hits = self.tabixfile.fetch(reference = chrom)
-            for line in hits:
-                linedat = line.split("\t",8)
-                transcriptid = linedat[0]
-                transcriptStart = int(linedat[6])  # lowest coordinate - base 0
-                transcriptEnd = int(linedat[7]) # highest coordiate - base 1
-                binstart = int(transcriptStart/self.binsize)
-                binend  = int(transcriptEnd/self.binsize)
-                for ebin in range(binstart,binend+1):
-                    if self.transcript_bins[ebin] is None:
-                        self.transcript_bins[ebin] = [[transcriptid,transcriptStart,transcriptEnd,line]]
-                    else:
-                        (self.transcript_bins[ebin]).append([transcriptid,transcriptStart,transcriptEnd,line])
-        lines = list()
-        got_transcript = dict()
-        binstart = int((startpos0+1)/ self.binsize)
-        binend = int(endpos1/ self.binsize)
-        for ebin in range(binstart, binend + 1):
-            bin_list = self.transcript_bins[ebin]
-            if bin_list is not None:
-                for bin_content in bin_list: # [transcriptid, transcriptStart, transcriptEnd, line])
-                    if (startpos0+1) >= bin_content[1] and endpos1<=bin_content[2]:
-                        transcriptid = bin_content[0]
-                        if transcriptid not in got_transcript:
-                            got_transcript[transcriptid]=1
-                            lines.append(bin_content[3])
-        return lines
-
+            self.transcript_index = self.get_transcript_index(chrom)
+            self.transcript_sweep = ncls.Sweep(self.transcript_index)
+        # Transcripts (in database order) with transcriptStart <= startpos0+1 and endpos1 <= transcriptEnd
+        return self.transcript_sweep.containing(startpos0 + 1, endpos1)
+
+
+
+
+
+# Index all transcripts of a chromosome by position (each transcript is stored once, whatever its length), except
+# those not in the gene and transcript lists
+    def load_transcript_index(self, chrom):
+        if self.compiled is not None:
+            return ncls.NCList(self.compiled.intervals(chrom))
+        intervals = []
+        hits = self.tabixfile.fetch(reference = chrom)
+        for line in hits:
+            if not self.in_lists(line): continue
+            linedat = line.split("\t",8)
+            transcriptStart = int(linedat[6])  # lowest coordinate - base 0
+            transcriptEnd = int(linedat[7]) # highest coordiate - base 1
+            intervals.append((transcriptStart, transcriptEnd, line))
+        return ncls.NCList(intervals)
+
+# Check if a transcript line passes the gene and transcript lists
+    def in_lists(self, line):
+        linedat = line.split("\t", 2)
+        return compileddb.inLists(linedat[0], linedat[1], self.genelist, self.transcriptlist)
+
+# Get the transcript index of a chromosome, loading it if it is not resident yet
+    def get_transcript_index(self, chrom):
+        if chrom in self.chrom_index:
+            self.chrom_index.move_to_end(chrom)
+            return self.chrom_index[chrom]
+        index = self.load_transcript_index(chrom)
+        self.chrom_index[chrom] = index
+        self.chrom_index_size[chrom] = index.memoryEstimate()
+        self.evict_transcript_indexes()
+        return index
+
+# Drop least recently used chromosome indexes (but never the last one) while over the memory budget, if any
+    def evict_transcript_indexes(self):
+        if self.index_budget == 0:
+            return
+        while len(self.chrom_index) > 1 and sum(self.chrom_index_size.values()) > self.index_budget:
+            chrom, _ = self.chrom_index.popitem(last=False)
+            self.chrom_index_size.pop(chrom)
+
+# Load the transcript indexes of all chromosomes at once (e.g. in the parent process, before forking the workers,
+# so they share them copy-on-write instead of each loading their own), as far as the memory budget allows
+    def preload(self):
+        if self.loadalltranscripts is False:
+            return
+        for chrom in self.tabixfile.contigs:
+            if self.contigLength(chrom) is None:
+                continue
+            if self.index_budget > 0 and sum(self.chrom_index_size.values()) >= self.index_budget:
+                break
+            self.get_transcript_index(chrom)
 
+# Transcript and protein caches (with their counters, for tuning their sizes)
+    def caches(self):
+        return [self.transcript_cache, self.protein_cache]
 
+# Reopen the tabix file (file handles must not be shared between forked processes), keeping in-memory data
+    def reopen(self):
+        self.tabixfile = pysam.TabixFile(self.options.args['ensembl'])
+        if self.proteindb is not None:
+            self.proteindb.reopen()
 
 
 #
@@ -133,25 +205,22 @@ class Ensembl(object):
 #
 
     def find_transcript_in_cache_or_in_file(self,line):
-        transcriptid = line.split("\t")[0]
-        self.nvar +=1
-        self.transcript_nvar[transcriptid] = self.nvar
-        if transcriptid in self.transcript_cache:
-            transcript = self.transcript_cache[transcriptid]
+        if isinstance(line, int):  # Transcript of the compiled database
+            transcriptid = self.compiled.transcriptID(line)
         else:
+            transcriptid = line.split("\t")[0]
+        transcript = self.transcript_cache.get(transcriptid)
+        if transcript is None:
             # with the reference sequence being cached, fetching a whole transcripts and exons takes 0.03-0.09 ms
             #        ... rather than 150-200 ms if the sequence was not cached.
-            transcript = core.Transcript(line)
+            if isinstance(line, int):
+                transcript = core.Transcript()
+                transcript.setFields(*self.compiled.fields(line))
+            else:
+                transcript = core.Transcript(line)
             if transcript.geneSymbol in self.selenogenes:
                 transcript.is_selenocysteine = True
-            self.transcript_cache[transcriptid] = transcript
-            if len(self.transcript_cache)>self.CACHESIZE:
-                vals = list(self.transcript_nvar.values())
-                minval = min(vals)
-                which_minval = vals.index(minval)
-                rm_tr = ''+list(self.transcript_nvar.keys())[which_minval]
-                self.transcript_cache.pop(rm_tr)
-                self.transcript_nvar.pop(rm_tr)
+            self.transcript_cache.put(transcriptid, transcript)
 
         return transcript
 
@@ -163,7 +232,7 @@ class Ensembl(object):
         retOUT = dict()
 
         # Checking chromosome name
-        goodchrom = core.convert_chrom(variant.chrom,self.tabixfile.contigs)
+        goodchrom = self.contigtable.name(variant.contigid)
         if goodchrom is None:
             return ret, retOUT
 
@@ -221,10 +290,8 @@ class Ensembl(object):
             #end_time = time.perf_counter_ns()
             #sys.stdout.write("Two tabix fetch & iterate=" + str(end_time0 - st_time) + " "+ str(end_time - st_time) + "\n")
 
+            # (transcripts not in the gene and transcript lists are not indexed)
             for key, transcript in hitdict1.items():
-                if len(self.genelist) > 0 and transcript.geneSymbol not in self.genelist: continue
-                if len(self.transcriptlist) > 0 and transcript.TRANSCRIPT not in self.transcriptlist: continue
-
                 if key in list(hitdict2.keys()): # e.g. both ends of the variant are in transcript.
                     ret[key] = transcript
                 else:
@@ -233,8 +300,6 @@ class Ensembl(object):
 
             if not variant.is_insertion:
                 for key, transcript in hitdict2.items():  # check for partial overlap upstream of transcript
-                    if len(self.genelist) > 0 and transcript.geneSymbol not in self.genelist: continue
-                    if len(self.transcriptlist) > 0 and transcript.TRANSCRIPT not in self.transcriptlist: continue
                     if not key in list(hitdict1.keys()):
                         retOUT[key] = transcript
 
@@ -243,9 +308,6 @@ class Ensembl(object):
             for line in hits1:
                 transcript = self.find_transcript_in_cache_or_in_file(line)
 
-                if len(self.genelist) > 0 and transcript.geneSymbol not in self.genelist: continue
-                if len(self.transcriptlist) > 0 and transcript.TRANSCRIPT not in self.transcriptlist: continue
-
                 if not (transcript.transcriptStart + 1 <= end <= transcript.transcriptEnd): continue
                 ret[transcript.TRANSCRIPT] = transcript
 
@@ -488,27 +550,18 @@ class Ensembl(object):
             if (notexonic_plus is True) and (notexonic_minus is True): # Variant entirely outside coding region OR crossing intron/exon junction
                 protein = ''
             else:
-                self.cache_num += 1
-                self.exoncache_hit[transcript.TRANSCRIPT] = self.cache_num
-                if not transcript.TRANSCRIPT in list(self.proteinSeqs.keys()):
+                cached = self.protein_cache.get(transcript.TRANSCRIPT)
+                if cached is None and self.proteindb is not None:
+                    cached = self.proteindb.lookup(transcript)
+                    if cached is not None:
+                        self.protein_cache.put(transcript.TRANSCRIPT, cached)
+                        transcript.exonseqs = cached[1]
+                if cached is None:  # Cache of proteins and exons data
                     protein, exonseqs, cds_ref = transcript.getProteinSequence(reference, None, None, self.codon_usage)
-                    self.proteinSeqs[transcript.TRANSCRIPT] = protein
-                    self.exonSeqs[transcript.TRANSCRIPT] = exonseqs
-                    self.cds_ref[transcript.TRANSCRIPT] = cds_ref
+                    self.protein_cache.put(transcript.TRANSCRIPT, (protein, exonseqs, cds_ref))
                     transcript.exonseqs = exonseqs
-                    if len(self.proteinSeqs) > self.CACHESIZE:  # Cache of proteins and exons data
-                            vals = list(self.exoncache_hit.values())
-                            minval = min(vals)
-                            which_minval = vals.index(minval)
-                            rm_tr = '' + list(self.exoncache_hit.keys())[which_minval]
-                            self.exonSeqs.pop(rm_tr)
-                            self.exoncache_hit.pop(rm_tr)
-                            self.proteinSeqs.pop(rm_tr)
-                            self.cds_ref.pop(rm_tr)
                 else:
-                    protein = self.proteinSeqs[transcript.TRANSCRIPT]
-                    exonseqs = self.exonSeqs[transcript.TRANSCRIPT]
-                    cds_ref = self.cds_ref[transcript.TRANSCRIPT]
+                    protein, exonseqs, cds_ref = cached
 
 
             if notexonic_plus is True:
@@ -739,19 +792,47 @@ class Ensembl(object):
 #######################################################################################################################
 
 
+# Class representing the target BED file the records are filtered by
+class TargetBED(object):
+    # Constructor
+    def __init__(self, options):
+        self.filename = options.args['target']
+        self.tabixfile = pysam.Tabixfile(self.filename, parser=pysam.asBed())
+        # Names of the contigs of the BED file, by contig ID
+        self.contigtable = core.CONTIGS.table(('target', self.filename), lambda: self.tabixfile.contigs)
+
+    # Reopening the tabix file (file handles must not be shared between forked processes)
+    def reopen(self):
+        self.tabixfile = pysam.Tabixfile(self.filename, parser=pysam.asBed())
+
+    # Iterating through the BED lines of a region
+    def fetch(self, region):
+        return self.tabixfile.fetch(region=region)
+
+
+#######################################################################################################################
+
+
 # Class representing the dbSNP dataset
 class dbSNP(object):
     # Constructor
     def __init__(self, options):
         # Openffning tabix file representing the dbSNP database
-        self.tabixfile = pysam.Tabixfile(options.args['dbsnp'])
+        self.filename = options.args['dbsnp']
+        self.tabixfile = pysam.Tabixfile(self.filename)
+        # Names of the contigs of the database, by contig ID
+        self.contigtable = core.CONTIGS.table(('dbsnp', self.filename), lambda: self.tabixfile.contigs)
+
+    # Reopening the tabix file (file handles must not be shared between forked processes)
+    def reopen(self):
+        self.tabixfile = pysam.Tabixfile(self.filename)
 
     # Annotating a variant based on dbSNP data
     def annotate(self, variant):
         # Checking if variant is a SNP at all
         if variant.is_substitution:
             # Fetching data from dbSNP database
-            goodchrom = core.convert_chrom(variant.chrom,self.tabixfile.contigs)
+            goodchrom = self.contigtable.name(variant.contigid)
             if goodchrom is None:
                 variant.addFlag('DBSNP', '')
                 return variant
@@ -769,6 +850,93 @@ class dbSNP(object):
         return variant
 
 
+#######################################################################################################################
+
+# Names of the mitochondrial chromosome accepted for any of chrM, chrMT, M and MT
+MITO_NAMES = ["chrM", "chrMT", "CHRM", "CHRMT", "M", "MT", "chrm", "chrmt", "m", "mt"]
+
+
+# Names a chromosome of the reference genome is accepted by: in upper and lower case, with and without 'chr'
+def contigAliases(chrom):
+    ret = {chrom, chrom.upper(), chrom.lower()}
+    if chrom.startswith("chr"):
+        ret.update([chrom[3:], chrom[3:].upper(), chrom[3:].lower()])
+    else:
+        ret.update(["chr" + chrom, "CHR" + chrom.upper(), "chr" + chrom.upper(), "chr" + chrom.lower()])
+    if chrom in ["chrM", "chrMT", "M", "MT"]:
+        ret.update(MITO_NAMES)
+    return ret
+
+
+# Class representing the lengths of the chromosomes of the reference genome, looked up by any of their aliases (see
+# contigAliases; if several chromosomes share an alias, the last one in the FASTA index wins). Only the names actually
+# looked up are resolved, so that reference genomes with many contigs (scaffolds, alts, decoys) cost nothing at startup
+class ContigLengths(object):
+    # Constructor
+    def __init__(self, references, lengths):
+        self.references = references
+        self.lengths = array.array('q', lengths)
+        # Chromosome indexes by lower case name (an index or a tuple of indexes), built at the first lookup
+        self.index = None
+        self.resolved = dict()
+
+    def __contains__(self, chrom):
+        return self.get(chrom) is not None
+
+    def __getitem__(self, chrom):
+        ret = self.get(chrom)
+        if ret is None:
+            raise KeyError(chrom)
+        return ret
+
+    def __len__(self):
+        return len(self.lengths)
+
+    # Length of a chromosome (None if no chromosome is accepted by that name)
+    def get(self, chrom, default=None):
+        if chrom not in self.resolved:
+            self.resolved[chrom] = self.resolve(chrom)
+        ret = self.resolved[chrom]
+        if ret is None:
+            return default
+        return ret
+
+    # Indexes of the chromosomes with a given lower case name
+    def withLowerName(self, name):
+        if self.index is None:
+            self.index = dict()
+            for i in range(len(self.references)):
+                key = str(self.references[i]).lower()
+                if key in self.index:
+                    prev = self.index[key]
+                    self.index[key] = (prev if isinstance(prev, tuple) else (prev,)) + (i,)
+                else:
+                    self.index[key] = i
+        ret = self.index.get(name, ())
+        if isinstance(ret, tuple):
+            return ret
+        return (ret,)
+
+    # Length of the last chromosome accepted by a name (None if there is none)
+    def resolve(self, chrom):
+        # Only chromosomes with the same name, or the same name with or without 'chr', up to case, can be accepted
+        lower = chrom.lower()
+        candidates = set(self.withLowerName(lower))
+        candidates.update(self.withLowerName("chr" + lower))
+        if lower.startswith("chr"):
+            candidates.update(self.withLowerName(lower[3:]))
+        if chrom in MITO_NAMES:
+            for name in ["chrm", "chrmt", "m", "mt"]:
+                candidates.update(self.withLowerName(name))
+        best = None
+        for i in candidates:
+            if (best is None or i > best) and chrom in contigAliases(str(self.references[i])):
+                best = i
+        if best is None:
+            return None
+        return self.lengths[best]
+
+
 #######################################################################################################################
 
 # Class representing the reference genome dataset
@@ -784,80 +952,54 @@ class Reference(object):
             except:
                 sys.stderr.write("CAVA:ERROR, Error, pysam API invalid\n")
 
-        lengths = self.fastafile.lengths
-        references = self.fastafile.references
-        self.reflens = dict()
-        for i in range(0,len(lengths)):
-            chrom = str(references[i])
-            self.reflens[chrom] = lengths[i]
-            self.reflens[chrom.upper()] = lengths[i]
-            self.reflens[chrom.lower()] = lengths[i]
-            if chrom.startswith("chr"):
-                self.reflens[chrom[3:]] = lengths[i]
-                self.reflens[chrom[3:].upper()] = lengths[i]
-                self.reflens[chrom[3:].lower()] = lengths[i]
-            else:
-                self.reflens["chr"+chrom] = lengths[i]
-                self.reflens["CHR"+chrom.upper()] = lengths[i]
-                self.reflens["chr" + chrom.upper()] = lengths[i]
-                self.reflens["chr"+chrom.lower()] = lengths[i]
-
-            if chrom in ["chrM","chrMT","M","MT","chrM"]:
-                self.reflens["chrM"] = lengths[i]
-                self.reflens["chrMT"] = lengths[i]
-                self.reflens["CHRM"] = lengths[i]
-                self.reflens["CHRMT"] = lengths[i]
-                self.reflens["M"] = lengths[i]
-                self.reflens["MT"] = lengths[i]
-                self.reflens["chrm"] = lengths[i]
-                self.reflens["chrmt"] = lengths[i]
-                self.reflens["m"] = lengths[i]
-                self.reflens["mt"] = lengths[i]
-        self.cache = ""
-        self.CACHESIZE = 5000000
-        self.PAD = 1000000  # Left Padding for normalization of large indels(5000bp) or  exons for transcripts from - strand
-        self.chrom = ""
-        self.start0 = 0
-        self.endpos = 0
+        # Lengths of the chromosomes, by any of their accepted names (see ContigLengths)
+        self.reflens = ContigLengths(self.fastafile.references, self.fastafile.lengths)
+        # Least recently used cache of aligned blocks of REFERENCE_BLOCK bases (upper case), keyed by (chrom, block
+        # index), holding at most @referencecachemb MB of sequence
+        self.cache = lrucache.LRUCache('Reference', int(options.args.get('referencecachemb', '8')) * 1024 * 1024 //
+                                       REFERENCE_BLOCK)
+        self.filename = options.args['reference']
+        # Names of the contigs of the reference genome, by contig ID
+        self.contigtable = core.CONTIGS.table(('reference', self.filename), lambda: self.fastafile.references)
+        # Memory mapped packed companion of the FASTA file (see packedref.py), if there is an up-to-date one; the
+        # sequence is then sliced from it and the block cache is not used
+        self.packed = packedref.openPacked(self.filename)
+
+    # Reopening the fasta file (file handles must not be shared between forked processes), the cache is kept
+    def reopen(self):
+        self.fastafile = pysam.FastaFile(self.filename)
 
     # Private method .. do not call because assume that chrom is in sequence index
     #  also assumes end is less than chrom length .. and that start >=1
 
     def __getseq_from_cache_or_file(self, chrom, start, endpos):
-        # XXX-HS To make faster, could retrieve large blocks of sequence
         # For normalization.
         # There are about 322,000 indels per 3XE9 /person, so 0.3/1000bp
         # so for a cache to be useful, it needs to include variants, so 30KB min.
         #  for exomes. Most genes are < 1MB .. and 2000 bp cds.. so would only include 1-2 indels/sample
         # Assuming the tabix index is in RAM, reading from disk is seek time (5-10ms) + read time (1MB/ms)
-        #    so reading 10-20MB takes the same amount of time as a single disk seek.
-        # For exome, there is one indel/gene and each gene is 1MB (average), so a 5MB cache insures 5X cache reuse(hits)
-        # if dealing with SNPs or whole genome data, other elements, a smaller cache will reap benefits too .. up to about 5MB.
-        if chrom != self.chrom or start < self.start0+1 or endpos > self.endpos:
-            fetch_start = start - self.PAD
-            if fetch_start<1:
-                fetch_start =1
-            fetch_end = start + self.CACHESIZE
-            if fetch_end < endpos:
-                fetch_end = endpos + self.PAD
-            if fetch_end > self.reflens[chrom]:
-                fetch_end = self.reflens[chrom]
-            self.start0 = fetch_start-1
-            self.endpos = fetch_end
-            self.chrom = chrom
- #           st_time = time.perf_counter_ns()
- #           self.cache = self.fastafile.fetch(self.chrom, self.start0-110000, self.start0-109997)
- #           end_time = time.perf_counter_ns()
- #           sys.stdout.write("Time for small retrieval=" + str(end_time - st_time) + "\n")  # 15 ms
- #           st_time = time.perf_counter_ns()
-            self.cache = self.fastafile.fetch(chrom, self.start0, self.endpos)
- #           end_time = time.perf_counter_ns()
- #           sys.stdout.write("Time for 6MB retrieval="+str(end_time-st_time)+"\n") # 73 milliseconds on mforge for 6MB
-
-        return self.cache[(start-1-self.start0):(endpos-self.start0)]
-
-
-
+        # Blocks are kept independently, so that alternating between distant loci (e.g. a variant and a distant exon of
+        # the same transcript, or two chromosomes) does not fetch the same sequence again and again.
+        if self.packed is not None:
+            return self.packed.fetch(chrom, start - 1, endpos)
+        first = (start - 1) // REFERENCE_BLOCK
+        last = (endpos - 1) // REFERENCE_BLOCK
+        if first == last:
+            offset = first * REFERENCE_BLOCK
+            return self.__getblock(chrom, first)[(start - 1 - offset):(endpos - offset)]
+        # Stitching the blocks spanned by the region
+        blocks = [self.__getblock(chrom, i) for i in range(first, last + 1)]
+        offset = first * REFERENCE_BLOCK
+        return ''.join(blocks)[(start - 1 - offset):(endpos - offset)]
+
+    # Private method .. a block of the reference (upper case), from the cache or fetched from the fasta file
+    def __getblock(self, chrom, index):
+        block = self.cache.get((chrom, index))
+        if block is None:
+            block = self.fastafile.fetch(chrom, index * REFERENCE_BLOCK,
+                                         min((index + 1) * REFERENCE_BLOCK, self.reflens[chrom])).upper()
+            self.cache.put((chrom, index), block)
+        return block
 
         # Retrieving the sequence of a genomic region
     def getReference(self, chrom, start, end):
@@ -865,7 +1007,7 @@ class Reference(object):
         # XXX-HS To make faster, could retrieve large blocks of sequence (2K)
         # .. and cache them .. then next retrieval would be against the cache.
         #
-        goodchrom = core.convert_chrom(chrom,self.fastafile.references)
+        goodchrom = self.contigtable.resolve(chrom)
         if goodchrom is None:
             return None
             # Fetching data from reference genome
@@ -896,6 +1038,6 @@ class Reference(object):
 #        seq = self.fastafile.fetch(goodchrom, start - 1, end)  # 0-based position
 
         seq = self.__getseq_from_cache_or_file(goodchrom, start, end)
-        return core.Sequence(seq.upper())
+        return core.Sequence(seq)
 
 #######################################################################################################################
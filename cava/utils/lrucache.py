@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+
+# Least recently used (LRU) cache with O(1) lookup, insertion and eviction, counting hits, misses and evictions
+#######################################################################################################################
+
+import collections
+
+
+# Class representing an LRU cache holding at most capacity items
+class LRUCache(object):
+    # Constructor
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    # Getting the value of a key and marking it as most recently used (None if not cached)
+    def get(self, key):
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        return None
+
+    # Adding (or replacing) the value of a key as most recently used, evicting the least recently used items
+    # if over capacity
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    # Removing all items (counters are kept)
+    def clear(self):
+        self.items.clear()
+
+    # Counters of the cache
+    def stats(self):
+        return {'name': self.name, 'capacity': self.capacity, 'size': len(self.items), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    # Counters of the cache as a string (for the log file)
+    def statsString(self):
+        lookups = self.hits + self.misses
+        if lookups > 0:
+            hitrate = '{:.1f}%'.format(100.0 * self.hits / lookups)
+        else:
+            hitrate = '-'
+        return self.name + ' cache: ' + str(len(self.items)) + '/' + str(self.capacity) + ' items, ' + \
+            str(self.hits) + ' hits, ' + str(self.misses) + ' misses (hit rate ' + hitrate + '), ' + \
+            str(self.evictions) + ' evictions'
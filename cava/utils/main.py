@@ -1,18 +1,43 @@
 #!/usr/bin/env python3
 
+import bisect
+import copy
 import datetime
+import gc
 import gzip
+import json
 import logging
 import multiprocessing
 import os
 import sys
+import time
 import pysam
 
-from . import data
-#from data import Ensembl
-#from data import Reference
+from . import annotator
+from . import checkpoint
+from . import compileddb
 from . import core
+from . import data
+from . import manifest
 #from core import Record
+from . import pipeline
+from . import proteindb
+from . import server
+
+
+# Magic bytes starting every BGZF block (gzip header with FEXTRA flag set)
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+# The pre-scan of the input file records the offset of every INDEX_INTERVAL-th record (used as shard boundaries)
+INDEX_INTERVAL = 256
+INDEX_VERSION = 2
+
+# Number of work units per process: units are handed out on demand, so a process finishing its unit early takes the
+# next one instead of sitting idle until the slowest process is done
+UNITS_PER_THREAD = 16
+
+# Processes write a checkpoint of their work unit every CHECKPOINT_INTERVAL records
+CHECKPOINT_INTERVAL = 1000
 
 
 # Printing out welcome meassage
@@ -54,6 +79,11 @@ def printNumOfRecords(numOfRecords):
     print('\nInput file contains ' + str(numOfRecords) + ' records to annotate.\n')
 
 
+# Printing out number of genomic regions the input file is split into
+def printNumOfRegions(numOfRegions):
+    print('\nInput file is split into ' + str(numOfRegions) + ' genomic regions to annotate.\n')
+
+
 # Initializing progress information
 def initProgressInfo():
     sys.stdout.write('\rAnnotating variants ... 0.0%')
@@ -93,17 +123,109 @@ def printEndInfo(options, copts, starttime):
         logging.info('CAVA successfully finished.')
 
 
+# Checking if a file is BGZF compressed (i.e. it can be accessed through virtual offsets)
+def isBGZF(filename):
+    with open(filename, 'rb') as f:
+        header = f.read(18)
+    return len(header) == 18 and header[0:4] == BGZF_MAGIC and header[12:14] == b'BC'
+
+
+# Determining how the input file can be split between processes:
+#    'BGZF' - bgzipped file, shards are delimited by BGZF virtual offsets
+#    'TEXT' - uncompressed file, shards are delimited by byte offsets
+#    'LINE' - plain gzip file (not seekable), shards are delimited by line numbers
+def getSplitMode(inputf):
+    if inputf.endswith('.gz') or inputf.endswith('.bgz'):
+        if isBGZF(inputf):
+            return 'BGZF'
+        return 'LINE'
+    return 'TEXT'
+
+
+# Opening the input file for the given split mode, so that tell() and seek() work on shard offsets
+def openInput(inputf, mode):
+    if mode == 'BGZF':
+        return pysam.BGZFile(inputf, 'rb')
+    if mode == 'TEXT':
+        return open(inputf, 'rb')
+    return gzip.open(inputf, 'rt', encoding='utf-8')
+
+
+# Finding the compressed offset of the first BGZF block starting at or after a given offset
+# A candidate block is only accepted if its BSIZE field points to another block (or to the end of file)
+def findNextBGZFBlock(f, offset, filesize):
+    while offset < filesize:
+        f.seek(offset)
+        buf = f.read(65536)
+        idx = buf.find(BGZF_MAGIC)
+        while idx != -1:
+            if offset + idx + 18 > filesize:
+                return filesize
+            f.seek(offset + idx)
+            header = f.read(18)
+            if header[12:14] == b'BC':
+                bsize = header[16] + (header[17] << 8) + 1
+                f.seek(offset + idx + bsize)
+                if f.read(4) == BGZF_MAGIC or offset + idx + bsize == filesize:
+                    return offset + idx
+            idx = buf.find(BGZF_MAGIC, idx + 1)
+        offset += max(len(buf) - 3, 1)
+    return filesize
+
+
 # Finding break points in the input file
-def findFileBreaks(inputf, threads):
+# Shards are defined by byte offsets (uncompressed input) or BGZF virtual offsets (bgzipped input), aligned to the start
+# of a record, so each process can seek straight to its shard. Plain gzip input falls back on line number ranges.
+# If the pre-scan index of the input is given, shards hold equal numbers of records (or equal estimated cost, if
+# weighted is True); otherwise they are estimated from the file size, without reading the file.
+def findFileBreaks(inputf, threads, index=None, weighted=False):
+    if index is not None:
+        return breaksFromIndex(index, threads, weighted)
+    mode = getSplitMode(inputf)
+    if mode == 'LINE':
+        return findLineBreaks(inputf, threads)
+
+    filesize = os.path.getsize(inputf)
+    starts = []
+    with open(inputf, 'rb') as f:
+        for i in range(1, threads):
+            offset = int(i * filesize / threads)
+            if mode == 'BGZF':
+                offset = findNextBGZFBlock(f, offset, filesize)
+            starts.append(offset)
+
+    infile = openInput(inputf, mode)
+    breaks = [0]
+    for offset in starts:
+        if mode == 'BGZF':
+            if offset >= filesize:
+                breaks.append(breaks[-1])
+                continue
+            infile.seek(offset << 16)
+        else:
+            infile.seek(offset)
+        # The record overlapping the offset belongs to the previous shard
+        infile.readline()
+        breaks.append(max(infile.tell(), breaks[-1]))
+    infile.close()
+
+    ret = []
+    for i in range(threads):
+        if i < threads - 1:
+            ret.append((breaks[i], breaks[i + 1]))
+        else:
+            ret.append((breaks[i], ''))
+    return ret
+
+
+# Finding break points in the input file by line numbers (used for non-seekable input)
+def findLineBreaks(inputf, threads):
     ret = []
     started = False
     counter = 0
     first =1
 
-    if inputf.endswith('.gz') or inputf.endswith('.bgz'):
-        infile = gzip.open(inputf, 'rt', encoding='utf-8')
-    else:
-        infile = open(inputf, encoding='utf-8')
+    infile = gzip.open(inputf, 'rt', encoding='utf-8')
 
     for line in infile:
         counter += 1
@@ -122,34 +244,279 @@ def findFileBreaks(inputf, threads):
     return ret
 
 
-# Reading header from input file
-def readHeader(inputfn):
+# Checking if the input file is bgzipped and tabix-indexed (.tbi or .csi), i.e. it can be read by genomic region
+def hasRegionIndex(inputf):
+    if not getSplitMode(inputf) == 'BGZF':
+        return False
+    return os.path.isfile(inputf + '.tbi') or os.path.isfile(inputf + '.csi')
+
+
+# Reading the header of a tabix-indexed input file
+def readRegionHeader(inputf):
+    tbx = pysam.TabixFile(inputf)
+    header = [line.strip() for line in tbx.header]
+    tbx.close()
+    return header
+
+
+# Splitting a tabix-indexed input file into genomic regions (contig, start, end) of regionsize bp, 0-based half-open
+# Contigs are taken in the order of the index (i.e. of the input file), the last region of a contig is open-ended
+# (end is None); contigs of unknown length (and all contigs, if regionsize is 0) make up a single region
+def findRegions(inputf, regionsize, reflens):
+    tbx = pysam.TabixFile(inputf)
+    contigs = list(tbx.contigs)
+    tbx.close()
     ret = []
+    for contig in contigs:
+        if regionsize <= 0 or contig not in reflens:
+            ret.append((contig, 0, None))
+            continue
+        start = 0
+        while start + regionsize < reflens[contig]:
+            ret.append((contig, start, start + regionsize))
+            start += regionsize
+        ret.append((contig, start, None))
+    return ret
 
-    if inputfn.endswith('.gz')  or inputfn.endswith('.bgz'):
-        infile = gzip.open(inputfn, 'rt', encoding='utf-8')
+
+# Iterating through the records of a genomic region of a tabix-indexed input file
+# Records overlapping the region but starting before it (e.g. long deletions) belong to the previous region
+def readRegion(inputf, contig, start, end):
+    tbx = pysam.TabixFile(inputf)
+    for line in tbx.fetch(contig, start, end):
+        if int(line.split('\t', 2)[1]) - 1 < start: continue
+        yield line
+    tbx.close()
+
+
+# Iterating through the lines of a work unit: a shard of the input file (start, end) or, in REGION mode,
+# a genomic region (contig, start, end)
+def readUnit(inputf, mode, unit):
+    if mode == 'REGION':
+        return readRegion(inputf, unit[0], unit[1], unit[2])
+    return readShard(inputf, mode, unit[0], unit[1])
+
+
+# Iterating through the lines of a work unit together with the rest of the work unit after each line, i.e. the unit
+# to process to continue right after that line (used for checkpoints)
+def iterUnit(inputf, mode, unit):
+    if mode == 'REGION':
+        # Resumed regions skip the given number of records
+        if len(unit) > 3:
+            skip = unit[3]
+        else:
+            skip = 0
+        counter = 0
+        for line in readRegion(inputf, unit[0], unit[1], unit[2]):
+            counter += 1
+            if counter <= skip: continue
+            yield line, [unit[0], unit[1], unit[2], counter]
+    elif mode == 'LINE':
+        lineno = int(unit[0])
+        for line in readShard(inputf, mode, unit[0], unit[1]):
+            lineno += 1
+            yield line, [lineno, unit[1]]
     else:
-        infile = open(inputfn, encoding='utf-8')
+        for (line, pos) in readSeekableShard(inputf, mode, unit[0], unit[1]):
+            yield line, [pos, unit[1]]
 
-    for line in infile:
-        line = line.strip()
-        if line == '': continue
-        if line.startswith("#"):
-            ret.append(line)
+
+# Iterating through the lines of one shard of the input file (end == '' means end of file)
+def readShard(inputf, mode, start, end):
+    if mode == 'LINE':
+        infile = openInput(inputf, mode)
+        counter = 0
+        for line in infile:
+            counter += 1
+            if counter < int(start): continue
+            if not end == '':
+                if counter > int(end): break
+            yield line
+        infile.close()
+    else:
+        for (line, pos) in readSeekableShard(inputf, mode, start, end):
+            yield line
+
+
+# Iterating through the lines of one shard of an uncompressed or bgzipped input file, together with the offset
+# right after each line
+def readSeekableShard(inputf, mode, start, end):
+    infile = openInput(inputf, mode)
+    infile.seek(start)
+    while True:
+        pos = infile.tell()
+        if not end == '' and pos >= end: break
+        line = infile.readline()
+        # BGZFile.readline() returns an empty string for empty lines too, so EOF is detected by the offset
+        if infile.tell() == pos: break
+        yield line.decode('utf-8'), infile.tell()
+    infile.close()
+
+
+# Single streaming pass over the input file collecting the header, the number of records and the offsets of
+# every INDEX_INTERVAL-th record (line numbers for plain gzip input), together with the estimated annotation cost
+# of all preceding records
+def scanInput(inputf):
+    mode = getSplitMode(inputf)
+    header = []
+    offsets = []
+    counter = 0
+    cost = 0
+    infile = openInput(inputf, mode)
+    if mode == 'LINE':
+        lineno = 0
+        for line in infile:
+            lineno += 1
+            line = line.strip()
+            if line == '': continue
+            if line.startswith('#'):
+                if counter == 0: header.append(line)
+                continue
+            if counter % INDEX_INTERVAL == 0: offsets.append([counter, lineno, cost])
+            counter += 1
+            cost += annotator.estimateCost(line)
+    else:
+        while True:
+            pos = infile.tell()
+            line = infile.readline()
+            if infile.tell() == pos: break
+            line = line.decode('utf-8').strip()
+            if line == '': continue
+            if line.startswith('#'):
+                if counter == 0: header.append(line)
+                continue
+            if counter % INDEX_INTERVAL == 0: offsets.append([counter, pos, cost])
+            counter += 1
+            cost += annotator.estimateCost(line)
+    infile.close()
+
+    stat = os.stat(inputf)
+    return {'version': INDEX_VERSION, 'mode': mode, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+            'header': header, 'records': counter, 'cost': cost, 'offsets': offsets}
+
+
+# Finding break points from the pre-scan index, giving each shard the same number of records
+# (or the same estimated annotation cost, if weighted is True)
+def breaksFromIndex(index, threads, weighted=False):
+    offsets = index['offsets']
+    if weighted:
+        keys = [o[2] for o in offsets]
+        total = index['cost']
+    else:
+        keys = [o[0] for o in offsets]
+        total = index['records']
+    if index['mode'] == 'LINE':
+        breaks = [1]
+    else:
+        breaks = [0]
+    for i in range(1, threads):
+        target = int(i * total / threads)
+        # Closest indexed record at or before the target
+        k = bisect.bisect_right(keys, target) - 1
+        if k <= 0:
+            breaks.append(breaks[-1])
         else:
-            break
+            breaks.append(max(offsets[k][1], breaks[-1]))
 
+    ret = []
+    for i in range(threads):
+        if i == threads - 1:
+            ret.append((breaks[i], ''))
+        elif index['mode'] == 'LINE':
+            ret.append((breaks[i], breaks[i + 1] - 1))
+        else:
+            ret.append((breaks[i], breaks[i + 1]))
     return ret
 
 
+# Name of the sidecar index file of the input file
+def indexFileName(inputf):
+    return inputf + '.cavaidx'
+
+
+# Reading the sidecar index of the input file; returns None if missing or out of date
+def readIndex(inputf):
+    fn = indexFileName(inputf)
+    if not os.path.isfile(fn):
+        return None
+    try:
+        with open(fn, encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(inputf)
+    if index.get('version') != INDEX_VERSION or index.get('size') != stat.st_size or \
+            index.get('mtime') != stat.st_mtime_ns or index.get('mode') != getSplitMode(inputf):
+        return None
+    return index
+
+
+# Writing the sidecar index of the input file (failing to write it is not an error)
+def writeIndex(inputf, index):
+    fn = indexFileName(inputf)
+    try:
+        with open(fn, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+    except OSError:
+        sys.stderr.write("CAVA: WARNING: could not write index file " + fn + "\n")
+        return False
+    return True
+
+
+# Getting the pre-scan index of the input file, reusing (and optionally saving) the sidecar index
+def getInputIndex(inputf, useindex):
+    if useindex:
+        index = readIndex(inputf)
+        if index is not None:
+            return index
+    index = scanInput(inputf)
+    if useindex:
+        writeIndex(inputf, index)
+    return index
+
+
+# Number of work units the input file is split into
+# Plain gzip input is not seekable (every unit decompresses the file from the start), so it gets one unit per process
+def numOfWorkUnits(index, threads):
+    if threads == 1 or index['mode'] == 'LINE':
+        return threads
+    return max(threads, min(threads * UNITS_PER_THREAD, len(index['offsets'])))
+
+
+# Waiting for the annotation processes, printing out and logging progress information meanwhile
+# (progress counts records out of numOfRecords, or finished work units if the number of records is not known)
+def monitorProgress(processes, progress, numOfRecords, options, copts):
+    thr = 10
+    if not copts.stdout: initProgressInfo()
+    while True:
+        alive = False
+        for process in processes:
+            process.join(0.5)
+            if process.is_alive():
+                alive = True
+                break
+        if numOfRecords > 0:
+            if not copts.stdout:
+                printProgressInfo(progress.value, numOfRecords)
+            if options.args['logfile']:
+                while thr < 100 and 100 * progress.value / numOfRecords > thr:
+                    logging.info(str(thr) + '% of records annotated.')
+                    thr += 10
+        if not alive: break
+    if not copts.stdout: finalizeProgressInfo()
+
+
+# Checking if processes write to tmp files (merged at the end) rather than directly to the output file
+# Checkpoints need tmp files, so they are used with a single process too if checkpointing is switched on
+def useTmpFiles(copts):
+    return copts.threads > 1 or copts.checkpoint or copts.resume
+
+
 # Merging tmp files to final output file
 def mergeTmpFiles(output, fileformat, threads):
     filenames = []
     for i in range(1, threads + 1):
-        if fileformat == 'VCF':
-            filenames.append(output + '_tmp_' + str(i) + '.vcf')
-        else:
-            filenames.append(output + '_tmp_' + str(i) + '.txt')
+        filenames.append(checkpoint.tmpFileName(output, fileformat, i))
 
     if fileformat == 'VCF':
         outfn = output + '.vcf'
@@ -172,10 +539,12 @@ def mergeTmpFiles(output, fileformat, threads):
 ###########################################################################################################################################
 
 # Class representing a single annotation process
+# Work units (unit index, shard or region, see readUnit, and checkpoint to resume from or None) are taken from the
+# tasks queue until the None sentinel is received
 class SingleJob(multiprocessing.Process):
     # Process constructor
-    def __init__(self, threadidx, options, copts, startline, endline, genelist, transcriptlist, snplist, impactdir,
-                 numOfRecords):
+    def __init__(self, threadidx, options, copts, splitmode, tasks, progress, unitsdone, genelist, transcriptlist,
+                 snplist, impactdir, annot=None):
         multiprocessing.Process.__init__(self)
 
         # Thread index
@@ -185,168 +554,185 @@ class SingleJob(multiprocessing.Process):
         self.options = options
         self.copts = copts
 
-        # Start and end line indexes
-        self.startline = startline
-        self.endline = endline
-
-        # Gene, transcript and SNP lists
-        self.genelist = genelist
-        self.transcriptlist = transcriptlist
-        self.snplist = snplist
-
-        # Impact defintion directory
-        self.impactdir = impactdir
-
-        # Total number of records in the input file
-        self.numOfRecords = numOfRecords
-
-        # Get Allowed chromosomes from config or use default
-        with open(copts.conf, encoding='utf-8') as c:
-            for line in c:
-                if line.startswith('@chrom'):
-                    chroms = line[line.find('=') + 1:].strip().split(',')
-                    self.chroms = chroms
-        if self.chroms[0] == '.':
-            self.chroms = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17',
-                           '18', '19', '20', '21', '22', 'X', 'Y', 'MT']
-
-        # Input file
-        if copts.input.endswith('.gz')  or copts.input.endswith('.bgz'):
-            self.infile = gzip.open(copts.input, 'rt', encoding='utf-8')
-        else:
-            self.infile = open(copts.input, encoding='utf-8')
+        # Queue of work units (shards are byte offsets, BGZF virtual offsets or line indexes, depending on split mode,
+        # or genomic regions in REGION mode)
+        self.splitmode = splitmode
+        self.tasks = tasks
 
-        # Output file
-        if copts.threads > 1:
-            if options.args['outputformat'] == 'VCF':
-                outfn = copts.output + '_tmp_' + str(threadidx) + '.vcf'
-            else:
-                outfn = copts.output + '_tmp_' + str(threadidx) + '.txt'
-            self.outfile = open(outfn, 'w', encoding='utf-8')
-        else:
-            if options.args['outputformat'] == 'VCF':
-                outfn = copts.output + '.vcf'
-            else:
-                outfn = copts.output + '.txt'
-            self.outfile = open(outfn, 'a', encoding='utf-8')
-
-        # Ensembl, dbSNP databases
-        # Get Allowed chromosomes from config or use default
-        codon_usage = ['1']
-        with open(copts.conf, encoding='utf-8') as c:
-            for line in c:
-                if line.startswith('@codon_usage'):
-                    codon_usage = line[line.find('=') + 1:].strip().split(',')
-                    self.codon_usage = codon_usage
-
-        # Reference genome
-        self.reference = data.Reference(options)
-        if options.args['logfile'] and threadidx == 1: logging.info('Connected to reference genome.')
-
-        if (not options.args['ensembl'] == '.') and (not options.args['ensembl'] == ''):
-            # Pass reference to ensembl, so it can know the chromosome sizes
-            self.ensembl = data.Ensembl(options, genelist, transcriptlist, codon_usage[0], self.reference)
-            if options.args['logfile'] and threadidx == 1:
-                logging.info('Connected to Ensembl database.')
-        else:
-            self.ensembl = None
+        # Shared counters of annotated records and finished work units
+        self.progress = progress
+        self.unitsdone = unitsdone
 
-        if (not options.args['dbsnp'] == '.') and (not options.args['dbsnp'] == ''):
-            self.dbsnp = data.dbSNP(options)
-            if options.args['logfile'] and threadidx == 1: logging.info('Connected to dbSNP database.')
+        # Reference genome, Ensembl and dbSNP databases, target BED file
+        # (either shared with the parent, which loaded them before forking, or connected to by this process)
+        self.shared = annot is not None
+        if self.shared:
+            self.annotator = annot
         else:
-            self.dbsnp = None
-
-
-        # Target BED file
-        if (not options.args['target'] == '.') and (not options.args['target'] == ''):
-            self.targetBED = pysam.Tabixfile(options.args['target'], parser=pysam.asBed())
+            self.annotator = annotator.Annotator(options, copts.conf, genelist, transcriptlist, snplist, impactdir,
+                                                 log=(options.args['logfile'] and threadidx == 1))
+
+    # Opening the output file of a work unit (tmp files of resumed units are appended to)
+    def openOutput(self, unitidx, resumed):
+        if useTmpFiles(self.copts):
+            outfn = checkpoint.tmpFileName(self.copts.output, self.options.args['outputformat'], unitidx)
+            if resumed:
+                return open(outfn, 'a', encoding='utf-8')
+            return open(outfn, 'w', encoding='utf-8')
         else:
-            self.targetBED = None
-
-
-        # Reading (new) transcript2protein map for HGVSP annotation
-        if options.args['logfile'] and threadidx == 1:
-            logging.info("INFO: reading transcript2protein file\n")
-        options.transcript2protein = core.read_dict(options, 'transcript2protein')
-        if options.args['logfile'] and threadidx == 1:
-            logging.info("transcript2protein has " + str(len(options.transcript2protein)) + " mappings\n")
-
-        if not copts.stdout and threadidx == 1: initProgressInfo()
-
-        # Reading (new) transcript2protein map for HGVSP annotation
-        if options.args['logfile'] and threadidx == 1:
-            logging.info("INFO: reading transcript2protein file\n")
-        options.transcript2protein = core.read_dict(options, 'transcript2protein')
-        if options.args['logfile'] and threadidx == 1:
-            logging.info("transcript2protein has " + str(len(options.transcript2protein)) + " mappings\n")
+            if self.options.args['outputformat'] == 'VCF':
+                outfn = self.copts.output + '.vcf'
+            else:
+                outfn = self.copts.output + '.txt'
+            return open(outfn, 'a', encoding='utf-8')
 
     # Running process
     def run(self):
         if self.options.args['logfile']:
             logging.info('Process ' + str(self.threadidx) + ' - variant annotation started.')
 
-        # Iterating through input file
-        counter = 0
-        thr = 10
-        for line in self.infile:
-            counter += 1
-
-            # Considering lines between startline and endline only
-            if counter < int(self.startline): continue
-            if not self.endline == '':
-                if counter > int(self.endline): break
-
-            line = line.strip()
-            if line == '': continue
-#            sys.stderr.write("line="+line+"\n")
-            # Printing out progress information
-            if not self.copts.stdout and self.threadidx == 1:
-                if counter % 1000 == 0:
-                    printProgressInfo(counter, int(self.numOfRecords / self.copts.threads))
-
-            # Parsing record from input file
-            record = core.Record(line, self.options, self.targetBED,self.reference)
-
-            # Filtering out REFCALL records .. from original VCF annotation
-            if record.filter == 'REFCALL': continue
-
-            # Filtering record, if required
-            if self.options.args['filter'] and not record.filter == 'PASS': continue
-
-            # Only annotate records of allowed chromosome names
-            if record.chrom not in self.chroms:
-                logging.warning(
-                    "\t!!!!!!Chromosome " + record.chrom + " not found, skipping annotation, "+
-                    "but still outputting in VCF as long as within target region (if specified)!!!!!!\n")
+        # File handles inherited from the parent are not safe to use concurrently
+        if self.shared:
+            self.annotator.reopen()
+
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            (unitidx, unit, ckpt) = task
+            if ckpt is not None:
+                unit = ckpt['rest']
+                records = ckpt['records']
             else:
-                # Annotating the record based on the Ensembl, dbSNP and reference data
-                record.annotate(self.ensembl, self.dbsnp, self.reference, self.impactdir)
-
-            # Writing annotated record to output file
-            record.output(self.options.args['outputformat'], self.outfile, self.options, self.genelist,
-                          self.transcriptlist, self.snplist, self.copts.stdout)
-
-            # Writing progress information to log file
-            if self.threadidx == 1 and self.options.args['logfile']:
-                x = round(100 * counter / int(self.numOfRecords / self.copts.threads), 1)
-                x = min(x, 100.0)
-                if x > thr:
-                    logging.info(str(thr) + '% of records annotated.')
-                    thr += 10
-
-        # Closing output file
-        self.outfile.close()
+                records = 0
+            usetmp = useTmpFiles(self.copts)
+            outfile = self.openOutput(unitidx, ckpt is not None)
+
+            # Iterating through the shard or region of the input file
+            counter = 0
+            rest = unit
+            for (line, rest) in iterUnit(self.copts.input, self.splitmode, unit):
+                line = line.strip()
+                if line == '' or line.startswith('#'): continue
+
+                # Annotating record and writing it to output file
+                self.annotator.processLine(line, outfile, self.copts.stdout)
+
+                # Updating progress information
+                counter += 1
+                if counter % 1000 == 0:
+                    with self.progress.get_lock():
+                        self.progress.value += 1000
+
+                # Writing checkpoint (records written to the tmp file so far and where to continue from)
+                if usetmp and counter % CHECKPOINT_INTERVAL == 0:
+                    outfile.flush()
+                    checkpoint.writeCheckpoint(self.copts.output, unitidx, rest, os.fstat(outfile.fileno()).st_size,
+                                               records + counter, False)
+
+            # Closing output file
+            outfile.close()
+            if usetmp:
+                checkpoint.writeCheckpoint(self.copts.output, unitidx, rest, os.path.getsize(outfile.name),
+                                           records + counter, True)
+            with self.progress.get_lock():
+                self.progress.value += counter % 1000
+            with self.unitsdone.get_lock():
+                self.unitsdone.value += 1
 
-        # Finalizing progress info
-        if not self.copts.stdout and self.threadidx == 1:
-            finalizeProgressInfo()
+        if self.options.args['logfile']:
+            self.annotator.logStats('Process ' + str(self.threadidx))
+
+
+# Annotating a single shard of a manifest (cluster execution), the shard output has no header
+def runShard(options, copts, shardmanifest, genelist, transcriptlist, snplist, impactdir, annot):
+    fileformat = options.args['outputformat']
+    if not 1 <= copts.shard <= len(shardmanifest['shards']):
+        sys.stderr.write("CAVA: ERROR: shard " + str(copts.shard) + " is not in the manifest (1-" +
+                         str(len(shardmanifest['shards'])) + ")\n")
+        sys.exit(1)
+    if not fileformat == shardmanifest['outputformat']:
+        sys.stderr.write("CAVA: ERROR: output format of the manifest is " + shardmanifest['outputformat'] + "\n")
+        sys.exit(1)
+    if not os.path.getsize(copts.input) == shardmanifest['size']:
+        sys.stderr.write("CAVA: ERROR: input file " + copts.input + " changed since the manifest was written\n")
+        sys.exit(1)
+
+    # The shard is annotated by one process, appending to the (emptied) shard output file
+    shardcopts = copy.copy(copts)
+    shardcopts.output = manifest.shardPrefix(copts.output, copts.shard)
+    shardcopts.threads = 1
+    shardcopts.stdout = False
+    shardcopts.checkpoint = False
+    shardcopts.resume = False
+    if os.path.isfile(manifest.shardMarkerFileName(copts.output, copts.shard)):
+        os.remove(manifest.shardMarkerFileName(copts.output, copts.shard))
+    open(manifest.outputFileName(shardcopts.output, fileformat), 'w').close()
+
+    tasks = multiprocessing.Queue()
+    tasks.put((copts.shard, shardmanifest['shards'][copts.shard - 1], None))
+    tasks.put(None)
+    progress = multiprocessing.Value('l', 0)
+    unitsdone = multiprocessing.Value('l', 0)
+    process = SingleJob(1, options, shardcopts, shardmanifest['mode'], tasks, progress, unitsdone, genelist,
+                        transcriptlist, snplist, impactdir, annot)
+    process.start()
+    process.join()
+    if not process.exitcode == 0:
+        sys.stderr.write("CAVA: ERROR: annotation of shard " + str(copts.shard) + " failed\n")
+        sys.exit(1)
+
+    # Marking the shard as complete, for the merge step
+    manifest.writeShardMarker(copts.output, copts.shard, shardmanifest, progress.value)
+    if not copts.stdout:
+        print('\nShard ' + str(copts.shard) + ' of ' + str(len(shardmanifest['shards'])) + ': ' + str(progress.value) +
+              ' records annotated.')
+    if options.args['logfile']:
+        logging.info('Shard ' + str(copts.shard) + ': ' + str(progress.value) + ' records annotated.')
+
+
+# Validating the shard outputs of a manifest and merging them in shard order (cluster execution)
+def runMerge(options, copts, version, shardmanifest):
+    fileformat = options.args['outputformat']
+    if not fileformat == shardmanifest['outputformat']:
+        sys.stderr.write("CAVA: ERROR: output format of the manifest is " + shardmanifest['outputformat'] + "\n")
+        sys.exit(1)
+    errors = manifest.checkShards(copts.output, shardmanifest)
+    if len(errors) > 0:
+        for error in errors:
+            sys.stderr.write("CAVA: ERROR: " + error + "\n")
+        sys.exit(1)
+
+    outfname = manifest.outputFileName(copts.output, fileformat)
+    with open(outfname, 'w', encoding='utf-8') as outfile:
+        core.writeHeader(options, '\n'.join(shardmanifest['header']), outfile, False, version)
+        records = manifest.mergeShards(copts.output, shardmanifest, outfile)
+    if shardmanifest['records'] is not None and not records == shardmanifest['records']:
+        sys.stderr.write("CAVA: WARNING: " + str(records) + " records merged, input file has " +
+                         str(shardmanifest['records']) + "\n")
+    if not copts.stdout:
+        print('\nMerged ' + str(len(shardmanifest['shards'])) + ' shards: ' + str(records) + ' records.')
+    if options.args['logfile']:
+        logging.info('Merged ' + str(len(shardmanifest['shards'])) + ' shards: ' + str(records) + ' records.')
 
 
 def run(copts, version):
     copts.threads = int(copts.threads)
-    if copts.threads > 1:
-        copts.stdout = False
+
+    # Shard and merge steps of cluster execution take the input file from the manifest
+    shardmanifest = None
+    if copts.shard is not None or copts.merge:
+        if copts.manifest is None:
+            print('\nError: no manifest file specified (option --manifest).\n')
+            quit()
+        shardmanifest = manifest.readManifest(copts.manifest)
+        if shardmanifest is None:
+            print('\nError: manifest file (' + copts.manifest + ') cannot be read.\n')
+            quit()
+        copts.input = shardmanifest['input']
+
+    # The streaming engine is needed to read standard input or to write standard output with multiple processes
+    streaming = copts.stream or copts.input == '-' or (copts.stdout and copts.threads > 1)
 
     # Check if input and configuration files exist
     if copts.conf is None:
@@ -356,7 +742,8 @@ def run(copts, version):
     if not os.path.isfile(copts.conf):
         print('\nError: configuration file (' + copts.conf + ') cannot be found.\n')
         quit()
-    if not os.path.isfile(copts.input):
+    if not copts.input == '-' and not copts.merge and copts.serve is None and not copts.proteindb and \
+            not os.path.isfile(copts.input):
         print('\nError: input file (' + copts.input + ') cannot be found.\n')
         quit()
 
@@ -379,36 +766,164 @@ def run(copts, version):
     core.checkOptions(options)
 
     # Printing out configuration, input and output file names
-    if not copts.stdout:
+    if not copts.stdout and copts.serve is None and not copts.proteindb:
         printInputFileNames(copts, options)
 
+    # Cluster execution, merge step: the databases are not needed
+    if copts.merge:
+        runMerge(options, copts, version, shardmanifest)
+        if not copts.stdout:
+            printEndInfo(options, copts, starttime)
+        return
+
     # Reading gene, transcript and snp lists from files
     genelist = core.readSet(options, 'genelist')
     transcriptlist = core.readSet(options, 'transcriptlist')
     snplist = core.readSet(options, 'snplist')
 
     # Reading (new) transcript2protein map for HGVSP annotation
-    print("INFO: reading transcript2protein file\n")
+    if not copts.stdout:
+        print("INFO: reading transcript2protein file\n")
     options.transcript2protein = core.read_dict(options, 'transcript2protein')
 
-    print("transcript2protein has " + str(len(options.transcript2protein)) + " mappings\n")
+    if not copts.stdout:
+        print("transcript2protein has " + str(len(options.transcript2protein)) + " mappings\n")
     # Parsing @impactdef string
-    if not (options.args['impactdef'] == '.' or options.args['impactdef'] == ''):
-        impactdir = dict()
-        valuev = options.args['impactdef'].split('|')
-        for i in range(len(valuev)):
-            classv = valuev[i].split(',')
-            for c in classv:
-                impactdir[c.strip()] = str(i + 1)
+    impactdir = annotator.readImpactDef(options)
+
+    # Precomputing the reference sequences of all transcripts of the database (no annotation)
+    if copts.proteindb:
+        annot = annotator.Annotator(options, copts.conf, genelist, transcriptlist, snplist, impactdir)
+        if annot.ensembl is None:
+            sys.stderr.write("CAVA: ERROR: no @ensembl database given\n")
+            sys.exit(1)
+        n = proteindb.build(annot.ensembl, annot.reference)
+        if not copts.stdout:
+            print('Reference sequences of ' + str(n) + ' transcripts written to ' +
+                  proteindb.proteinDBFileName(options.args['ensembl']))
+            print('Total runtime: ' + str(datetime.datetime.now() - starttime))
+            print("-----------------------------------------------------------------------\n")
+        if options.args['logfile']:
+            logging.info('Reference sequences of ' + str(n) + ' transcripts precomputed.')
+        return
+
+    # Writing the slim compiled transcript database of the gene and transcript lists once, before the annotation
+    # processes (which only open it) are started
+    if not options.args['ensembl'] in ('.', '') and options.args['loadalltranscripts'] is True:
+        compileddb.prepareCompiled(options.args['ensembl'], genelist, transcriptlist)
+
+    # Preloading mode: databases are connected to and indexed once, and shared with the processes copy-on-write
+    # (always used by the annotation server)
+    annot = None
+    if copts.preload or copts.serve is not None:
+        if not multiprocessing.get_start_method() == 'fork':
+            sys.stderr.write("CAVA: WARNING: --preload needs the fork start method, databases are loaded by each "
+                             "process\n")
+        else:
+            annot = annotator.Annotator(options, copts.conf, genelist, transcriptlist, snplist, impactdir,
+                                        log=options.args['logfile'])
+            annot.preload()
+            # Objects created so far are never collected, so the garbage collector does not touch their pages
+            gc.freeze()
+            if options.args['logfile']:
+                logging.info('Databases preloaded.')
+
+    # Annotation server: answering annotation requests until interrupted
+    if copts.serve is not None:
+        server.run(options, copts, genelist, transcriptlist, snplist, impactdir, annot)
+        return
+
+    # Cluster execution, shard step: annotating one shard of the manifest
+    if shardmanifest is not None:
+        runShard(options, copts, shardmanifest, genelist, transcriptlist, snplist, impactdir, annot)
+        return
+
+    # Streaming engine: reader, annotation processes and ordered writer, no tmp files
+    if streaming:
+        pipeline.run(options, copts, version, genelist, transcriptlist, snplist, impactdir, annot)
+        if not copts.stdout:
+            printEndInfo(options, copts, starttime)
+        return
+
+    # Resuming an interrupted run: the work units are taken from the plan of that run
+    plan = None
+    if copts.resume:
+        plan = checkpoint.readPlan(copts.output, copts.input, options.args['outputformat'])
+        if plan is None:
+            sys.stderr.write("CAVA: WARNING: no checkpoint of an earlier run with this input and output found, "
+                             "starting from scratch\n")
+
+    # Region mode: bgzipped, tabix-indexed input is split by genomic region, without scanning the input file
+    regionmode = copts.regions is not None and hasRegionIndex(copts.input)
+    if copts.regions is not None and not regionmode and plan is None:
+        sys.stderr.write("CAVA: WARNING: input file is not bgzipped and tabix-indexed, --regions is ignored\n")
+
+    if plan is not None:
+        splitmode = plan['mode']
+        regionmode = splitmode == 'REGION'
+        header = plan['header']
+        numOfRecords = plan['records']
+        units = plan['units']
+        numOfUnits = len(units)
+        if not copts.stdout:
+            print('\nResuming earlier run: ' + str(numOfUnits) + ' work units.\n')
+        if options.args['logfile']:
+            logging.info('Resuming earlier run with ' + str(numOfUnits) + ' work units.')
+    elif regionmode:
+        header = readRegionHeader(copts.input)
+        if annot is not None:
+            units = findRegions(copts.input, copts.regions, annot.reference.reflens)
+        else:
+            units = findRegions(copts.input, copts.regions, data.Reference(options).reflens)
+        numOfUnits = len(units)
+        if not copts.stdout:
+            printNumOfRegions(numOfUnits)
+        if options.args['logfile']:
+            logging.info(str(numOfUnits) + ' genomic regions to be annotated.')
     else:
-        impactdir = None
+        # Pre-scanning input file (header, number of records and shard offsets in a single pass)
+        index = getInputIndex(copts.input, copts.index)
+        header = index['header']
+        if options.args['logfile']:
+            logging.info('Input file scanned.')
+
+        # Counting and printing out number of records of input file
+        numOfRecords = index['records']
+        if not copts.stdout:
+            printNumOfRecords(numOfRecords)
+        if options.args['logfile']:
+            logging.info(str(numOfRecords) + ' records to be annotated.')
+
+        # Find break points in the input file, splitting it into work units handed out to the processes on demand
+        # (or into the shards of the manifest, in the plan step of cluster execution)
+        if copts.plan is not None:
+            numOfUnits = copts.plan
+        else:
+            numOfUnits = numOfWorkUnits(index, copts.threads)
+        units = findFileBreaks(copts.input, numOfUnits, index, copts.balance == 'cost')
 
-    # Counting and printing out number of records of input file
-    numOfRecords = core.countRecords(copts.input)
-    if not copts.stdout:
-        printNumOfRecords(numOfRecords)
-    if options.args['logfile']:
-        logging.info(str(numOfRecords) + ' records to be annotated.')
+    if plan is None:
+        if regionmode:
+            splitmode = 'REGION'
+            numOfRecords = None
+        else:
+            splitmode = getSplitMode(copts.input)
+
+        # Cluster execution, plan step: writing the manifest instead of annotating
+        if copts.plan is not None:
+            fn = manifest.manifestFileName(copts.output)
+            manifest.writeManifest(fn, manifest.makeManifest(copts.input, splitmode, options.args['outputformat'],
+                                                             header, numOfRecords, units))
+            if not copts.stdout:
+                print('Manifest of ' + str(len(units)) + ' shards written to ' + fn + '\n')
+            if options.args['logfile']:
+                logging.info('Manifest of ' + str(len(units)) + ' shards written to ' + fn)
+            return
+        # Saving the plan of the run, so it can be resumed if interrupted
+        if useTmpFiles(copts):
+            checkpoint.removeCheckpoints(copts.output)
+            checkpoint.writePlan(copts.output, copts.input, splitmode, options.args['outputformat'], header,
+                                 numOfRecords, [list(unit) for unit in units])
 
     # Writing header to output file
     if options.args['outputformat'] == 'VCF':
@@ -416,7 +931,6 @@ def run(copts, version):
     else:
         outfname = copts.output + '.txt'
     outfile = open(outfname, 'w', encoding='utf-8')
-    header = readHeader(copts.input)
     try:
         core.writeHeader(options, '\n'.join(header), outfile, copts.stdout, version)
     except:
@@ -424,28 +938,57 @@ def run(copts, version):
         exit(1)
     outfile.close()
 
-    # Find break points in the input file
-    breaks = findFileBreaks(copts.input, copts.threads)
-
+    # Work units are handed out to the processes on demand, tmp files are merged in unit order
+    # (when resuming, finished units are skipped and partial units continue from their last checkpoint)
+    tasks = multiprocessing.Queue()
+    progress = multiprocessing.Value('l', 0)
+    unitsdone = multiprocessing.Value('l', 0)
+    for i in range(numOfUnits):
+        ckpt = None
+        if plan is not None:
+            ckpt = checkpoint.resumeUnit(copts.output, options.args['outputformat'], i + 1)
+            if ckpt is not None:
+                progress.value += ckpt['records']
+                if ckpt['done']:
+                    unitsdone.value += 1
+                    continue
+        tasks.put((i + 1, units[i], ckpt))
+    for i in range(copts.threads):
+        tasks.put(None)
 
     # Initializing annotation processes
-    threadidx = 0
     processes = []
-    for (startline, endline) in breaks:
-        threadidx += 1
+    for threadidx in range(1, copts.threads + 1):
         processes.append(
-            SingleJob(threadidx, options, copts, startline, endline, genelist, transcriptlist, snplist, impactdir,
-                      numOfRecords))
+            SingleJob(threadidx, options, copts, splitmode, tasks, progress, unitsdone, genelist, transcriptlist,
+                      snplist, impactdir, annot))
 
     # Running annotation processes
     for process in processes:
         process.start()
+    if regionmode:
+        monitorProgress(processes, unitsdone, numOfUnits, options, copts)
+        if options.args['logfile']:
+            logging.info(str(progress.value) + ' records annotated.')
+    else:
+        monitorProgress(processes, progress, numOfRecords, options, copts)
+
+    # Tmp files and checkpoints are kept if an annotation process failed, so the run can be resumed
     for process in processes:
-        process.join()
+        if not process.exitcode == 0:
+            sys.stderr.write("CAVA: ERROR: annotation process " + str(process.threadidx) + " failed")
+            if useTmpFiles(copts):
+                sys.stderr.write(", run again with --resume to continue\n")
+            else:
+                sys.stderr.write(", output is incomplete\n")
+            if options.args['logfile']:
+                logging.error('Annotation process ' + str(process.threadidx) + ' failed.')
+            sys.exit(1)
 
     # Merging tmp files
-    if copts.threads > 1:
-        mergeTmpFiles(copts.output, options.args['outputformat'], copts.threads)
+    if useTmpFiles(copts):
+        mergeTmpFiles(copts.output, options.args['outputformat'], numOfUnits)
+        checkpoint.removeCheckpoints(copts.output)
 
 
     # Printing out summary information and end time
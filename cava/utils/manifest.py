@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+
+# Shard manifests for running CAVA on several nodes: the manifest lists the shards (work units) of an input file,
+# every shard is annotated by a separate CAVA run, and the shard outputs are validated and merged in order
+#######################################################################################################################
+
+import hashlib
+import json
+import os
+
+from . import checkpoint
+
+MANIFEST_VERSION = 1
+
+
+# Name of the output file with the given prefix
+def outputFileName(prefix, fileformat):
+    if fileformat == 'VCF':
+        return prefix + '.vcf'
+    return prefix + '.txt'
+
+
+# Name of the manifest file written by the plan step
+def manifestFileName(output):
+    return output + '.manifest.json'
+
+
+# Output prefix of a shard (shards are numbered from 1)
+def shardPrefix(output, shardidx):
+    return output + '_shard_' + str(shardidx)
+
+
+# Name of the file marking a shard as successfully annotated
+def shardMarkerFileName(output, shardidx):
+    return shardPrefix(output, shardidx) + '.done.json'
+
+
+# Creating the manifest of an input file: split mode, output format, header, number of records (None if not known)
+# and shards; the id identifies the manifest in the shard markers
+def makeManifest(inputf, mode, fileformat, header, records, units):
+    manifest = {'version': MANIFEST_VERSION, 'input': os.path.abspath(inputf), 'size': os.path.getsize(inputf),
+                'mode': mode, 'outputformat': fileformat, 'header': header, 'records': records,
+                'shards': [list(unit) for unit in units]}
+    manifest['id'] = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()
+    return manifest
+
+
+# Writing the manifest file
+def writeManifest(fn, manifest):
+    checkpoint.writeJSON(fn, manifest)
+
+
+# Reading the manifest file, returns None if it is missing, cannot be read or is of another version
+def readManifest(fn):
+    manifest = checkpoint.readJSON(fn)
+    if manifest is None or not manifest.get('version') == MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+# Writing the marker of a successfully annotated shard (manifest id, number of records and size of the shard output)
+def writeShardMarker(output, shardidx, manifest, records):
+    fn = outputFileName(shardPrefix(output, shardidx), manifest['outputformat'])
+    checkpoint.writeJSON(shardMarkerFileName(output, shardidx),
+                         {'manifest': manifest['id'], 'shard': shardidx, 'records': records,
+                          'size': os.path.getsize(fn)})
+
+
+# Checking the output of a shard, returns the error message (None if the shard output is complete)
+def checkShard(output, shardidx, manifest):
+    fn = outputFileName(shardPrefix(output, shardidx), manifest['outputformat'])
+    marker = checkpoint.readJSON(shardMarkerFileName(output, shardidx))
+    if marker is None:
+        return 'shard ' + str(shardidx) + ' has not been annotated (no ' + shardMarkerFileName(output, shardidx) + ')'
+    if not marker.get('manifest') == manifest['id'] or not marker.get('shard') == shardidx:
+        return 'shard ' + str(shardidx) + ' was annotated with another manifest'
+    if not os.path.isfile(fn) or not os.path.getsize(fn) == marker['size']:
+        return 'output of shard ' + str(shardidx) + ' (' + fn + ') is missing or incomplete'
+    return None
+
+
+# Validating all shard outputs, returns the list of error messages (empty if all shards are complete)
+def checkShards(output, manifest):
+    errors = []
+    for shardidx in range(1, len(manifest['shards']) + 1):
+        error = checkShard(output, shardidx, manifest)
+        if error is not None:
+            errors.append(error)
+    return errors
+
+
+# Appending the shard outputs in shard order to the (open) output file, returns the number of records
+def mergeShards(output, manifest, outfile):
+    records = 0
+    for shardidx in range(1, len(manifest['shards']) + 1):
+        with open(outputFileName(shardPrefix(output, shardidx), manifest['outputformat']), encoding='utf-8') as infile:
+            for line in infile:
+                outfile.write(line)
+        records += checkpoint.readJSON(shardMarkerFileName(output, shardidx))['records']
+    return records
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+
+# Nested containment list (NCList) of intervals: the intervals are sorted by start, and intervals contained in another
+# interval are kept in the sublist of that interval, so that within every list both starts and ends are increasing
+# and overlap and containment queries take O(log n + k) time with every interval stored once; a Sweep answers the
+# queries of coordinate sorted input by moving a cursor along the intervals instead
+#######################################################################################################################
+
+import bisect
+import sys
+
+# Number of intervals a Sweep passes at most between two queries, reseeding its active set from the NCList beyond that
+SWEEP_MAX_STEP = 64
+
+
+# Class representing an NCList of (start, end, item) intervals; queries return the items in the order they were added
+class NCList(object):
+    # Constructor (intervals is a list of (start, end, item) tuples)
+    def __init__(self, intervals):
+        # Every (sub)list is stored as the lists of its starts, ends, positions (order of the intervals in the input)
+        # and the index of the sublist of every interval (-1 if it contains no other interval)
+        self.starts = []
+        self.ends = []
+        self.positions = []
+        self.sublists = []
+        self.items = [interval[2] for interval in intervals]
+        self.sortedintervals = None
+        order = sorted(range(len(intervals)), key=lambda i: (intervals[i][0], -intervals[i][1], i))
+        self.newList()
+        stack = []  # (list index, index in the list) of the intervals containing the current one
+        for i in order:
+            (start, end, _) = intervals[i]
+            while len(stack) > 0 and self.ends[stack[-1][0]][stack[-1][1]] < end:
+                stack.pop()
+            if len(stack) == 0:
+                listidx = 0
+            else:
+                (parent, parentidx) = stack[-1]
+                listidx = self.sublists[parent][parentidx]
+                if listidx == -1:
+                    listidx = self.newList()
+                    self.sublists[parent][parentidx] = listidx
+            self.starts[listidx].append(start)
+            self.ends[listidx].append(end)
+            self.positions[listidx].append(i)
+            self.sublists[listidx].append(-1)
+            stack.append((listidx, len(self.starts[listidx]) - 1))
+
+    # Adding an empty sublist, returns its index
+    def newList(self):
+        self.starts.append([])
+        self.ends.append([])
+        self.positions.append([])
+        self.sublists.append([])
+        return len(self.starts) - 1
+
+    # Number of intervals
+    def __len__(self):
+        return len(self.items)
+
+    # Items of the (half-open) intervals overlapping [start, end)
+    def overlapping(self, start, end):
+        ret = []
+        lists = [0]
+        while len(lists) > 0:
+            listidx = lists.pop()
+            lo = bisect.bisect_right(self.ends[listidx], start)
+            hi = bisect.bisect_left(self.starts[listidx], end)
+            for j in range(lo, hi):
+                ret.append(self.positions[listidx][j])
+                if self.sublists[listidx][j] != -1:
+                    lists.append(self.sublists[listidx][j])
+        ret.sort()
+        return [self.items[i] for i in ret]
+
+    # Items of the intervals containing [start, end], i.e. interval start <= start and interval end >= end
+    def containing(self, start, end):
+        return [self.items[i] for i in self.containingPositions(start, end)]
+
+    # Positions (order in the input, sorted) of the intervals containing [start, end]
+    def containingPositions(self, start, end):
+        ret = []
+        lists = [0]
+        while len(lists) > 0:
+            listidx = lists.pop()
+            lo = bisect.bisect_left(self.ends[listidx], end)
+            hi = bisect.bisect_right(self.starts[listidx], start)
+            for j in range(lo, hi):
+                ret.append(self.positions[listidx][j])
+                if self.sublists[listidx][j] != -1:
+                    lists.append(self.sublists[listidx][j])
+        ret.sort()
+        return ret
+
+    # Starts and positions of all intervals in start order, and ends by position (computed at first use, for Sweep)
+    def sortedIntervals(self):
+        if self.sortedintervals is None:
+            entries = []
+            for listidx in range(len(self.starts)):
+                for j in range(len(self.starts[listidx])):
+                    entries.append((self.starts[listidx][j], self.positions[listidx][j], self.ends[listidx][j]))
+            entries.sort()
+            ends = [0] * len(entries)
+            for (_, position, end) in entries:
+                ends[position] = end
+            self.sortedintervals = ([entry[0] for entry in entries], [entry[1] for entry in entries], ends)
+        return self.sortedintervals
+
+    # Estimated memory use (bytes) of the NCList, its items and its sorted intervals (computed if not done yet, as
+    # every index queried by a Sweep needs them)
+    def memoryEstimate(self):
+        lists = [self.starts, self.ends, self.positions, self.sublists, self.items]
+        lists += self.starts + self.ends + self.positions + self.sublists + list(self.sortedIntervals())
+        ret = sum(sys.getsizeof(values) for values in lists) + sum(sys.getsizeof(item) for item in self.items)
+        # Integers beyond the range cached by Python are separate objects (shared by the lists and sorted intervals)
+        for values in self.starts + self.ends + self.positions + self.sublists:
+            for value in values:
+                if value > 256:
+                    ret += sys.getsizeof(value)
+        return ret
+
+
+# Cursor sweeping the intervals of an NCList from left to right: for queries with non-decreasing start positions
+# (coordinate sorted input), the intervals containing the current position are kept in an active set, updated with
+# the intervals started or ended since the previous query. Queries going back (or with end < start) fall back to the
+# NCList, and the first query and long jumps reseed the active set from the NCList.
+class Sweep(object):
+    # Constructor (index is the NCList of the intervals)
+    def __init__(self, index):
+        self.index = index
+        (self.starts, self.positions, self.ends) = index.sortedIntervals()
+        self.next = 0  # first interval (in start order) not passed yet
+        self.active = []  # positions of the intervals containing the current position, sorted
+        self.point = None  # current position
+        self.sweeps = 0
+        self.fallbacks = 0
+
+    # Items of the intervals containing [start, end], as NCList.containing
+    def containing(self, start, end):
+        if end < start or (self.point is not None and start < self.point):
+            self.fallbacks += 1
+            return self.index.containing(start, end)
+        stop = bisect.bisect_right(self.starts, start, self.next)
+        if self.point is None or stop - self.next > SWEEP_MAX_STEP:
+            self.active = self.index.containingPositions(start, start)
+        else:
+            ends = self.ends
+            active = [i for i in self.active if ends[i] >= start]
+            added = False
+            for k in range(self.next, stop):
+                if ends[self.positions[k]] >= start:
+                    active.append(self.positions[k])
+                    added = True
+            if added:
+                active.sort()
+            self.active = active
+            self.sweeps += 1
+        self.next = stop
+        self.point = start
+        return [self.index.items[i] for i in self.active if self.ends[i] >= end]
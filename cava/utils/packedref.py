@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+
+# Packed reference genome: a companion file of a (faidx-indexed) FASTA file holding every chromosome as one contiguous,
+# uppercase, uncompressed sequence, with a table of their offsets, memory mapped by CAVA so that reference sequence is
+# sliced directly from the page cache shared by all processes, instead of being fetched through pysam
+#######################################################################################################################
+
+import json
+import mmap
+import os
+import struct
+import sys
+
+from . import compileddb
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/pysamdir')
+import pysam
+
+MAGIC = b'CAVAREF\x00'
+PACKED_VERSION = 1
+
+# Number of bases read from the FASTA file at once when packing
+CHUNK = 16 * 1024 * 1024
+
+
+# Name of the packed companion file of a FASTA file
+def packedFileName(fasta):
+    return fasta + '.packed'
+
+
+# Packing a FASTA file into its companion file, returns the number of chromosomes
+def pack(fasta, outfn=None):
+    if outfn is None:
+        outfn = packedFileName(fasta)
+    fastafile = pysam.FastaFile(fasta)
+
+    # Header: magic, length of the metadata, metadata (JSON), then the sequences
+    contigs = dict()
+    offset = 0
+    for i in range(len(fastafile.references)):
+        contigs[fastafile.references[i]] = [offset, fastafile.lengths[i]]
+        offset += fastafile.lengths[i]
+    metadata = {'version': PACKED_VERSION, 'source': compileddb.fingerprint(fasta), 'contigs': contigs}
+    metabytes = json.dumps(metadata).encode('utf-8')
+
+    partfn = outfn + '.' + str(os.getpid()) + '.part'
+    with open(partfn, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(struct.pack('<Q', len(metabytes)))
+        outfile.write(metabytes)
+        for chrom in fastafile.references:
+            length = contigs[chrom][1]
+            for start in range(0, length, CHUNK):
+                outfile.write(fastafile.fetch(chrom, start, min(start + CHUNK, length)).upper().encode('ascii'))
+    os.replace(partfn, outfn)
+    return len(contigs)
+
+
+# Class representing a memory mapped packed reference genome
+class PackedReference(object):
+    # Constructor
+    def __init__(self, fn):
+        self.filename = fn
+        with open(fn, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self.mm[:len(MAGIC)] == MAGIC:
+            raise ValueError('not a packed reference genome: ' + fn)
+        (metalen,) = struct.unpack('<Q', self.mm[len(MAGIC):len(MAGIC) + 8])
+        start = len(MAGIC) + 8
+        self.metadata = json.loads(self.mm[start:start + metalen].decode('utf-8'))
+        self.start = start + metalen
+        self.contigs = self.metadata['contigs']
+
+    # Checking if the packed reference genome can be used for the given FASTA file
+    def matches(self, fasta):
+        return self.metadata.get('version') == PACKED_VERSION and self.metadata['source'] == compileddb.fingerprint(fasta)
+
+    # Sequence of a region of a chromosome (0-based start, 1-based end, as pysam.FastaFile.fetch), in upper case
+    def fetch(self, chrom, start, end):
+        (offset, length) = self.contigs[chrom]
+        start = self.start + offset + max(0, start)
+        end = self.start + offset + min(end, length)
+        return self.mm[start:end].decode('ascii')
+
+
+# Opening the packed companion file of a FASTA file, returns None if there is none or it is out of date
+def openPacked(fasta):
+    fn = packedFileName(fasta)
+    if not os.path.isfile(fn):
+        return None
+    try:
+        packed = PackedReference(fn)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("CAVA: WARNING: cannot read packed reference genome " + fn + ": " + str(e) + "\n")
+        return None
+    if not packed.matches(fasta):
+        sys.stderr.write("CAVA: WARNING: packed reference genome " + fn + " does not match " + fasta +
+                         ", not used (pack it again)\n")
+        return None
+    return packed
+
+
+if __name__ == '__main__':
+    # Packing the FASTA files given as arguments
+    for fasta in sys.argv[1:]:
+        n = pack(fasta)
+        print('Packed ' + str(n) + ' chromosomes of ' + fasta + ' into ' + packedFileName(fasta))
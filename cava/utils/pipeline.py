@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+
+# Streaming execution engine: one reader feeds batches of raw input lines to a pool of annotation processes,
+# and an ordered writer re-sequences the annotated batches, so output is written while the run is in progress
+#######################################################################################################################
+
+import gzip
+import io
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+
+from . import annotator
+from . import core
+
+
+# Estimated cost (in SNV equivalents, see annotator.estimateCost) of the input lines sent to a worker at a time
+BATCHSIZE = 200
+
+# Maximum number of batches (per worker) read ahead of the writer, bounding memory use when a batch is slow
+INFLIGHT = 8
+
+
+# Opening the input of the streaming engine ('-' is standard input)
+def openStream(inputf):
+    if inputf == '-':
+        return sys.stdin
+    if inputf.endswith('.gz') or inputf.endswith('.bgz'):
+        return gzip.open(inputf, 'rt', encoding='utf-8')
+    return open(inputf, encoding='utf-8')
+
+
+# Reading the header of the input stream, returns the header lines and the first record line (None if no records)
+def readStreamHeader(infile):
+    header = []
+    for line in infile:
+        line = line.strip()
+        if line == '': continue
+        if line.startswith('#'):
+            header.append(line)
+        else:
+            return header, line
+    return header, None
+
+
+# Iterating through batches of (stripped, non-header) record lines of the input stream
+# A batch is closed once the estimated cost of its lines reaches batchsize, so batches of indels are shorter
+def readBatches(infile, first, batchsize):
+    batch = []
+    cost = 0
+    if first is not None:
+        batch.append(first)
+        cost += annotator.estimateCost(first)
+    for line in infile:
+        line = line.strip()
+        if line == '' or line.startswith('#'): continue
+        if cost >= batchsize:
+            yield batch
+            batch = []
+            cost = 0
+        batch.append(line)
+        cost += annotator.estimateCost(line)
+    if len(batch) > 0:
+        yield batch
+
+
+# Printing out progress information (the total number of records is not known in advance)
+def printProgressCount(counter):
+    sys.stdout.write('\rAnnotating variants ... ' + str(counter) + ' records')
+    sys.stdout.flush()
+
+
+# Finalizing progress information
+def finalizeProgressCount(counter):
+    sys.stdout.write('\rAnnotating variants ... ' + str(counter) + ' records')
+    sys.stdout.flush()
+    print(' - Done.')
+
+
+###########################################################################################################################################
+
+# Class representing an annotation process of the streaming engine
+class StreamWorker(multiprocessing.Process):
+    # Process constructor
+    def __init__(self, workeridx, options, copts, genelist, transcriptlist, snplist, impactdir, tasks, results,
+                 annot=None):
+        multiprocessing.Process.__init__(self)
+        self.workeridx = workeridx
+        self.options = options
+        self.copts = copts
+        self.genelist = genelist
+        self.transcriptlist = transcriptlist
+        self.snplist = snplist
+        self.impactdir = impactdir
+        self.tasks = tasks
+        self.results = results
+        self.annotator = annot
+
+    # Running process: annotating batches until the None sentinel is received
+    def run(self):
+        # Database connections are opened in the process itself (or reopened, if shared with the parent),
+        # file handles are not shared between processes
+        if self.annotator is None:
+            self.annotator = annotator.Annotator(self.options, self.copts.conf, self.genelist, self.transcriptlist,
+                                                 self.snplist, self.impactdir,
+                                                 log=(self.options.args['logfile'] and self.workeridx == 1))
+        else:
+            self.annotator.reopen()
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            (batchidx, lines) = task
+            self.processBatch(batchidx, lines)
+        if self.options.args['logfile']:
+            self.annotator.logStats('Process ' + str(self.workeridx))
+
+    # Annotating a batch of input lines and sending the annotated lines to the results queue
+    def processBatch(self, batchidx, lines):
+        out = io.StringIO()
+        for line in lines:
+            self.annotator.processLine(line, out, False)
+        self.results.put((batchidx, len(lines), out.getvalue()))
+
+
+# Thread writing the annotated batches to the output in input order
+class OrderedWriter(threading.Thread):
+    # Constructor
+    def __init__(self, results, outfile, workers, slots, progress):
+        threading.Thread.__init__(self)
+        self.results = results
+        self.outfile = outfile
+        self.workers = workers
+        self.slots = slots
+        self.progress = progress
+        self.numOfRecords = 0
+        self.failed = False
+
+    # Running thread: batches arriving out of order are kept until all preceding batches are written
+    def run(self):
+        pending = dict()
+        nextidx = 0
+        numOfBatches = None
+        while numOfBatches is None or nextidx < numOfBatches:
+            try:
+                (batchidx, n, text) = self.results.get(timeout=1)
+            except queue.Empty:
+                for worker in self.workers:
+                    if worker.exitcode is not None and worker.exitcode != 0:
+                        self.failed = True
+                        return
+                continue
+            # Sent by the reader once the input is exhausted
+            if batchidx == -1:
+                numOfBatches = n
+                continue
+            pending[batchidx] = (n, text)
+            while nextidx in pending:
+                (n, text) = pending.pop(nextidx)
+                self.outfile.write(text)
+                self.numOfRecords += n
+                nextidx += 1
+                self.slots.release()
+                if self.progress:
+                    printProgressCount(self.numOfRecords)
+        self.outfile.flush()
+
+
+# Running the streaming engine
+# (annot is the Annotator preloaded by the parent, if any)
+def run(options, copts, version, genelist, transcriptlist, snplist, impactdir, annot=None):
+    # Reading header from input stream and writing it to the output
+    infile = openStream(copts.input)
+    header, first = readStreamHeader(infile)
+    if copts.stdout:
+        outfile = sys.stdout
+    else:
+        if options.args['outputformat'] == 'VCF':
+            outfname = copts.output + '.vcf'
+        else:
+            outfname = copts.output + '.txt'
+        outfile = open(outfname, 'w', encoding='utf-8')
+    core.writeHeader(options, '\n'.join(header), outfile, copts.stdout, version)
+
+    # Initializing annotation processes and the ordered writer
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    workers = []
+    for i in range(1, copts.threads + 1):
+        workers.append(StreamWorker(i, options, copts, genelist, transcriptlist, snplist, impactdir, tasks, results,
+                                    annot))
+    slots = threading.BoundedSemaphore(INFLIGHT * copts.threads)
+    writer = OrderedWriter(results, outfile, workers, slots, not copts.stdout)
+
+    if options.args['logfile']:
+        logging.info('Streaming annotation started with ' + str(copts.threads) + ' processes.')
+    for worker in workers:
+        worker.start()
+    writer.start()
+
+    # Reading input in batches, waiting for a free slot so the reader never runs too far ahead of the writer
+    numOfBatches = 0
+    for batch in readBatches(infile, first, BATCHSIZE):
+        while not slots.acquire(timeout=1):
+            if writer.failed:
+                break
+        if writer.failed:
+            break
+        tasks.put((numOfBatches, batch))
+        numOfBatches += 1
+    results.put((-1, numOfBatches, None))
+    for _ in workers:
+        tasks.put(None)
+
+    writer.join()
+    if writer.failed:
+        for worker in workers:
+            worker.terminate()
+        sys.stderr.write("CAVA: ERROR: an annotation process failed, output is incomplete.\n")
+        if options.args['logfile']:
+            logging.error('An annotation process failed, output is incomplete.')
+        sys.exit(1)
+    for worker in workers:
+        worker.join()
+
+    if not copts.stdout:
+        outfile.close()
+        finalizeProgressCount(writer.numOfRecords)
+    if options.args['logfile']:
+        logging.info(str(writer.numOfRecords) + ' records annotated.')
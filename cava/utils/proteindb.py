@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+
+# Precomputed reference sequences of the transcripts: a bgzipped, tabix-indexed companion file of a transcript
+# database holding the reference protein and the exon sequences of every transcript on a given reference genome,
+# so that annotation only looks up the reference side instead of fetching and translating all exons
+#######################################################################################################################
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+from . import compileddb
+from . import core
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)) + '/pysamdir')
+import pysam
+
+PROTEINDB_VERSION = 1
+
+# Header line holding the settings the sequences were computed with
+HEADER = '#CAVA_PROTEINDB='
+
+
+# Name of the precomputed sequence file of a transcript database
+def proteinDBFileName(dbfile):
+    return dbfile + '.prot.gz'
+
+
+# Settings the reference sequences depend on: transcript database, reference genome (its index), codon table and
+# selenocysteine genes
+def settings(dbfile, reference, codon_usage, selenogenes):
+    faifile = reference.filename + '.fai'
+    if os.path.isfile(faifile):
+        with open(faifile, 'rb') as f:
+            genome = hashlib.sha1(f.read()).hexdigest()
+    else:
+        genome = compileddb.fingerprint(reference.filename)
+    return {'version': PROTEINDB_VERSION, 'database': compileddb.fingerprint(dbfile), 'reference': genome,
+            'codon_usage': codon_usage, 'selenogenes': sorted(selenogenes)}
+
+
+# Computing the reference protein and exon sequences of all transcripts of the database of an Ensembl object,
+# returns the number of transcripts written
+def build(ensembl, reference):
+    dbfile = ensembl.options.args['ensembl']
+    fn = proteinDBFileName(dbfile)
+    tmpfn = fn + '.txt'
+    n = 0
+    with open(tmpfn, 'w') as outfile:
+        outfile.write(HEADER + json.dumps(settings(dbfile, reference, ensembl.codon_usage, ensembl.selenogenes)) +
+                      '\n')
+        with gzip.open(dbfile, 'rt') as infile:
+            for line in infile:
+                if line.startswith('#'): continue
+                transcript = core.Transcript(line.rstrip('\n'))
+                if core.convert_chrom(transcript.chrom, reference.fastafile.references) is None: continue
+                if transcript.geneSymbol in ensembl.selenogenes:
+                    transcript.is_selenocysteine = True
+                protein, exonseqs, cds_ref = transcript.getProteinSequence(reference, None, None, ensembl.codon_usage)
+                if protein is None: continue
+                outfile.write('\t'.join([transcript.chrom, str(transcript.transcriptStart), str(transcript.transcriptEnd),
+                                         transcript.TRANSCRIPT, protein, ','.join(exonseqs)]) + '\n')
+                n += 1
+    pysam.tabix_compress(tmpfn, fn, force=True)
+    pysam.tabix_index(fn, seq_col=0, start_col=1, end_col=2, zerobased=True, meta_char='#', force=True)
+    os.remove(tmpfn)
+    return n
+
+
+# Class representing a precomputed sequence file
+class ProteinDB(object):
+    # Constructor
+    def __init__(self, fn):
+        self.filename = fn
+        self.tabixfile = pysam.TabixFile(fn)
+        self.settings = None
+        for line in self.tabixfile.header:
+            if line.startswith(HEADER):
+                self.settings = json.loads(line[len(HEADER):])
+
+    # Reopening the tabix file (file handles must not be shared between forked processes)
+    def reopen(self):
+        self.tabixfile = pysam.TabixFile(self.filename)
+
+    # Reference protein, exon sequences and CDS of a transcript, as returned by
+    # Transcript.getProteinSequence(reference, None, None, codon_usage) (None if the transcript is not in the file)
+    def lookup(self, transcript):
+        if transcript.chrom not in self.tabixfile.contigs:
+            return None
+        for line in self.tabixfile.fetch(transcript.chrom, transcript.transcriptStart, transcript.transcriptStart + 1):
+            cols = line.split('\t')
+            if cols[3] == transcript.TRANSCRIPT and int(cols[1]) == transcript.transcriptStart:
+                protein = cols[4]
+                exonseqs = [core.Sequence(x) for x in cols[5].split(',')]
+                codingsequence = ''.join(exonseqs)[transcript.codingStart - 1:][0:transcript.cds_len]
+                return protein, exonseqs, codingsequence[0:3 * len(protein)]
+        return None
+
+
+# Opening the precomputed sequence file of a transcript database, returns None if there is none or it was computed
+# with other settings
+def openProteinDB(dbfile, reference, codon_usage, selenogenes):
+    fn = proteinDBFileName(dbfile)
+    if not os.path.isfile(fn) or not os.path.isfile(fn + '.tbi'):
+        return None
+    try:
+        proteindb = ProteinDB(fn)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("CAVA: WARNING: cannot read precomputed sequence file " + fn + ": " + str(e) + "\n")
+        return None
+    if not proteindb.settings == settings(dbfile, reference, codon_usage, selenogenes):
+        sys.stderr.write("CAVA: WARNING: precomputed sequence file " + fn + " was made with another database, "
+                         "reference genome or codon table, not used (compute it again with --proteindb)\n")
+        return None
+    return proteindb
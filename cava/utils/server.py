@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+
+# Annotation server: a long-running process keeping the databases loaded and the caches of its annotation processes
+# warm, answering annotation requests of concurrent clients over HTTP (TCP or Unix socket)
+#######################################################################################################################
+
+import http.server
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import stat
+import sys
+import threading
+
+from . import annotator
+from . import pipeline
+
+
+# Maximum size of a request body (bytes)
+MAXREQUEST = 64 * 1024 * 1024
+
+
+# Annotation process of the server: an error annotating a batch is reported for that batch only, and the batch being
+# annotated is published, so that a request can be failed if the process dies
+class ServerWorker(pipeline.StreamWorker):
+    # Process constructor
+    def __init__(self, *args):
+        pipeline.StreamWorker.__init__(self, *args)
+        # Batch being annotated (-2: process starting, -1: waiting for a batch)
+        self.current = multiprocessing.Value('l', -2, lock=False)
+
+    # Annotating a batch of input lines, an error is sent to the results queue with -1 records
+    def processBatch(self, batchidx, lines):
+        self.current.value = batchidx
+        try:
+            pipeline.StreamWorker.processBatch(self, batchidx, lines)
+        except Exception as e:
+            logging.exception('Annotation of a request failed')
+            self.results.put((batchidx, -1, type(e).__name__ + ': ' + str(e)))
+        self.current.value = -1
+
+
+# Class passing batches of input lines of all clients to the annotation processes and returning the annotated lines
+class AnnotationService(object):
+    # Constructor (annot is the Annotator preloaded by the parent, if any)
+    def __init__(self, options, copts, genelist, transcriptlist, snplist, impactdir, annot, numOfWorkers):
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.workerargs = (options, copts, genelist, transcriptlist, snplist, impactdir, self.tasks, self.results,
+                           annot)
+        self.workers = [ServerWorker(i, *self.workerargs) for i in range(1, numOfWorkers + 1)]
+        # Annotated batches waiting to be picked up by the request threads (batch id -> (error, annotated text))
+        self.done = dict()
+        self.condition = threading.Condition()
+        self.nextid = 0
+        # Set if an annotation process cannot start (restarting it would not help)
+        self.failed = False
+        self.stopping = False
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+
+    # Starting the annotation processes
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.dispatcher.start()
+
+    # Stopping the annotation processes
+    def stop(self):
+        self.stopping = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+
+    # Collecting annotated batches from the annotation processes (runs in a thread)
+    # Results are stored as (error, annotated text) pairs, exactly one of them being None
+    def dispatch(self):
+        while not self.failed and not self.stopping:
+            try:
+                (batchid, n, text) = self.results.get(timeout=1)
+                with self.condition:
+                    if n == -1:
+                        self.done[batchid] = (text, None)
+                    else:
+                        self.done[batchid] = (None, text)
+                    self.condition.notify_all()
+            except queue.Empty:
+                pass
+            self.restartWorkers()
+
+    # Replacing annotation processes that died, failing the batch a process was annotating
+    def restartWorkers(self):
+        for i, worker in enumerate(self.workers):
+            if self.stopping:
+                return
+            if worker.exitcode is None or worker.exitcode == 0:
+                continue
+            current = worker.current.value
+            with self.condition:
+                if current == -2:
+                    self.failed = True
+                    logging.error('Annotation process ' + str(worker.workeridx) + ' failed to start (exit code ' +
+                                  str(worker.exitcode) + ').')
+                elif current >= 0:
+                    self.done[current] = ('annotation process died (exit code ' + str(worker.exitcode) + ')', None)
+                self.condition.notify_all()
+            if self.failed:
+                return
+            logging.warning('Annotation process ' + str(worker.workeridx) + ' died (exit code ' +
+                            str(worker.exitcode) + '), restarting it.')
+            self.workers[i] = ServerWorker(worker.workeridx, *self.workerargs)
+            self.workers[i].start()
+
+    # Annotating a list of (stripped, non-header) record lines, returns the annotated lines and the error message
+    # (one of them is None). Long requests are split into batches annotated in parallel
+    def annotate(self, lines):
+        batchids = []
+        with self.condition:
+            for batch in pipeline.readBatches(iter(lines), None, pipeline.BATCHSIZE):
+                batchids.append(self.nextid)
+                self.tasks.put((self.nextid, batch))
+                self.nextid += 1
+        ret = []
+        errors = []
+        with self.condition:
+            for batchid in batchids:
+                while batchid not in self.done and not self.failed:
+                    self.condition.wait()
+                if self.failed:
+                    return None, 'an annotation process failed to start'
+                (error, text) = self.done.pop(batchid)
+                if error is not None:
+                    errors.append(error)
+                else:
+                    ret.append(text)
+        if len(errors) > 0:
+            return None, errors[0]
+        return ''.join(ret), None
+
+
+# Class handling the HTTP requests of the annotation server
+#    POST /annotate  - body: input lines (VCF or TXT, as in the configuration file), response: annotated lines
+#    GET /health     - response: OK
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Unix socket clients have no address
+    def address_string(self):
+        if isinstance(self.client_address, tuple) and len(self.client_address) > 0:
+            return str(self.client_address[0])
+        return 'unix'
+
+    # Logging requests to the log file (if any) instead of standard error
+    def log_message(self, format, *args):
+        logging.info('Request from ' + self.address_string() + ': ' + (format % args))
+
+    # Sending a text response
+    def respond(self, code, text):
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.respond(200, 'OK\n')
+        else:
+            self.respond(404, 'Not found\n')
+
+    def do_POST(self):
+        if not self.path == '/annotate':
+            self.respond(404, 'Not found\n')
+            return
+        # The body is not read if the request is rejected, so the connection cannot be reused
+        if self.headers.get('Content-Length') is None:
+            self.close_connection = True
+            self.respond(411, 'Length required\n')
+            return
+        try:
+            length = int(self.headers.get('Content-Length'))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self.respond(400, 'Error: invalid Content-Length\n')
+            return
+        if length > MAXREQUEST:
+            self.close_connection = True
+            self.respond(413, 'Request too large\n')
+            return
+        try:
+            body = self.rfile.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            self.respond(400, 'Error: request is not valid UTF-8\n')
+            return
+
+        # Parsing and checking input lines (an invalid record would stop the annotation process)
+        lines = []
+        for line in body.split('\n'):
+            line = line.strip()
+            if line == '' or line.startswith('#'): continue
+            error = annotator.checkRecordLine(line, self.server.inputformat)
+            if error is not None:
+                self.respond(400, 'Error: ' + error + '\n')
+                return
+            lines.append(line)
+
+        text, error = self.server.service.annotate(lines)
+        if error is not None:
+            self.respond(500, 'Error: ' + error + '\n')
+            return
+        self.respond(200, text)
+
+
+# HTTP server on a TCP port, handling each client in a thread
+class TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+# HTTP server on a Unix socket, handling each client in a thread
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# Creating the server for an address: a file path (containing '/') or unix:path for a Unix socket, host:port (or
+# port) for TCP; any other address is taken as a socket file in the working directory
+def makeServer(address):
+    if address.startswith('unix:'):
+        address = address[5:]
+    elif '/' not in address and (':' in address or address.isdigit()):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+        else:
+            host, port = 'localhost', address
+        return TCPServer((host, int(port)), RequestHandler)
+    # Only a stale socket is replaced, never a regular file given by mistake
+    if os.path.exists(address):
+        if not stat.S_ISSOCK(os.stat(address).st_mode):
+            raise ValueError(address + ' exists and is not a socket')
+        os.remove(address)
+    return UnixServer(address, RequestHandler)
+
+
+# Running the annotation server until interrupted
+def run(options, copts, genelist, transcriptlist, snplist, impactdir, annot):
+    service = AnnotationService(options, copts, genelist, transcriptlist, snplist, impactdir, annot, copts.threads)
+    try:
+        server = makeServer(copts.serve)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("CAVA: ERROR: cannot start server on " + copts.serve + ": " + str(e) + "\n")
+        sys.exit(1)
+    server.service = service
+    server.inputformat = options.args['inputformat']
+    service.start()
+
+    print('CAVA annotation server listening on ' + copts.serve + ' with ' + str(copts.threads) +
+          ' annotation processes (POST /annotate, GET /health)')
+    sys.stdout.flush()
+    if options.args['logfile']:
+        logging.info('Annotation server listening on ' + copts.serve + '.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if isinstance(server, UnixServer) and os.path.exists(server.server_address):
+            os.remove(server.server_address)
+    if options.args['logfile']:
+        logging.info('Annotation server stopped.')